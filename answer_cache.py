@@ -0,0 +1,68 @@
+"""
+Natural-Language Answer Cache
+Caches /ask responses per (dataset_id, normalized question) so repeated
+questions skip the LLM round trip and SQL execution entirely
+"""
+import re
+from typing import Optional
+
+from cache import LRUCache
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.;]+$")
+# Quoted literals ('Bob', "New York"); an apostrophe inside a word ("what's") does not open one
+_QUOTED = re.compile(r"""((?<!\w)'[^']*'|(?<!\w)"[^"]*")""")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question used as cache key
+
+    Lowercases, collapses whitespace and drops trailing punctuation so
+    "Total sales?" and "total  sales" hit the same entry. Quoted literals
+    are kept verbatim: filters on 'Bob' and 'bob' may match different rows.
+    """
+    parts = _QUOTED.split(question.strip())
+    normalized = "".join(
+        part if index % 2 else _WHITESPACE.sub(" ", part.lower())
+        for index, part in enumerate(parts)
+    )
+    return _TRAILING_PUNCTUATION.sub("", normalized)
+
+
+class AnswerCache:
+    """
+    TTL + LRU bounded cache of /ask responses
+
+    Args:
+        maxsize: Maximum number of cached answers (0 disables the cache)
+        ttl: Seconds an answer stays valid
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.enabled = maxsize > 0
+        self._cache = LRUCache(maxsize=max(maxsize, 1), ttl=ttl)
+
+    def get(self, dataset_id: str, question: str, variant: str = "text") -> Optional[dict]:
+        """
+        Return a copy of the cached response, or None on miss
+
+        variant separates response shapes for the same question
+        (e.g. the text answer vs. a page of structured rows).
+        """
+        if not self.enabled:
+            return None
+        cached = self._cache.get((dataset_id, variant, normalize_question(question)))
+        return dict(cached) if cached is not None else None
+
+    def set(self, dataset_id: str, question: str, response: dict, variant: str = "text") -> None:
+        """Store a response (question-specific fields are kept as-is)"""
+        if self.enabled:
+            self._cache.set((dataset_id, variant, normalize_question(question)), dict(response))
+
+    def invalidate_dataset(self, dataset_id: str) -> int:
+        """Drop every cached answer for a dataset, returning the number removed"""
+        return self._cache.pop_where(lambda key: key[0] == dataset_id)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self._cache.stats()}
@@ -1,28 +1,54 @@
 """
 Supabase JWT Authentication Middleware
-Replaces custom JWT/OAuth logic with Supabase token verification
+Replaces custom JWT/OAuth logic with Supabase token verification.
+HS256 tokens are checked with the shared SUPABASE_JWT_SECRET; RS256/ES256
+tokens against the project's JWKS, kept in memory by kid (see jwks.py).
+Verified tokens are cached (by SHA-256 digest) until they expire, so a
+client reusing its bearer token skips signature and claim verification.
 Reference: https://supabase.com/docs/guides/auth/server-side/verifying-jwts
 """
+import hashlib
 import os
+import time
 import jwt
 from typing import Optional
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from dotenv import load_dotenv
 from pydantic import BaseModel
 
-load_dotenv()
+from cache import LRUCache
+from jwks import ASYMMETRIC_ALGORITHMS, JWKSKeyStore
+# JWT settings are read and validated in supabase_config.py
+from supabase_config import SUPABASE_JWKS_FILE, SUPABASE_JWKS_URL, SUPABASE_JWT_SECRET
+from timing import stage
 
-# Supabase JWT configuration
-SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
+# Asymmetric signing keys: fetched from the JWKS URL (empty string disables
+# fetching) and/or read from a local file, which is also kept up to date
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+
+if SUPABASE_JWKS_URL or SUPABASE_JWKS_FILE:
+    jwks_store = JWKSKeyStore(
+        url=SUPABASE_JWKS_URL or None,
+        cache_file=SUPABASE_JWKS_FILE,
+        refresh_seconds=JWKS_REFRESH_SECONDS
+    )
+else:
+    jwks_store = None
 
-if not SUPABASE_JWT_SECRET:
-    raise ValueError("SUPABASE_JWT_SECRET must be set in environment variables")
+
+def start_jwks_refresh() -> None:
+    """Load the cached JWKS and start refreshing it in the background (call at app startup)"""
+    if jwks_store is not None:
+        jwks_store.start(fetch_in_background=True)
 
 # Security scheme for extracting Bearer token
 security = HTTPBearer()
 
+# Verified tokens -> AuthUser, each kept until its exp claim (0 disables the cache)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_MAX_TTL_SECONDS", "3600"))
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE) if TOKEN_CACHE_SIZE > 0 else None
+
 # Pydantic models for user data
 class AuthUser(BaseModel):
     """Authenticated user extracted from Supabase JWT"""
@@ -35,9 +61,35 @@ class AuthUser(BaseModel):
         frozen = True
 
 
+def resolve_signing_key(token: str) -> tuple:
+    """
+    Key and algorithm a token must be verified with, chosen from its header
+    
+    The algorithm is pinned by the key (never taken from the token alone):
+    HS256 uses the shared secret, RS256/ES256 the JWKS key with the token's kid.
+    
+    Raises:
+        jwt.InvalidTokenError: If no key is configured for the token
+    """
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        if jwks_store is None:
+            raise jwt.InvalidTokenError("Asymmetric tokens are not accepted (no JWKS configured)")
+        key = jwks_store.get_key(header.get("kid"))
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        if key.algorithm_name != algorithm:
+            raise jwt.InvalidAlgorithmError("Token algorithm does not match its signing key")
+        return key.key, algorithm
+    if algorithm == "HS256" and SUPABASE_JWT_SECRET:
+        return SUPABASE_JWT_SECRET, algorithm
+    raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+
+
 def decode_token(token: str) -> dict:
     """
-    Decode JWT token using Supabase secret
+    Decode JWT token using the Supabase secret or JWKS key it was signed with
     
     Args:
         token: JWT token string
@@ -48,10 +100,11 @@ def decode_token(token: str) -> dict:
     Raises:
         jwt exceptions for various token errors
     """
+    key, algorithm = resolve_signing_key(token)
     return jwt.decode(
         token,
-        SUPABASE_JWT_SECRET,
-        algorithms=["HS256"],
+        key,
+        algorithms=[algorithm],
         audience="authenticated",
         options={
             "verify_signature": True,
@@ -154,6 +207,44 @@ def verify_supabase_jwt(token: str) -> dict:
         )
 
 
+def authenticate_token(token: str) -> AuthUser:
+    """
+    Verify a token and build its AuthUser, reusing an earlier verification
+    of the same token while it has not expired
+    
+    Only successful verifications are cached, and each entry is evicted at
+    the token's exp claim (capped at TOKEN_CACHE_MAX_TTL_SECONDS), so an
+    expired token is never accepted from the cache.
+    
+    Raises:
+        HTTPException: If the token is invalid, expired, or malformed
+    """
+    if token_cache is None:
+        return AuthUser(**build_user_object(verify_supabase_jwt(token)))
+    
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    user = token_cache.get(key)
+    if user is not None:
+        return user
+    
+    payload = verify_supabase_jwt(token)
+    user = AuthUser(**build_user_object(payload))
+    lifetime = TOKEN_CACHE_MAX_TTL_SECONDS
+    if "exp" in payload:
+        lifetime = min(lifetime, float(payload["exp"]) - time.time())
+    if lifetime > 0:
+        token_cache.set(key, user, ttl=lifetime)
+    return user
+
+
+def token_cache_stats() -> dict:
+    """Hit/miss counters of the verified-token cache (and JWKS state)"""
+    stats = token_cache.stats() if token_cache is not None else {"enabled": False}
+    if jwks_store is not None:
+        stats["jwks"] = jwks_store.stats()
+    return stats
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Security(security)
 ) -> AuthUser:
@@ -174,12 +265,8 @@ async def get_current_user(
     Raises:
         HTTPException: If authentication fails
     """
-    token = credentials.credentials
-    payload = verify_supabase_jwt(token)
-    user_data = build_user_object(payload)
-    
-    # Build AuthUser from extracted data
-    return AuthUser(**user_data)
+    with stage("auth"):
+        return authenticate_token(credentials.credentials)
 
 
 def get_user_id_from_token(token: str) -> str:
@@ -0,0 +1,485 @@
+"""
+Offline Benchmarks
+Measures /upload ingest and /ask latency and throughput of the FastAPI app in
+main.py with local stand-ins for its external services, so performance can
+be compared between commits without Groq, Supabase or a remote database.
+
+- ChatGroq is replaced by FakeSQLModel, which answers the benchmark questions
+  with fixed SQL after a configurable delay
+- the supabase client is replaced by FakeSupabase, an in-memory stand-in for
+  the table and storage calls the app makes (with optional per-call latency)
+- db_engine points at a temporary SQLite file, or at --database-url (e.g. a
+  local PostgreSQL)
+
+The time to import main (what every worker start pays) is measured first,
+in fresh interpreters; --import-budget-ms makes the run fail when it is over
+budget.
+
+Requests go through the real ASGI app, authentication included (tokens are
+signed with a benchmark secret), in-process via httpx. Application settings
+(cache sizes, LOCAL_ENGINE_ENABLED, ...) are read from the environment as
+usual; the answer and semantic caches default to off so /ask exercises the
+LLM and SQL path on every request.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --upload-rows 10000,100000 --ask-concurrency 1,8,32 \\
+        --llm-latency-ms 300 --database-url postgresql://localhost/bench --json results.json
+    python benchmark.py --upload-rows "" --ask-concurrency "" --import-budget-ms 1500
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import uuid
+from typing import Any, Dict, List, Optional
+
+import jwt
+import numpy as np
+import pandas as pd
+from langchain_core.language_models.llms import LLM
+
+BENCHMARK_USER_ID = "00000000-0000-4000-8000-00000000b0b0"
+BENCHMARK_JWT_SECRET = "offline-benchmark-secret"
+
+# Benchmark questions and the SQL the fake model answers them with
+BENCHMARK_QUERIES = {
+    "What are the total units sold per region?":
+        "SELECT region, SUM(units) AS total_units FROM {table} GROUP BY region ORDER BY total_units DESC",
+    "What is the average price of each product?":
+        "SELECT product, AVG(price) AS average_price FROM {table} GROUP BY product ORDER BY product",
+    "How many orders have a price above 50?":
+        "SELECT COUNT(*) FROM {table} WHERE price > 50",
+    "Which region and product combinations bring in the most revenue?":
+        "SELECT region, product, SUM(units * price) AS revenue FROM {table} "
+        "GROUP BY region, product ORDER BY revenue DESC LIMIT 10",
+    "Show the latest orders from the north region":
+        "SELECT order_id, product, units, price, order_date FROM {table} "
+        "WHERE region = 'north' ORDER BY order_date DESC LIMIT 20",
+}
+
+REGIONS = ["north", "south", "east", "west", "central"]
+PRODUCTS = ["widget", "gadget", "gizmo", "doohickey", "sprocket", "flange", "bracket", "valve"]
+
+
+# ============ STAND-INS ============
+
+class FakeSQLModel(LLM):
+    """
+    Deterministic stand-in for ChatGroq: returns the SQL of the benchmark
+    question found in the prompt (a COUNT(*) for unknown questions)
+    """
+    latency: float = 0.0
+    queries: Dict[str, str] = BENCHMARK_QUERIES
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-sql"
+
+    def _answer(self, prompt: str) -> str:
+        # main.ask_database phrases the input as "Table name is X. ... Question: Q"
+        matches = re.findall(r"Table name is (\w+)\..*?Question: (.*?)\nSQLQuery:", prompt, re.DOTALL)
+        table, question = matches[-1] if matches else ("unknown_table", "")
+        sql = self.queries.get(question.strip(), "SELECT COUNT(*) FROM {table}")
+        return sql.format(table=table)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+
+def _like(value: Any, pattern: str) -> bool:
+    regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return isinstance(value, str) and re.fullmatch(regex, value) is not None
+
+
+class FakeQuery:
+    """PostgREST query builder subset used by the app, over in-memory rows"""
+
+    def __init__(self, backend: "FakeSupabase", table: str):
+        self.backend = backend
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.payload = None
+        self.filters = []
+        self.ordering = None
+        self.row_limit = None
+
+    def select(self, columns: str = "*", **kwargs):
+        self.columns = columns
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.operation, self.payload = "upsert", payload
+        return self
+
+    def update(self, payload):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lt(self, column: str, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def in_(self, column: str, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def or_(self, conditions: str):
+        tests = []
+        for condition in conditions.split(","):
+            column, operator, value = condition.split(".", 2)
+            if operator == "eq":
+                tests.append(lambda row, c=column, v=value: str(row.get(c)) == v)
+            elif operator == "like":
+                tests.append(lambda row, c=column, v=value: _like(row.get(c), v))
+        self.filters.append(lambda row: any(test(row) for test in tests))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.row_limit = count
+        return self
+
+    def _project(self, row: dict) -> dict:
+        if self.columns.strip() == "*":
+            return dict(row)
+        return {name.strip(): row.get(name.strip()) for name in self.columns.split(",")}
+
+    def execute(self):
+        self.backend.round_trip()
+        with self.backend.lock:
+            rows = self.backend.tables.setdefault(self.table, [])
+            if self.operation in ("insert", "upsert"):
+                data = []
+                for row in self.payload if isinstance(self.payload, list) else [self.payload]:
+                    row = {"id": str(uuid.uuid4()), "created_at": self.backend.now(), **row}
+                    if self.operation == "upsert":
+                        rows[:] = [existing for existing in rows if existing.get("id") != row["id"]]
+                    rows.append(row)
+                    data.append(dict(row))
+                return types.SimpleNamespace(data=data)
+
+            matched = [row for row in rows if all(test(row) for test in self.filters)]
+            if self.operation == "update":
+                for row in matched:
+                    row.update(self.payload)
+            elif self.operation == "delete":
+                self.backend.tables[self.table] = [row for row in rows if not any(row is m for m in matched)]
+            if self.ordering:
+                column, desc = self.ordering
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column) or ""), reverse=desc)
+            if self.row_limit is not None:
+                matched = matched[:self.row_limit]
+            return types.SimpleNamespace(data=[self._project(row) for row in matched])
+
+
+class FakeBucket:
+    def __init__(self, backend: "FakeSupabase"):
+        self.backend = backend
+
+    def upload(self, path: str, file, file_options: Optional[dict] = None):
+        self.backend.round_trip()
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                data = f.read()
+        elif hasattr(file, "read"):
+            data = file.read()
+        else:
+            data = bytes(file)
+        with self.backend.lock:
+            self.backend.objects[path] = data
+        return types.SimpleNamespace(path=path)
+
+    def download(self, path: str) -> bytes:
+        self.backend.round_trip()
+        with self.backend.lock:
+            if path not in self.backend.objects:
+                raise FileNotFoundError(path)
+            return self.backend.objects[path]
+
+    def remove(self, paths: List[str]):
+        self.backend.round_trip()
+        with self.backend.lock:
+            for path in paths:
+                self.backend.objects.pop(path, None)
+        return []
+
+
+class FakeSupabase:
+    """
+    In-memory stand-in for the supabase client (tables and storage)
+
+    Args:
+        latency: Seconds every call sleeps, standing in for the HTTPS round trip
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.objects = {}
+        self.calls = 0
+        self.storage = types.SimpleNamespace(from_=lambda bucket: FakeBucket(self))
+
+    def get_client(self):
+        return self
+
+    def round_trip(self) -> None:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def now() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+
+# ============ WORKLOAD ============
+
+def make_csv(rows: int, seed: int) -> bytes:
+    """Synthetic orders CSV (seeded, so every run sees the same data)"""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "order_id": np.arange(1, rows + 1),
+        "region": rng.choice(REGIONS, rows),
+        "product": rng.choice(PRODUCTS, rows),
+        "units": rng.integers(1, 100, rows),
+        "price": np.round(rng.uniform(1, 100, rows), 2),
+        "order_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+    })
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, date_format="%Y-%m-%d")
+    return buffer.getvalue().encode()
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> dict:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2) if latencies else 0.0,
+        "throughput_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def auth_headers() -> dict:
+    token = jwt.encode({
+        "sub": BENCHMARK_USER_ID,
+        "email": "benchmark@example.com",
+        "role": "authenticated",
+        "aud": "authenticated",
+        "exp": int(time.time()) + 24 * 3600,
+    }, BENCHMARK_JWT_SECRET, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def upload_csv(client, headers: dict, data: bytes) -> dict:
+    response = await client.post("/upload", headers=headers, files={"file": ("orders.csv", data, "text/csv")})
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed ({response.status_code}): {response.text[:300]}")
+    return response.json()
+
+
+async def bench_upload(client, headers: dict, rows: int, repeats: int) -> dict:
+    """Upload `repeats` distinct CSVs of `rows` rows one at a time"""
+    latencies = []
+    size = 0
+    started = time.perf_counter()
+    for repeat in range(repeats):
+        data = make_csv(rows, seed=rows * 1000 + repeat)
+        size = len(data)
+        t0 = time.perf_counter()
+        result = await upload_csv(client, headers, data)
+        latencies.append(time.perf_counter() - t0)
+        await client.delete(f"/datasets/{result['dataset_id']}", headers=headers)
+    summary = summarize(latencies, time.perf_counter() - started, 0)
+    summary.update(
+        rows=rows,
+        csv_bytes=size,
+        rows_per_sec=round(rows / float(np.median(latencies))),
+        mb_per_sec=round(size / float(np.median(latencies)) / 1e6, 2),
+    )
+    return summary
+
+
+async def bench_ask(client, headers: dict, dataset_id: str, concurrency: int, requests: int) -> dict:
+    """Send `requests` /ask calls from `concurrency` concurrent clients"""
+    questions = list(BENCHMARK_QUERIES)
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            response = await client.post("/ask", headers=headers, json={
+                "question": questions[i % len(questions)], "dataset_id": dataset_id
+            })
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = summarize(latencies, time.perf_counter() - started, errors)
+    summary["concurrency"] = concurrency
+    return summary
+
+
+# ============ RUNNER ============
+
+def benchmark_env(args, workdir: str) -> Dict[str, str]:
+    """Stand-in credentials main needs to import"""
+    return {
+        "GROQ_API_KEY": "offline-benchmark",
+        "SUPABASE_URL": "http://supabase.invalid",
+        "SUPABASE_SERVICE_ROLE_KEY": jwt.encode({"role": "service_role"}, "offline-benchmark"),
+        "SUPABASE_JWT_SECRET": BENCHMARK_JWT_SECRET,
+        "SUPABASE_JWKS_URL": "",
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+    }
+
+
+def measure_import_seconds(env: Dict[str, str], runs: int = 3) -> float:
+    """Fastest of runs imports of main, each in a fresh interpreter"""
+    script = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", script], cwd=app_dir, env={**os.environ, **env},
+            capture_output=True, text=True, check=True
+        )
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def load_app(args, workdir: str):
+    """Import main with stand-in credentials and swap in the fakes"""
+    os.environ.update(benchmark_env(args, workdir))
+    os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    os.environ.setdefault("INDEX_ADVISOR_ENABLED", "false")
+    os.environ.setdefault("LOCAL_ENGINE_CACHE_DIR", os.path.join(workdir, "snapshots"))
+
+    import main
+    main.supabase = FakeSupabase(latency=args.supabase_latency_ms / 1000)
+    main._llm = FakeSQLModel(latency=args.llm_latency_ms / 1000)
+    return main
+
+
+async def run(args, workdir: str) -> dict:
+    import httpx
+
+    import_seconds = measure_import_seconds(benchmark_env(args, workdir))
+    print(f"import main {import_seconds * 1000:.0f}ms")
+    main = load_app(args, workdir)
+    headers = auth_headers()
+    results = {
+        "database": main.db_engine.dialect.name, "import_ms": round(import_seconds * 1000, 1),
+        "upload": [], "ask": []
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for rows in args.upload_rows:
+                result = await bench_upload(client, headers, rows, args.upload_repeats)
+                results["upload"].append(result)
+                print(f"upload rows={rows:<9} n={result['requests']:<3} p50={result['p50_ms']:.1f}ms "
+                      f"p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+                      f"{result['rows_per_sec']} rows/s {result['mb_per_sec']} MB/s")
+
+            if args.ask_concurrency:
+                dataset = await upload_csv(client, headers, make_csv(args.ask_rows, seed=1))
+                await bench_ask(client, headers, dataset["dataset_id"], 1, len(BENCHMARK_QUERIES))  # warm-up
+                for concurrency in args.ask_concurrency:
+                    result = await bench_ask(client, headers, dataset["dataset_id"], concurrency, args.ask_requests)
+                    results["ask"].append(result)
+                    print(f"ask concurrency={concurrency:<4} n={result['requests']:<5} "
+                          f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+                          f"{result['throughput_per_sec']} req/s errors={result['errors']}")
+                await client.delete(f"/datasets/{dataset['dataset_id']}", headers=headers)
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline /upload and /ask benchmarks")
+    parser.add_argument("--upload-rows", type=_int_list, default=[1000, 10000, 100000],
+                        help="Comma-separated CSV sizes (rows) to upload")
+    parser.add_argument("--upload-repeats", type=int, default=3, help="Uploads per size")
+    parser.add_argument("--ask-rows", type=int, default=20000, help="Rows of the dataset /ask queries")
+    parser.add_argument("--ask-concurrency", type=_int_list, default=[1, 8, 32],
+                        help="Comma-separated numbers of concurrent /ask clients")
+    parser.add_argument("--ask-requests", type=int, default=200, help="/ask requests per concurrency level")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Delay of each fake LLM call")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0, help="Delay of each fake Supabase call")
+    parser.add_argument("--database-url", default=None, help="Database for dataset tables (default: temporary SQLite)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    parser.add_argument("--import-budget-ms", type=float, default=None,
+                        help="Exit with status 1 when importing main takes longer than this")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        results = asyncio.run(run(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results["settings"] = {
+        "llm_latency_ms": args.llm_latency_ms,
+        "supabase_latency_ms": args.supabase_latency_ms,
+        "python": sys.version.split()[0],
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.import_budget_ms is not None and results["import_ms"] > args.import_budget_ms:
+        print(f"import main took {results['import_ms']:.0f}ms, over the {args.import_budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
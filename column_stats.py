@@ -0,0 +1,264 @@
+"""
+Column Statistics
+Per-column profile computed while a dataset is ingested: counts, nulls,
+min/max, sum/mean, a distinct-count estimate, top values and a histogram.
+
+Statistics are accumulated chunk by chunk with mergeable sketches (a
+k-minimum-values sketch for distinct counts, candidate counts for top values
+and a priority sample for histograms), so they cost one vectorized pass over
+data that is already in memory during the upload. The profile backs
+/datasets/{id}/profile, enriches the LLM prompt and answers simple aggregate
+questions without touching the data table.
+"""
+import datetime
+import re
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from answer_cache import normalize_question
+
+TOP_K = 10
+# Values tracked per column while merging chunks (more than reported, so
+# values that are frequent overall but not in every chunk survive)
+TOP_K_CANDIDATES = 100
+# k of the k-minimum-values sketch: exact below k distinct values, ~3% error above
+DISTINCT_SKETCH_SIZE = 1024
+HISTOGRAM_BINS = 10
+HISTOGRAM_SAMPLE_SIZE = 10_000
+
+STATS_VERSION = 1
+
+NUMERIC_KINDS = {"smallint", "integer", "bigint", "float"}
+TEMPORAL_KINDS = {"date", "timestamp"}
+# Kinds whose most frequent values are worth reporting
+TOP_VALUE_KINDS = {"text", "boolean", "smallint", "integer", "bigint", "date", "numeric"}
+
+_HASH_SPACE = float(2 ** 64)
+
+
+def _plain(value):
+    """numpy/pandas scalar -> JSON-compatible Python value"""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class _ColumnState:
+    def __init__(self, name: str):
+        self.name = name
+        self.kind = "null"
+        self.count = 0
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.top = {}
+        self.sample = np.empty(0, dtype=np.float64)
+        self.sample_keys = np.empty(0, dtype=np.float64)
+
+    def update(self, series: pd.Series, rng: np.random.Generator) -> None:
+        if self.kind not in NUMERIC_KINDS and self.kind not in TEMPORAL_KINDS:
+            # Widened to a kind without ranges (e.g. text): drop what earlier chunks collected
+            self.min = self.max = None
+            self.sample = self.sample_keys = np.empty(0, dtype=np.float64)
+        if self.kind not in NUMERIC_KINDS:
+            self.sum = 0
+        values = series.dropna()
+        self.null_count += len(series) - len(values)
+        self.count += len(values)
+        if values.empty:
+            return
+
+        if self.kind in NUMERIC_KINDS or self.kind in TEMPORAL_KINDS:
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            self._sample(values, rng)
+        if self.kind in NUMERIC_KINDS:
+            total = values.sum()
+            self.sum += int(total) if self.kind != "float" else float(total)
+
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        self.hashes = np.unique(np.concatenate([self.hashes, hashes]))[:DISTINCT_SKETCH_SIZE]
+
+        if self.kind in TOP_VALUE_KINDS:
+            for value, count in values.value_counts().head(TOP_K_CANDIDATES).items():
+                key = _plain(value)
+                self.top[key] = self.top.get(key, 0) + int(count)
+            if len(self.top) > TOP_K_CANDIDATES:
+                kept = sorted(self.top.items(), key=lambda item: -item[1])[:TOP_K_CANDIDATES]
+                self.top = dict(kept)
+
+    def _sample(self, values: pd.Series, rng: np.random.Generator) -> None:
+        # Priority sampling: keep the values with the smallest random keys,
+        # which is a uniform sample of everything seen so far
+        if self.kind in TEMPORAL_KINDS:
+            numbers = pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+        else:
+            numbers = values.to_numpy(dtype=np.float64)
+        keys = rng.random(len(numbers))
+        sample = np.concatenate([self.sample, numbers])
+        sample_keys = np.concatenate([self.sample_keys, keys])
+        if len(sample) > HISTOGRAM_SAMPLE_SIZE:
+            keep = np.argpartition(sample_keys, HISTOGRAM_SAMPLE_SIZE)[:HISTOGRAM_SAMPLE_SIZE]
+            sample, sample_keys = sample[keep], sample_keys[keep]
+        self.sample, self.sample_keys = sample, sample_keys
+
+    def distinct(self) -> tuple:
+        if len(self.hashes) < DISTINCT_SKETCH_SIZE:
+            return len(self.hashes), True
+        kth = float(self.hashes[DISTINCT_SKETCH_SIZE - 1]) / _HASH_SPACE
+        return int(round((DISTINCT_SKETCH_SIZE - 1) / kth)), False
+
+    def histogram(self) -> Optional[dict]:
+        if not len(self.sample):
+            return None
+        counts, edges = np.histogram(self.sample, bins=HISTOGRAM_BINS)
+        counts = np.round(counts * (self.count / len(self.sample))).astype(int)
+        if self.kind in TEMPORAL_KINDS:
+            edges = [pd.Timestamp(int(edge)).isoformat() for edge in edges]
+        else:
+            edges = [round(float(edge), 6) for edge in edges]
+        return {"edges": edges, "counts": counts.tolist(), "sampled": len(self.sample) < self.count}
+
+    def to_dict(self, row_count: int) -> dict:
+        distinct, exact = self.distinct()
+        column = {
+            "name": self.name,
+            "type": self.kind,
+            "count": self.count,
+            "null_count": self.null_count,
+            "null_fraction": round(self.null_count / row_count, 4) if row_count else 0.0,
+            "distinct": distinct,
+            "distinct_exact": exact,
+        }
+        if self.min is not None:
+            column["min"] = _plain(self.min)
+            column["max"] = _plain(self.max)
+        if self.kind in NUMERIC_KINDS and self.count:
+            column["sum"] = self.sum
+            column["mean"] = self.sum / self.count
+        if self.top and max(self.top.values()) > 1:  # all-unique values aren't worth listing
+            top = sorted(self.top.items(), key=lambda item: -item[1])[:TOP_K]
+            column["top_values"] = [{"value": value, "count": count} for value, count in top]
+        histogram = self.histogram()
+        if histogram:
+            column["histogram"] = histogram
+        return column
+
+
+class ColumnStatsBuilder:
+    """
+    Accumulates column statistics over the chunks of one dataset
+
+    Call update() with each chunk after it has been coerced to the table's
+    column kinds, then to_dict() once the last chunk is loaded.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.row_count = 0
+        self._columns: Optional[List[_ColumnState]] = None
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk: pd.DataFrame, names: List[str], kinds: List[str]) -> None:
+        if self._columns is None:
+            self._columns = [_ColumnState(name) for name in names]
+        for position, state in enumerate(self._columns):
+            state.kind = kinds[position]
+            state.update(chunk.iloc[:, position], self._rng)
+        self.row_count += len(chunk)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": STATS_VERSION,
+            "row_count": self.row_count,
+            "columns": [state.to_dict(self.row_count) for state in self._columns or []],
+        }
+
+
+# ============ ANSWERS FROM STATISTICS ============
+
+AGGREGATE_WORDS = {
+    "max": ("max", "maximum", "highest", "largest", "biggest", "latest"),
+    "min": ("min", "minimum", "lowest", "smallest", "earliest"),
+    "avg": ("average", "avg", "mean"),
+    "sum": ("total", "sum"),
+    "distinct": ("number of distinct", "number of unique", "count of distinct",
+                 "count of unique", "how many distinct", "how many unique"),
+}
+_AGGREGATE_SQL = {"max": "MAX({})", "min": "MIN({})", "avg": "AVG({})", "sum": "SUM({})",
+                  "distinct": "COUNT(DISTINCT {})"}
+
+_LEAD = r"(?:what(?:'s| is| are| was)?|show(?: me)?|give me|get|find|tell me)?\s*(?:the\s+)?"
+_AGGREGATE_QUESTION = re.compile(
+    _LEAD
+    + r"(?P<aggregate>" + "|".join(
+        re.escape(word) for words in AGGREGATE_WORDS.values() for word in sorted(words, key=len, reverse=True)
+    ) + r")"
+    + r"\s+(?:value\s+)?(?:of\s+|for\s+|in\s+)?(?:the\s+)?(?:values?\s+(?:of|in)\s+)?"
+    + r"(?P<column>[a-z0-9_ ]+?)(?:\s+(?:column|values?))?"
+)
+_ROW_COUNT_QUESTION = re.compile(
+    r"(?:how many|count(?: of)?|(?:the |total )?number of)\s+(?:rows|records|entries)"
+    r"(?:\s+(?:are there|(?:are )?in (?:the |this )?(?:dataset|table|data)))?"
+)
+
+
+def _quote_identifier(name: str) -> str:
+    """Double-quote a table/column name (PostgreSQL would fold "Price" to price)"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _aggregate_for(word: str) -> str:
+    return next(name for name, words in AGGREGATE_WORDS.items() if word in words)
+
+
+def answer_from_stats(question: str, stats: dict, table_name: str) -> Optional[dict]:
+    """
+    Answer a simple aggregate question ("what's the max price", "how many rows")
+    from precomputed statistics
+
+    Only exact statistics are used: min, max, sum, mean, row count and
+    distinct counts below the sketch size.
+
+    Returns:
+        {"answer": result in SQLDatabase.run() format, "sql": equivalent SQL},
+        or None if the question isn't one of these simple forms
+    """
+    if not stats:
+        return None
+    normalized = normalize_question(question)
+
+    if _ROW_COUNT_QUESTION.fullmatch(normalized):
+        return {"answer": str([(stats["row_count"],)]), "sql": f"SELECT COUNT(*) FROM {_quote_identifier(table_name)}"}
+
+    match = _AGGREGATE_QUESTION.fullmatch(normalized)
+    if not match:
+        return None
+    wanted = match.group("column").strip().replace(" ", "_")
+    column = next((col for col in stats["columns"] if col["name"].lower() == wanted), None)
+    if column is None:
+        return None
+
+    aggregate = _aggregate_for(match.group("aggregate"))
+    if aggregate == "distinct":
+        if not column["distinct_exact"]:
+            return None
+        value = column["distinct"]
+    else:
+        key = {"max": "max", "min": "min", "avg": "mean", "sum": "sum"}[aggregate]
+        if key not in column:
+            return None
+        value = column[key]
+    return {
+        "answer": str([(value,)]),
+        "sql": f"SELECT {_AGGREGATE_SQL[aggregate].format(_quote_identifier(column['name']))} "
+               f"FROM {_quote_identifier(table_name)}",
+    }
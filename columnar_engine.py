@@ -0,0 +1,295 @@
+"""
+Local Columnar Query Engine
+Runs tenant-scoped SELECTs in an in-process DuckDB over a Parquet snapshot of
+the dataset table (see parquet_snapshot.py) instead of sending them to the
+remote PostgreSQL database through the pooler.
+
+Snapshots are kept in a local directory capped by total size and evicted
+least recently used first; a snapshot that is not on disk is fetched (from
+Supabase Storage) on first use. SQL is transpiled from PostgreSQL to DuckDB
+with sqlglot, with PostgreSQL integer division semantics. Anything the
+engine cannot run raises LocalEngineError, so callers fall back to
+PostgreSQL; the same row/byte budget and statement timeout apply.
+
+DuckDB runs with external access disabled and its configuration locked, so
+SQL can't read files (read_parquet, read_csv, glob, COPY, ATTACH, ...) or
+turn access back on; the snapshot is handed to it as an Arrow dataset.
+Reference: https://duckdb.org/docs/data/parquet/overview
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import sqlglot
+from sqlglot.errors import SqlglotError
+
+from cache import LRUCache
+from parquet_snapshot import snapshots_available
+from query_results import (
+    DEFAULT_PAGE_SIZE, FETCH_BATCH_ROWS, MAX_PAGE_SIZE, QUERY_MAX_RESULT_BYTES,
+    QUERY_MAX_ROWS, QUERY_STATEMENT_TIMEOUT_MS, QueryTimeoutError,
+    build_page, collect_rows, limited_sql, paged_sql
+)
+
+try:
+    import duckdb
+    import pyarrow.dataset as pa_dataset
+except ImportError:  # Optional dependency: queries stay on PostgreSQL without duckdb
+    duckdb = None
+
+SNAPSHOT_SUFFIX = ".parquet"
+
+# Concurrent fetches of different snapshots only contend if they hash to the same lock
+_FETCH_LOCK_STRIPES = 64
+
+
+def local_engine_available() -> bool:
+    return duckdb is not None and snapshots_available()
+
+
+class LocalEngineError(Exception):
+    """Raised when a query cannot run on the local engine (callers fall back to PostgreSQL)"""
+
+
+class SnapshotCache:
+    """
+    Parquet snapshots on local disk, evicted least recently used first once
+    their total size exceeds max_bytes
+
+    Files already in the directory (e.g. from before a restart) are adopted,
+    oldest first.
+
+    Args:
+        directory: Cache directory (created if missing)
+        max_bytes: Size cap for all snapshots together
+        fetch: Called as fetch(source, destination_path) to download a missing snapshot
+        miss_ttl: Seconds a failed fetch is remembered, so datasets without a
+                  snapshot don't trigger a download on every query
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        fetch: Optional[Callable[[str, str], None]] = None,
+        miss_ttl: float = 300
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._fetch_locks = [threading.Lock() for _ in range(_FETCH_LOCK_STRIPES)]
+        self._files = OrderedDict()  # key -> size in bytes, least recently used first
+        self._bytes = 0
+        self._missing = LRUCache(maxsize=4096, ttl=miss_ttl)
+        self.hits = self.misses = self.evictions = 0
+
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(SNAPSHOT_SUFFIX)]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self._files[entry.name[:-len(SNAPSHOT_SUFFIX)]] = entry.stat().st_size
+            self._bytes += entry.stat().st_size
+        with self._lock:
+            self._evict()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key + SNAPSHOT_SUFFIX)
+
+    def staging_path(self, key: str) -> str:
+        """Where to write a new snapshot before put() (same filesystem as the cache)"""
+        return self.path_for(key) + ".new"
+
+    def get(self, key: str, source: Optional[str] = None) -> Optional[str]:
+        """
+        Path of the cached snapshot for key, fetching it from source on a miss
+
+        Returns:
+            The snapshot path, or None if it is not cached and could not be fetched
+        """
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+                self.hits += 1
+                return self.path_for(key)
+            self.misses += 1
+        if source is None or self.fetch is None or self._missing.get(key):
+            return None
+
+        with self._fetch_locks[hash(key) % _FETCH_LOCK_STRIPES]:
+            with self._lock:
+                if key in self._files:  # fetched by another thread meanwhile
+                    self._files.move_to_end(key)
+                    return self.path_for(key)
+            download_path = self.path_for(key) + ".download"
+            try:
+                self.fetch(source, download_path)
+            except Exception as e:
+                print(f"[WARNING] Could not fetch snapshot {source}: {str(e)}")
+                self._missing.set(key, True)
+                if os.path.exists(download_path):
+                    os.unlink(download_path)
+                return None
+            return self.put(key, download_path)
+
+    def put(self, key: str, source_path: str) -> str:
+        """Move a finished snapshot file into the cache and return its cached path"""
+        path = self.path_for(key)
+        os.replace(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._bytes += size - self._files.pop(key, 0)
+            self._files[key] = size
+            self._missing.pop(key)
+            self._evict()
+        return path
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._bytes -= self._files.pop(key, 0)
+            self._missing.pop(key)
+        for path in (self.path_for(key), self.staging_path(key)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _evict(self) -> None:
+        # Caller holds self._lock; the most recently used snapshot is always kept
+        while self._bytes > self.max_bytes and len(self._files) > 1:
+            key, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "snapshots": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class LocalQueryEngine:
+    """
+    DuckDB over cached Parquet snapshots
+
+    Each query runs on its own DuckDB cursor with the snapshot registered as
+    the dataset table (an Arrow dataset, scanned lazily), so queries on
+    different datasets don't interfere and can't see each other's tables.
+
+    Args:
+        snapshots: Cache holding the dataset snapshots
+        threads: DuckDB worker threads (0 = one per core)
+        memory_limit: DuckDB memory limit such as "1GB" (None = DuckDB default)
+        transpile_cache_size: Number of transpiled SQL texts remembered
+    """
+
+    def __init__(
+        self,
+        snapshots: SnapshotCache,
+        threads: int = 0,
+        memory_limit: Optional[str] = None,
+        transpile_cache_size: int = 2048
+    ):
+        config = {
+            "integer_division": True,  # 7 / 2 = 3 for integers, as in PostgreSQL
+            # Generated SQL must not read or write files (other tenants'
+            # snapshots, host files) or re-enable that
+            "enable_external_access": False,
+            "lock_configuration": True,
+        }
+        if threads:
+            config["threads"] = threads
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        self.snapshots = snapshots
+        self._db = duckdb.connect(":memory:", config=config)
+        self._transpiled = LRUCache(maxsize=transpile_cache_size)
+
+    def _transpile(self, sql: str) -> str:
+        duck_sql = self._transpiled.get(sql)
+        if duck_sql is None:
+            try:
+                duck_sql = sqlglot.transpile(sql, read="postgres", write="duckdb")[0]
+            except SqlglotError as e:
+                raise LocalEngineError(f"Could not transpile SQL: {str(e).splitlines()[0]}") from e
+            self._transpiled.set(sql, duck_sql)
+        return duck_sql
+
+    def _run(self, table_name: str, source: Optional[str], sql: str, params: dict, timeout_ms: int, consume):
+        path = self.snapshots.get(table_name, source)
+        if path is None:
+            raise LocalEngineError(f"No local snapshot of {table_name}")
+        # DuckDB rejects parameters the statement doesn't use
+        params = {name: value for name, value in params.items() if f"${name}" in sql}
+
+        conn = self._db.cursor()
+        timer = threading.Timer(timeout_ms / 1000, conn.interrupt) if timeout_ms > 0 else None
+        try:
+            conn.register(table_name, pa_dataset.dataset(path, format="parquet"))
+            if timer is not None:
+                timer.start()
+            conn.execute(sql, params)
+            names = [column[0] for column in conn.description]
+            batches = iter(lambda: conn.fetchmany(FETCH_BATCH_ROWS), [])
+            return consume(names, (row for batch in batches for row in batch))
+        except duckdb.InterruptException as e:
+            raise QueryTimeoutError(f"Query exceeded the {timeout_ms / 1000:g}s time limit") from e
+        except duckdb.Error as e:
+            raise LocalEngineError(str(e)) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            conn.close()
+
+    def execute_guarded(
+        self,
+        table_name: str,
+        source: Optional[str],
+        sql: str,
+        params: Optional[dict] = None,
+        max_rows: int = QUERY_MAX_ROWS,
+        max_bytes: int = QUERY_MAX_RESULT_BYTES,
+        timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+    ) -> dict:
+        """
+        query_results.execute_guarded() on the local snapshot of table_name
+
+        Args:
+            table_name: Dataset table the SQL reads
+            source: Where to fetch the snapshot from if it is not cached
+            sql: Tenant-scoped SELECT in PostgreSQL syntax
+
+        Raises:
+            LocalEngineError: If there is no snapshot or DuckDB can't run the SQL
+            QueryTimeoutError: If the query ran longer than timeout_ms
+        """
+        duck_sql = limited_sql(self._transpile(sql), max_rows)
+        return self._run(
+            table_name, source, duck_sql, params or {}, timeout_ms,
+            lambda names, rows: collect_rows(names, rows, max_rows, max_bytes)
+        )
+
+    def fetch_page(
+        self,
+        table_name: str,
+        source: Optional[str],
+        sql: str,
+        params: Optional[dict] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        offset: int = 0,
+        timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+    ) -> dict:
+        """query_results.fetch_page() on the local snapshot of table_name (raises like execute_guarded)"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        duck_sql = paged_sql(self._transpile(sql), placeholder="$")
+        return self._run(
+            table_name, source, duck_sql, {**(params or {}), "limit": limit + 1, "offset": offset}, timeout_ms,
+            lambda names, rows: build_page(names, list(rows), limit, offset)
+        )
@@ -0,0 +1,149 @@
+"""
+Dataset Metadata Cache
+Per-user cache of user_datasets rows, so /ask and the dataset endpoints
+resolve a dataset without a PostgREST round trip to Supabase.
+
+All of a user's rows are loaded with one query and cached together (with
+TTL and LRU bounds). Uploads write through to the cached list and deletes
+remove from it. With a Redis URL the rows are kept in Redis instead of
+process memory, so every gunicorn worker sees the same state; writes then
+invalidate the user's entry (the next read reloads it) because a
+read-modify-write could lose a concurrent worker's update.
+Reference: https://redis.io/docs/latest/develop/use/patterns/
+"""
+import json
+import threading
+from typing import Callable, List, Optional
+
+from cache import LRUCache
+
+try:
+    import redis
+except ImportError:  # Optional dependency: only needed to share the cache across workers
+    redis = None
+
+
+class DatasetMetadataCache:
+    """
+    user_id -> that user's user_datasets rows (newest first)
+
+    Args:
+        loader: Fetches all rows of a user from the database (blocking)
+        maxsize: Users kept in the in-process cache (0 disables caching)
+        ttl: Seconds a user's rows are trusted before being reloaded
+        redis_url: Share entries through Redis instead of process memory
+        namespace: Redis key prefix
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], List[dict]],
+        maxsize: int = 1024,
+        ttl: float = 60,
+        redis_url: Optional[str] = None,
+        namespace: str = "user_datasets"
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.namespace = namespace
+        self.enabled = maxsize > 0
+        self._local = LRUCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                print("[WARNING] DATASET_CACHE_REDIS_URL is set but redis is not installed; caching per worker")
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=1)
+        self.loads = 0
+        self.shared_errors = 0
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.namespace}:{user_id}"
+
+    def _read(self, user_id: str) -> Optional[List[dict]]:
+        if self._redis is None:
+            return self._local.get(user_id)
+        try:
+            blob = self._redis.get(self._key(user_id))
+        except redis.RedisError as e:
+            self.shared_errors += 1
+            print(f"[WARNING] Dataset cache read failed: {str(e)}")
+            return None
+        return json.loads(blob) if blob is not None else None
+
+    def _write(self, user_id: str, rows: List[dict]) -> None:
+        if self._redis is None:
+            self._local.set(user_id, rows)
+            return
+        try:
+            self._redis.set(self._key(user_id), json.dumps(rows, default=str), ex=max(int(self.ttl), 1))
+        except redis.RedisError as e:
+            self.shared_errors += 1
+            print(f"[WARNING] Dataset cache write failed: {str(e)}")
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget a user's rows (the next read reloads them)"""
+        self._local.pop(user_id)
+        if self._redis is not None:
+            try:
+                self._redis.delete(self._key(user_id))
+            except redis.RedisError as e:
+                self.shared_errors += 1
+                print(f"[WARNING] Dataset cache invalidation failed: {str(e)}")
+
+    def _load(self, user_id: str) -> List[dict]:
+        rows = self.loader(user_id)
+        self.loads += 1
+        if self.enabled:
+            self._write(user_id, rows)
+        return rows
+
+    def datasets(self, user_id: str) -> List[dict]:
+        """All of a user's rows, newest first (copies, safe to modify)"""
+        rows = self._read(user_id) if self.enabled else None
+        if rows is None:
+            rows = self._load(user_id)
+        return [dict(row) for row in rows]
+
+    def get(self, user_id: str, dataset_id: str) -> Optional[dict]:
+        """
+        One of the user's rows, or None if the user has no such dataset
+
+        An id missing from cached rows triggers one reload, so datasets
+        uploaded through another worker are found right away.
+        """
+        rows = self._read(user_id) if self.enabled else None
+        from_cache = rows is not None
+        if rows is None:
+            rows = self._load(user_id)
+        row = next((row for row in rows if row["id"] == dataset_id), None)
+        if row is None and from_cache:
+            row = next((row for row in self._load(user_id) if row["id"] == dataset_id), None)
+        return dict(row) if row is not None else None
+
+    def add(self, user_id: str, row: dict) -> None:
+        """Write a newly created dataset row through to the cache"""
+        self._modify(user_id, lambda rows: [row] + [r for r in rows if r["id"] != row["id"]])
+
+    def update(self, user_id: str, dataset_id: str, fields: dict) -> None:
+        """Write changed columns of a dataset row through to the cache"""
+        self._modify(user_id, lambda rows: [{**r, **fields} if r["id"] == dataset_id else r for r in rows])
+
+    def remove(self, user_id: str, dataset_id: str) -> None:
+        """Drop a deleted dataset from the cache"""
+        self._modify(user_id, lambda rows: [r for r in rows if r["id"] != dataset_id])
+
+    def _modify(self, user_id: str, change: Callable[[List[dict]], List[dict]]) -> None:
+        if self._redis is not None:
+            self.invalidate(user_id)
+            return
+        with self._lock:
+            rows = self._local.get(user_id)
+            if rows is not None:
+                self._local.set(user_id, change(rows))
+
+    def stats(self) -> dict:
+        stats = self._local.stats() if self._redis is None else {"backend": "redis"}
+        stats.update(enabled=self.enabled, loads=self.loads, shared_errors=self.shared_errors)
+        return stats
@@ -0,0 +1,198 @@
+"""
+Dataset Prompt Context
+Schema, sample rows and basic stats computed once at upload time so /ask can
+build its LLM prompt without reflecting or sampling the data table
+"""
+import json
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Number of sample rows shown to the LLM (matches LangChain's default)
+SAMPLE_ROWS_IN_TABLE_INFO = 3
+
+# Sample values longer than this are truncated in the prompt
+MAX_SAMPLE_VALUE_LENGTH = 100
+
+# Columns added to every dataset table by create_dynamic_table_from_dataframe
+SYSTEM_COLUMNS = [("id", "INTEGER"), ("user_id", "VARCHAR")]
+
+# Text columns with at most this many distinct values have them listed in the prompt
+LOW_CARDINALITY_MAX_VALUES = 20
+
+CONTEXT_VERSION = 1
+
+
+def _to_json_safe(frame: pd.DataFrame) -> list:
+    """Convert DataFrame values to plain JSON types (NaN -> None, dates -> ISO)"""
+    return json.loads(frame.to_json(orient="values", date_format="iso"))
+
+
+def build_schema_context(
+    df: pd.DataFrame,
+    table_name: str,
+    column_types: Dict[str, str],
+    sample_rows: int = SAMPLE_ROWS_IN_TABLE_INFO
+) -> dict:
+    """
+    Build the prompt context for a freshly ingested dataset
+
+    Args:
+        df: Parsed CSV data (column order must match column_types)
+        table_name: PostgreSQL table the data was loaded into
+        column_types: Ordered mapping of table column name -> SQL type name
+        sample_rows: Number of rows to keep as examples for the LLM
+
+    Returns:
+        JSON-serializable dict stored in user_datasets.schema_context
+    """
+    column_names = list(column_types.keys())
+    null_counts = df.isna().sum().tolist()
+
+    # Value ranges for numeric and date/time columns
+    ranged = df.select_dtypes(include=["number", "datetime"])
+    numeric_positions = [df.columns.get_loc(col) for col in ranged.columns]
+    bounds = _to_json_safe(ranged.agg(["min", "max"])) if not ranged.empty else [[], []]
+    text_positions = [position for position, dtype in enumerate(df.dtypes) if dtype == object]
+
+    columns = []
+    for position, name in enumerate(column_names):
+        column = {
+            "name": name,
+            "type": column_types[name],
+            "null_count": int(null_counts[position]),
+        }
+        if position in numeric_positions:
+            index = numeric_positions.index(position)
+            column["min"] = bounds[0][index]
+            column["max"] = bounds[1][index]
+        elif position in text_positions:
+            distinct = df.iloc[:, position].dropna().unique()
+            if len(distinct) <= LOW_CARDINALITY_MAX_VALUES:
+                column["values"] = sorted(str(value) for value in distinct)
+        columns.append(column)
+
+    return {
+        "version": CONTEXT_VERSION,
+        "table_name": table_name,
+        "row_count": int(len(df)),
+        "columns": columns,
+        "sample_rows": _to_json_safe(df.head(sample_rows)),
+    }
+
+
+def attach_column_stats(context: dict, stats: dict, top_values: int = 5) -> dict:
+    """
+    Add distinct counts and the most common values from column statistics
+    to a schema context (columns that already list all their values are skipped)
+    """
+    by_name = {column["name"]: column for column in stats["columns"]}
+    for column in context["columns"]:
+        column_stats = by_name.get(column["name"])
+        if column_stats is None:
+            continue
+        column["distinct"] = column_stats["distinct"]
+        if "values" not in column and column_stats.get("top_values") and column_stats["type"] == "text":
+            column["top_values"] = [item["value"] for item in column_stats["top_values"][:top_values]]
+    return context
+
+
+def _format_sample_value(value) -> str:
+    text = "None" if value is None else str(value)
+    if len(text) > MAX_SAMPLE_VALUE_LENGTH:
+        text = text[:MAX_SAMPLE_VALUE_LENGTH] + "..."
+    return text
+
+
+def render_table_info(context: dict) -> str:
+    """
+    Render stored context in the same layout as SQLDatabase.get_table_info()
+
+    Args:
+        context: Dict produced by build_schema_context()
+
+    Returns:
+        CREATE TABLE statement followed by a block of sample rows
+    """
+    table_name = context["table_name"]
+    columns: List[dict] = context["columns"]
+
+    definitions = [f"\t{name} {sql_type} NOT NULL" for name, sql_type in SYSTEM_COLUMNS]
+    definitions += [f"\t{col['name']} {col['type']}" for col in columns]
+    definitions.append(f"\tCONSTRAINT {table_name}_pkey PRIMARY KEY (id)")
+    create_table = f"CREATE TABLE {table_name} (\n" + ", \n".join(definitions) + "\n)"
+
+    sample_rows = context.get("sample_rows") or []
+    header = "\t".join(col["name"] for col in columns)
+    rows = "\n".join("\t".join(_format_sample_value(v) for v in row) for row in sample_rows)
+
+    ranges = [
+        f"{col['name']}: min={col['min']}, max={col['max']}"
+        for col in columns
+        if col.get("min") is not None
+    ]
+    categories = [
+        f"{col['name']}: " + ", ".join(_format_sample_value(value) for value in col["values"])
+        for col in columns
+        if col.get("values")
+    ]
+    common = [
+        f"{col['name']} (~{col.get('distinct', '?')} distinct): "
+        + ", ".join(_format_sample_value(value) for value in col["top_values"])
+        for col in columns
+        if col.get("top_values")
+    ]
+
+    info = (
+        f"{create_table}\n\n/*\n"
+        f"{len(sample_rows)} rows from {table_name} table:\n"
+        f"{header}\n{rows}\n*/"
+    )
+    if ranges:
+        info += f"\n\n/*\nTable has {context.get('row_count', 0)} rows. Value ranges:\n" + "\n".join(ranges) + "\n*/"
+    if categories:
+        info += "\n\n/*\nAll distinct values of low-cardinality columns:\n" + "\n".join(categories) + "\n*/"
+    if common:
+        info += "\n\n/*\nMost common values of other text columns:\n" + "\n".join(common) + "\n*/"
+    return info
+
+
+def _combine(pick, a, b):
+    """min/max of two optional values (None means the chunk was all null)"""
+    if a is None or b is None:
+        return b if a is None else a
+    return pick(a, b)
+
+
+def merge_schema_contexts(base: Optional[dict], chunk: dict) -> dict:
+    """
+    Combine the context of a previously loaded part of a dataset with a new chunk
+
+    Row and null counts are summed, value ranges widened and distinct values of
+    low-cardinality columns united. Sample rows come from the first chunk;
+    column types from the latest one (types only widen).
+    """
+    if base is None:
+        return chunk
+
+    columns = []
+    for previous, current in zip(base["columns"], chunk["columns"]):
+        column = {
+            "name": current["name"],
+            "type": current["type"],
+            "null_count": previous["null_count"] + current["null_count"],
+        }
+        if "min" in previous and "min" in current:
+            column["min"] = _combine(min, previous["min"], current["min"])
+            column["max"] = _combine(max, previous["max"], current["max"])
+        if "values" in previous and "values" in current:
+            values = sorted(set(previous["values"]) | set(current["values"]))
+            if len(values) <= LOW_CARDINALITY_MAX_VALUES:
+                column["values"] = values
+        columns.append(column)
+
+    return {
+        **base,
+        "row_count": base["row_count"] + chunk["row_count"],
+        "columns": columns,
+    }
@@ -0,0 +1,190 @@
+"""
+Shared Database Connection Pool
+Builds the single SQLAlchemy engine all database access goes through (dataset
+tables, /ask SQL, ingest, the index advisor and the legacy SQLDatabase path)
+and measures how it is used: checkout wait time, timeouts and how many of its
+connections are in use.
+
+Supabase's transaction pooler (Supavisor, port 6543) lends a server
+connection to a client only for the length of a transaction, and caps how
+many client connections a project may open. In transaction mode:
+- server-side prepared statements are disabled (they would outlive the
+  transaction on a connection another client gets next; psycopg2 never
+  prepares, psycopg 3 does after prepare_threshold executions)
+- idle connections are recycled sooner and reused most-recently-first, so
+  a burst's extra connections go idle and are closed instead of being kept
+- DB_POOL_SIZE=0 switches to NullPool: no connection is kept between
+  checkouts and the pooler does all the pooling
+Each worker opens at most pool_size + max_overflow connections, so size the
+pool so that workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under the
+pooler's client limit; checkouts beyond that wait up to DB_POOL_TIMEOUT.
+Reference: https://supabase.com/docs/guides/database/connecting-to-postgres#supavisor-transaction-mode
+"""
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from timing import Histogram, record_stage
+
+TRANSACTION_POOLER_PORT = 6543
+POOLER_MODES = ("auto", "transaction", "session")
+
+# Recycle default (seconds) when DB_POOL_RECYCLE is not set
+DIRECT_RECYCLE_SECONDS = 3600
+TRANSACTION_RECYCLE_SECONDS = 300
+
+POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Time to get a database connection from the pool (queueing, new connections and pre-ping included)",
+    (),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+_counters_lock = threading.Lock()
+_counters = {"checkouts": 0, "timeouts": 0, "peak_checked_out": 0}
+
+
+class _TimedCheckout:
+    """Pool mixin that times every checkout (Pool.connect) and counts timeouts"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with _counters_lock:
+                _counters["timeouts"] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            POOL_WAIT_SECONDS.observe((), waited)
+            record_stage("db_wait", waited)
+        checked_out = self.checkedout() if isinstance(self, QueuePool) else 0
+        with _counters_lock:
+            _counters["checkouts"] += 1
+            _counters["peak_checked_out"] = max(_counters["peak_checked_out"], checked_out)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def uses_transaction_pooler(url: str, pooler_mode: str = "auto") -> bool:
+    """Whether url should be treated as a transaction pooler ("auto": port 6543)"""
+    if pooler_mode not in POOLER_MODES:
+        raise ValueError(f"DB_POOLER_MODE must be one of {', '.join(POOLER_MODES)}, not {pooler_mode!r}")
+    if pooler_mode != "auto":
+        return pooler_mode == "transaction"
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "postgresql" and parsed.port == TRANSACTION_POOLER_PORT
+
+
+class DatabasePool:
+    """
+    The shared engine, created with a timed pool sized as configured
+
+    Args:
+        url: Database URL
+        pool_size: Connections kept open (0 = NullPool, nothing kept)
+        max_overflow: Extra connections opened under load and closed when returned
+        pool_timeout: Seconds a checkout waits for a free connection before failing
+        pool_recycle: Age in seconds after which a connection is replaced
+                      (None = 300 on the transaction pooler, 3600 otherwise)
+        pooler_mode: "auto" (transaction mode on port 6543), "transaction" or "session"
+        pre_ping: Test each connection with a round trip when it is checked out
+        connect_timeout: libpq connect timeout in seconds (PostgreSQL only)
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: Optional[int] = None,
+        pooler_mode: str = "auto",
+        pre_ping: bool = True,
+        connect_timeout: int = 10
+    ):
+        parsed = make_url(url)
+        self.transaction_pooler = uses_transaction_pooler(url, pooler_mode)
+        self.pool_size = max(pool_size, 0)
+        self.max_overflow = max(max_overflow, 0) if self.pool_size else 0
+        self.pool_recycle = pool_recycle if pool_recycle is not None else (
+            TRANSACTION_RECYCLE_SECONDS if self.transaction_pooler else DIRECT_RECYCLE_SECONDS
+        )
+
+        connect_args = {}
+        if parsed.get_backend_name() == "postgresql":
+            # libpq option; other drivers (e.g. SQLite for local benchmarks) reject it
+            connect_args["connect_timeout"] = connect_timeout
+            if self.transaction_pooler and parsed.get_driver_name() == "psycopg":
+                connect_args["prepare_threshold"] = None
+
+        if self.pool_size:
+            pool_options = {
+                "poolclass": TimedQueuePool,
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "pool_timeout": pool_timeout,
+                "pool_recycle": self.pool_recycle,
+                "pool_use_lifo": self.transaction_pooler,
+            }
+        else:
+            pool_options = {"poolclass": TimedNullPool}
+        self.engine: Engine = create_engine(
+            url, pool_pre_ping=pre_ping, connect_args=connect_args, **pool_options
+        )
+
+    def stats(self) -> dict:
+        """Pool sizing, current use and checkout counters (for /health)"""
+        pool = self.engine.pool
+        with _counters_lock:
+            stats = dict(_counters)
+        stats["pool"] = type(pool).__name__
+        stats["transaction_pooler"] = self.transaction_pooler
+        if isinstance(pool, QueuePool):
+            capacity = self.pool_size + self.max_overflow
+            checked_out = pool.checkedout()
+            stats.update({
+                "size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "recycle_seconds": self.pool_recycle,
+                "checked_out": checked_out,
+                "idle": pool.checkedin(),
+                "saturation": round(checked_out / capacity, 4),
+            })
+        return stats
+
+    def render_metrics(self) -> str:
+        """Pool gauges, counters and the checkout wait histogram in the Prometheus text format"""
+        stats = self.stats()
+        lines = []
+
+        def metric(name: str, kind: str, description: str, value) -> None:
+            lines.extend([f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name} {value}"])
+
+        if "size" in stats:
+            metric("db_pool_size", "gauge", "Connections the pool keeps open", stats["size"])
+            metric("db_pool_max_connections", "gauge", "Most connections the pool may open (size + overflow)",
+                   stats["size"] + stats["max_overflow"])
+            metric("db_pool_checked_out", "gauge", "Connections currently in use", stats["checked_out"])
+            metric("db_pool_idle", "gauge", "Open connections waiting in the pool", stats["idle"])
+            metric("db_pool_saturation", "gauge", "Connections in use as a fraction of the most the pool may open",
+                   stats["saturation"])
+        metric("db_pool_checked_out_peak", "gauge", "Most connections in use at once since startup",
+               stats["peak_checked_out"])
+        metric("db_pool_checkouts_total", "counter", "Connections checked out of the pool", stats["checkouts"])
+        metric("db_pool_timeouts_total", "counter", "Checkouts that failed after waiting DB_POOL_TIMEOUT",
+               stats["timeouts"])
+        return "\n".join(lines) + "\n" + POOL_WAIT_SECONDS.render()
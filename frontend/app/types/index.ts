@@ -16,6 +16,19 @@ export interface QueryResult {
   message?: string;
   confidence?: number;
   data_found?: boolean;
+  cached?: boolean;
+  query_id?: string;
+  result?: QueryResultPage;
+  truncated?: boolean;
+  truncated_reason?: 'row_limit' | 'byte_limit';
+}
+
+export interface QueryResultPage {
+  columns: { name: string; type: string | null }[];
+  rows: unknown[][];
+  offset: number;
+  has_more: boolean;
+  next_cursor: string | null;
 }
 
 export interface Dataset {
@@ -0,0 +1,136 @@
+"""
+Batched History Writer
+Writes query_history rows from a background thread, so logging an /ask query
+is an in-memory enqueue instead of an HTTPS round trip in the request.
+
+Rows wait in a bounded queue and are written in batches once batch_size rows
+are queued or flush_interval seconds have passed since the first one. When
+the queue is full new rows are dropped and counted (enqueueing never blocks
+the event loop). close() writes whatever is still queued, for shutdown.
+"""
+import queue
+import threading
+import time
+from typing import Callable, List
+
+
+class HistoryWriter:
+    """
+    Bounded queue of rows drained in batches by a daemon thread
+
+    Args:
+        write_batch: Inserts a list of rows (blocking); called from the writer thread
+        max_queue: Rows that may wait to be written before new ones are dropped
+        batch_size: Most rows written per call to write_batch
+        flush_interval: Longest a queued row waits for its batch to fill up
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[dict]], None],
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0
+    ):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = threading.Event()
+        self._idle = threading.Condition()
+        self._pending = 0  # rows enqueued but not yet written or given up on
+        self.written = self.dropped = self.failed = self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: dict) -> bool:
+        """Queue a row for writing; returns False if it was dropped"""
+        if self._closed.is_set():
+            return self._drop(row, "writer is closed")
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._done(1)
+            return self._drop(row, "queue is full")
+        return True
+
+    def _drop(self, row: dict, reason: str) -> bool:
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            print(f"[WARNING] Dropped query history row ({reason}); {self.dropped} dropped so far")
+        return False
+
+    def _done(self, rows: int) -> None:
+        with self._idle:
+            self._pending -= rows
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _next_batch(self) -> List[dict]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closed.is_set():
+                # Closing: take what is already queued without waiting for more
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._closed.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        try:
+            self.write_batch(batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            # One bad row must not lose the whole batch: retry rows one by one
+            print(f"[WARNING] Query history batch of {len(batch)} failed, retrying per row: {str(e)}")
+            for row in batch:
+                try:
+                    self.write_batch([row])
+                    self.written += 1
+                except Exception as row_error:
+                    self.failed += 1
+                    print(f"[WARNING] Failed to log query history: {str(row_error)}")
+        finally:
+            self._done(len(batch))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued row has been written; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float = 10) -> None:
+        """Stop accepting rows and write the ones still queued"""
+        self._closed.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[WARNING] Query history writer did not finish within {timeout}s; "
+                  f"{self._queue.qsize()} rows not written")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
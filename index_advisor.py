@@ -0,0 +1,269 @@
+"""
+Workload-Driven Index Advisor
+Mines the SQL recorded in query_history for the columns each dataset table
+is filtered, joined, grouped or sorted on, and keeps a small set of
+(user_id, column) indexes on the most used ones.
+
+Every executed query is scoped with user_id = :user_id, so a composite index
+led by user_id serves both the tenant filter and the column predicate/sort.
+Indexes are built and dropped CONCURRENTLY on PostgreSQL so the table stays
+writable and readable, and each run reports query times before and after.
+Reference: https://www.postgresql.org/docs/current/sql-createindex.html#SQL-CREATEINDEX-CONCURRENTLY
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Callable, Iterable, List, Optional
+
+import sqlglot
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from query_results import set_statement_timeout
+
+# Weight of one use of a column in each kind of clause
+USAGE_WEIGHTS = {
+    "equality": 3,
+    "range": 2,
+    "join": 2,
+    "sort": 1,
+    "group": 1,
+}
+
+ADVISOR_INDEX_PREFIX = "adv_"
+
+_EQUALITY = (exp.EQ, exp.In, exp.Is)
+_RANGE = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)
+
+
+def advisor_index_name(table_name: str, column: str) -> str:
+    """Deterministic, length-safe name of the advisor index on a column"""
+    digest = hashlib.sha1(f"{table_name}.{column}".encode("utf-8")).hexdigest()[:16]
+    return f"{ADVISOR_INDEX_PREFIX}{digest}"
+
+
+def _predicate_kind(column: exp.Column) -> Optional[str]:
+    node = column.parent
+    while node is not None and not isinstance(node, (exp.Where, exp.Join, exp.Select)):
+        if isinstance(node, _EQUALITY):
+            return "equality"
+        if isinstance(node, _RANGE):
+            return "range"
+        node = node.parent
+    return None
+
+
+def column_usage(sql: str, columns: Iterable[str], dialect: str = "postgres") -> Counter:
+    """
+    Weighted use of dataset columns in one query's predicates, joins, GROUP BY and ORDER BY
+
+    Unparseable SQL counts as no usage.
+    """
+    known = {column.lower(): column for column in columns}
+    usage = Counter()
+    try:
+        tree = sqlglot.parse_one(sql, read=dialect)
+    except SqlglotError:
+        return usage
+
+    def add(node: exp.Expression, kind: str) -> None:
+        for column in node.find_all(exp.Column):
+            name = known.get(column.name.lower())
+            if name is not None:
+                usage[name] = max(usage[name], USAGE_WEIGHTS[kind])
+
+    for where in tree.find_all(exp.Where):
+        for column in where.find_all(exp.Column):
+            kind = _predicate_kind(column)
+            name = known.get(column.name.lower())
+            if kind and name is not None:
+                usage[name] = max(usage[name], USAGE_WEIGHTS[kind])
+    for join in tree.find_all(exp.Join):
+        if join.args.get("on") is not None:
+            add(join.args["on"], "join")
+    for group in tree.find_all(exp.Group):
+        add(group, "group")
+    for order in tree.find_all(exp.Order):
+        add(order, "sort")
+    return usage
+
+
+def rank_columns(
+    sqls: List[str],
+    columns: Iterable[str],
+    min_uses: int = 3,
+    dialect: str = "postgres"
+) -> List[dict]:
+    """
+    Candidate index columns ordered by weighted usage across a workload
+
+    Returns:
+        [{column, score, uses}] for columns used by at least min_uses queries
+    """
+    scores, uses = Counter(), Counter()
+    for sql in sqls:
+        for column, weight in column_usage(sql, columns, dialect).items():
+            scores[column] += weight
+            uses[column] += 1
+    ranked = [
+        {"column": column, "score": score, "uses": uses[column]}
+        for column, score in scores.most_common()
+        if uses[column] >= min_uses
+    ]
+    return ranked
+
+
+def existing_advisor_indexes(engine: Engine, table_name: str, columns: Iterable[str]) -> dict:
+    """{column: index name} of advisor indexes currently on the table"""
+    by_name = {advisor_index_name(table_name, column): column for column in columns}
+    return {
+        by_name[index["name"]]: index["name"]
+        for index in inspect(engine).get_indexes(table_name)
+        if index["name"] in by_name
+    }
+
+
+def _ddl(engine: Engine, statement: str) -> None:
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(statement))
+
+
+def create_advisor_index(engine: Engine, table_name: str, column: str) -> str:
+    quote = engine.dialect.identifier_preparer.quote
+    name = advisor_index_name(table_name, column)
+    concurrently = "CONCURRENTLY " if engine.dialect.name == "postgresql" else ""
+    try:
+        _ddl(engine, f"CREATE INDEX {concurrently}IF NOT EXISTS {quote(name)} "
+                     f"ON {quote(table_name)} ({quote('user_id')}, {quote(column)})")
+    except Exception:
+        # A failed concurrent build leaves an INVALID index behind
+        drop_advisor_index(engine, name)
+        raise
+    return name
+
+
+def drop_advisor_index(engine: Engine, index_name: str) -> None:
+    concurrently = "CONCURRENTLY " if engine.dialect.name == "postgresql" else ""
+    _ddl(engine, f"DROP INDEX {concurrently}IF EXISTS {engine.dialect.identifier_preparer.quote(index_name)}")
+
+
+def measure_query_ms(engine: Engine, sql: str, params: Optional[dict] = None, timeout_ms: int = 15000) -> float:
+    """
+    Server-side execution time of a query in milliseconds
+
+    Uses EXPLAIN ANALYZE on PostgreSQL (no rows are sent back); other
+    engines are timed around a full fetch.
+    """
+    with engine.connect() as conn:
+        set_statement_timeout(conn, timeout_ms)
+        if engine.dialect.name == "postgresql":
+            plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params or {}).scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return round(plan[0]["Execution Time"], 3)
+        started = time.perf_counter()
+        conn.execute(text(sql), params or {}).fetchall()
+        return round((time.perf_counter() - started) * 1000, 3)
+
+
+def advise_indexes(
+    engine: Engine,
+    table_name: str,
+    columns: List[str],
+    sqls: List[str],
+    max_indexes: int = 3,
+    min_uses: int = 3,
+    measure_queries: int = 3,
+    prepare: Optional[Callable[[str], str]] = None,
+    params: Optional[dict] = None,
+    dialect: str = "postgres"
+) -> dict:
+    """
+    Bring a table's advisor indexes in line with its recent workload
+
+    The top max_indexes ranked columns get a (user_id, column) index; advisor
+    indexes on columns that dropped out of the ranking are removed. Indexes
+    created by anything else are never touched.
+
+    Args:
+        engine: SQLAlchemy engine owning the table
+        table_name: Dataset table
+        columns: Dataset columns (system columns excluded)
+        sqls: Recent successful SQL run against the table (display form)
+        max_indexes: Index budget for the table
+        min_uses: Queries that must use a column before it is indexed
+        measure_queries: Most frequent queries timed before and after the change
+        prepare: Turns display SQL into executable SQL (adds the user filter)
+        params: Bind parameters for prepared SQL
+        dialect: sqlglot dialect of the SQL
+
+    Returns:
+        Report with the ranking, created/dropped/kept indexes and timings
+    """
+    started = time.perf_counter()
+    ranking = rank_columns(sqls, columns, min_uses, dialect)
+    wanted = [candidate["column"] for candidate in ranking[:max_indexes]]
+    existing = existing_advisor_indexes(engine, table_name, columns)
+
+    to_create = [column for column in wanted if column not in existing]
+    to_drop = [column for column in existing if column not in wanted]
+
+    # Time the most frequent queries that touch a changed column
+    changed = set(to_create) | set(to_drop)
+    samples = [
+        sql for sql, _ in Counter(sqls).most_common()
+        if changed & set(column_usage(sql, columns, dialect))
+    ][:measure_queries]
+    timings = []
+    for sql in samples:
+        try:
+            executable = prepare(sql) if prepare else sql
+            timings.append({"sql": sql, "before_ms": measure_query_ms(engine, executable, params)})
+        except Exception as e:
+            print(f"[WARNING] Index advisor could not time query: {str(e)}")
+
+    created, dropped, errors = [], [], []
+    for column in to_create:
+        try:
+            created.append({"column": column, "index": create_advisor_index(engine, table_name, column)})
+        except Exception as e:
+            errors.append(f"create {column}: {str(e)}")
+    for column in to_drop:
+        try:
+            drop_advisor_index(engine, existing[column])
+            dropped.append({"column": column, "index": existing[column]})
+        except Exception as e:
+            errors.append(f"drop {column}: {str(e)}")
+
+    if created and engine.dialect.name == "postgresql":
+        # Fresh statistics so the planner considers the new indexes right away
+        with engine.begin() as conn:
+            conn.execute(text(f"ANALYZE {engine.dialect.identifier_preparer.quote(table_name)}"))
+
+    for timing in timings:
+        try:
+            executable = prepare(timing["sql"]) if prepare else timing["sql"]
+            timing["after_ms"] = measure_query_ms(engine, executable, params)
+        except Exception as e:
+            timing["after_ms"] = None
+            print(f"[WARNING] Index advisor could not time query: {str(e)}")
+
+    report = {
+        "table_name": table_name,
+        "queries_analyzed": len(sqls),
+        "ranking": ranking,
+        "created": created,
+        "dropped": dropped,
+        "kept": [column for column in wanted if column in existing],
+        "timings": timings,
+        "errors": errors,
+        "max_indexes": max_indexes,
+        "seconds": round(time.perf_counter() - started, 3),
+        "ran_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    print(f"[INFO] Index advisor on {table_name}: created {[c['column'] for c in created]}, "
+          f"dropped {[d['column'] for d in dropped]} ({report['seconds']}s)")
+    return report
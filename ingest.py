@@ -0,0 +1,467 @@
+"""
+Bulk Data Ingest
+Creates dataset tables and streams data into them with PostgreSQL COPY FROM STDIN.
+CSV files are parsed in bounded-size chunks so peak memory does not grow with
+file size.
+Reference: https://www.postgresql.org/docs/current/sql-copy.html
+"""
+import io
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, text
+from sqlalchemy.engine import Engine
+
+from column_stats import ColumnStatsBuilder
+from dataset_context import attach_column_stats, build_schema_context, merge_schema_contexts
+from parquet_snapshot import ParquetSnapshotWriter, read_snapshot_batches, snapshot_columns
+from timing import stage, timed_iter
+from type_inference import SQL_TYPES, coerce_frame, infer_column_kinds, widen_kind
+
+# Rows serialized per COPY batch - bounds the size of each in-memory CSV buffer
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000"))
+
+# Memory budget for one parsed CSV chunk (DataFrame + its COPY buffer)
+UPLOAD_MAX_MEMORY_BYTES = int(os.getenv("UPLOAD_MAX_MEMORY_MB", "256")) * 1024 * 1024
+
+# A parsed DataFrame typically takes several times the raw CSV size in memory
+PANDAS_MEMORY_FACTOR = 8
+MIN_CHUNK_ROWS = 1_000
+MAX_CHUNK_ROWS = 1_000_000
+
+
+class InvalidCSVError(ValueError):
+    """Raised when the uploaded file cannot be parsed as CSV"""
+
+
+def rename_reserved_columns(columns: List[str]) -> Tuple[List[str], dict]:
+    """
+    Rename CSV columns that clash with system columns (id, user_id)
+
+    Returns:
+        (table column names in CSV order, {original: renamed})
+    """
+    rename_map = {}
+    for col in columns:
+        col_lower = col.lower()
+        if col_lower == "id":
+            rename_map[col] = "original_id"
+        elif col_lower == "user_id":
+            rename_map[col] = "original_user_id"
+    return [rename_map.get(col, col) for col in columns], rename_map
+
+
+def create_dataset_table(engine: Engine, table_name: str, table_columns: List[str], kinds: List[str]) -> dict:
+    """
+    Create a dataset table with the system id/user_id columns
+    Reference: https://docs.sqlalchemy.org/en/20/core/metadata.html
+
+    Returns:
+        Ordered mapping of column name -> SQL type name
+    """
+    metadata = MetaData()
+    columns = [
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("user_id", String, nullable=False, index=True)  # Add user_id for RLS
+    ]
+    columns += [Column(name, SQL_TYPES[kind]) for name, kind in zip(table_columns, kinds)]
+    Table(table_name, metadata, *columns)
+    metadata.create_all(engine)
+    return column_types_for(engine, table_columns, kinds)
+
+
+def column_types_for(engine: Engine, table_columns: List[str], kinds: List[str]) -> dict:
+    return {
+        name: SQL_TYPES[kind]().compile(dialect=engine.dialect)
+        for name, kind in zip(table_columns, kinds)
+    }
+
+
+def widen_columns(
+    engine: Engine,
+    table_name: str,
+    table_columns: List[str],
+    kinds: List[str],
+    chunk: pd.DataFrame,
+    chunk_kinds: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Widen table columns whose values in a new chunk don't fit the current type
+    (see type_inference.widen_kind)
+
+    Columns that are entirely null in the chunk carry no type information and
+    are left alone. kinds is updated in place. chunk_kinds can pass in the
+    chunk's already inferred kinds.
+
+    Returns:
+        Names of the columns whose type changed
+    """
+    altered = []
+    if chunk_kinds is None:
+        chunk_kinds = infer_column_kinds(chunk)
+    for position, (name, chunk_kind) in enumerate(zip(table_columns, chunk_kinds)):
+        needed = widen_kind(kinds[position], chunk_kind)
+        if needed == kinds[position]:
+            continue
+        # SQLite is dynamically typed, and "null" columns already have the text type
+        if engine.dialect.name == "postgresql" and SQL_TYPES[needed] is not SQL_TYPES[kinds[position]]:
+            quote = engine.dialect.identifier_preparer.quote
+            sql_type = SQL_TYPES[needed]().compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {quote(table_name)} ALTER COLUMN {quote(name)} "
+                    f"TYPE {sql_type} USING {quote(name)}::{sql_type}"
+                ))
+        kinds[position] = needed
+        altered.append(name)
+    if altered:
+        print(f"[INFO] Widened columns {altered} in {table_name}")
+    return altered
+
+
+def lossy_text_widenings(kinds: List[str], chunk_kinds: List[str]) -> List[int]:
+    """
+    Positions of typed columns that a chunk widens to text
+
+    Values already loaded as booleans, numbers or dates can't be cast back to
+    their original text ("t" would become "true", "007" "7"), so these
+    columns have to be loaded from the raw CSV text again.
+    """
+    return [
+        position for position, (kind, chunk_kind) in enumerate(zip(kinds, chunk_kinds))
+        if kind not in ("text", "null") and widen_kind(kind, chunk_kind) == "text"
+    ]
+
+
+def drop_dataset_table(engine: Engine, table_name: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {engine.dialect.identifier_preparer.quote(table_name)}"))
+
+
+def replace_dataset_table(engine: Engine, staging_name: str, table_name: str) -> None:
+    """
+    Swap a fully loaded staging table in for table_name in one transaction
+
+    The user_id index is renamed along with the table so the next table
+    created under staging_name's or table_name's name does not collide with it.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    staging_index, index = f"ix_{staging_name}_user_id", f"ix_{table_name}_user_id"
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {quote(table_name)}"))
+        conn.execute(text(f"ALTER TABLE {quote(staging_name)} RENAME TO {quote(table_name)}"))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER INDEX IF EXISTS {quote(staging_index)} RENAME TO {quote(index)}"))
+        else:
+            conn.execute(text(f"DROP INDEX IF EXISTS {quote(staging_index)}"))
+            conn.execute(text(f"CREATE INDEX {quote(index)} ON {quote(table_name)} (user_id)"))
+
+
+def estimate_chunk_rows(path: str, memory_budget_bytes: int = UPLOAD_MAX_MEMORY_BYTES) -> int:
+    """
+    Rows per parsed chunk that keep a chunk within the memory budget
+
+    The average row width is measured on the first megabyte of the file.
+    """
+    with open(path, "rb") as handle:
+        sample = handle.read(1024 * 1024)
+    lines = max(sample.count(b"\n"), 1)
+    avg_row_bytes = max(len(sample) / lines, 1)
+    rows = int(memory_budget_bytes / (avg_row_bytes * PANDAS_MEMORY_FACTOR))
+    return max(MIN_CHUNK_ROWS, min(MAX_CHUNK_ROWS, rows))
+
+
+def _supports_copy(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+
+def _iter_blocks(df: pd.DataFrame, chunk_rows: int):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _copy_into(
+    engine: Engine,
+    df: pd.DataFrame,
+    table_name: str,
+    column_names: List[str],
+    user_id: str,
+    chunk_rows: int
+) -> None:
+    """COPY the frame in CSV batches inside a single transaction"""
+    quote = engine.dialect.identifier_preparer.quote
+    # user_id is appended as the last CSV field of every row
+    target = ", ".join(quote(name) for name in column_names + ["user_id"])
+    copy_sql = f"COPY {quote(table_name)} ({target}) FROM STDIN WITH (FORMAT csv)"
+
+    with engine.begin() as conn:
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            for block in _iter_blocks(df, chunk_rows):
+                buffer = io.StringIO()
+                block.assign(__user_id=user_id).to_csv(
+                    buffer, header=False, index=False, date_format="%Y-%m-%dT%H:%M:%S.%f"
+                )
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+        finally:
+            cursor.close()
+
+
+def _insert_into(
+    engine: Engine,
+    df: pd.DataFrame,
+    table_name: str,
+    column_names: List[str],
+    user_id: str,
+    chunk_rows: int
+) -> None:
+    """Fallback for engines without COPY support (e.g. SQLite in development)"""
+    with engine.begin() as conn:
+        for block in _iter_blocks(df, chunk_rows):
+            block.set_axis(column_names, axis=1).assign(user_id=user_id).to_sql(
+                table_name,
+                conn,
+                if_exists="append",
+                index=False,
+                method="multi",
+                chunksize=max(1, 30000 // (len(column_names) + 1))  # stay under bind-parameter limits
+            )
+
+
+def bulk_insert_dataframe(
+    engine: Engine,
+    df: pd.DataFrame,
+    table_name: str,
+    column_names: List[str],
+    user_id: str,
+    chunk_rows: int = INGEST_CHUNK_ROWS
+) -> dict:
+    """
+    Load a DataFrame into an existing dataset table
+
+    The frame is never copied as a whole: it is serialized in chunk_rows
+    batches and written positionally into column_names, so renamed columns
+    don't require a renamed copy of the data.
+
+    Args:
+        engine: SQLAlchemy engine owning the table
+        df: Data to load (column order must match column_names)
+        table_name: Target table (already created)
+        column_names: Table column for each DataFrame column, in order
+        user_id: Owner written into every row's user_id column
+        chunk_rows: Rows per COPY/INSERT batch
+
+    Returns:
+        Ingest statistics: method, rows, seconds, rows_per_sec
+    """
+    started = time.perf_counter()
+    if _supports_copy(engine):
+        method = "copy"
+        _copy_into(engine, df, table_name, column_names, user_id, chunk_rows)
+    else:
+        method = "insert"
+        _insert_into(engine, df, table_name, column_names, user_id, chunk_rows)
+    seconds = time.perf_counter() - started
+
+    stats = {
+        "method": method,
+        "rows": int(len(df)),
+        "seconds": round(seconds, 3),
+        "rows_per_sec": int(len(df) / seconds) if seconds > 0 else int(len(df)),
+    }
+    print(f"[INFO] Ingested {stats['rows']} rows into {table_name} via {method} "
+          f"in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec)")
+    return stats
+
+
+def ingest_csv_file(
+    engine: Engine,
+    path: str,
+    table_name: str,
+    user_id: str,
+    memory_budget_bytes: int = UPLOAD_MAX_MEMORY_BYTES,
+    on_progress: Optional[Callable[[int], None]] = None,
+    snapshot_path: Optional[str] = None
+) -> dict:
+    """
+    Parse a CSV file in bounded chunks and load each chunk as it is parsed
+
+    The table is created from the first chunk with the narrowest types that
+    fit it; later chunks widen column types if needed (e.g. smallint ->
+    integer -> double precision, date -> timestamp). Only one chunk is held
+    in memory at a time. A typed column that turns out to need text (a
+    boolean column with a "maybe", a date column with "n/a") is not cast:
+    the table is dropped and the file loaded again with that column read as
+    raw text, so stored values never depend on the chunk size. If anything
+    fails the caller is responsible for dropping the table.
+
+    Args:
+        engine: SQLAlchemy engine owning the table
+        path: CSV file on local disk
+        table_name: Table to create and fill
+        user_id: Owner written into every row's user_id column
+        memory_budget_bytes: Approximate peak memory for one chunk
+        on_progress: Called with the total number of rows loaded after each chunk
+                     (starts over from 0 if the file has to be loaded again)
+        snapshot_path: Also write the rows to this Parquet file (see parquet_snapshot.py)
+
+    Returns:
+        columns, column_types, schema_context, column_stats (see
+        column_stats.py), row_count, snapshot_path (None if not written)
+        and ingest stats
+
+    Raises:
+        InvalidCSVError: If the file is not valid CSV or contains no rows
+    """
+    chunk_rows = estimate_chunk_rows(path, memory_budget_bytes)
+    started = time.perf_counter()
+    # Columns read as raw text from the start, after an earlier pass found
+    # values that only fit text (see lossy_text_widenings)
+    text_positions = set()
+
+    while True:
+        table_columns = kinds = column_types = schema_context = None
+        stats_builder = ColumnStatsBuilder()
+        snapshot = ParquetSnapshotWriter(snapshot_path, user_id) if snapshot_path else None
+        row_count = 0
+        method = None
+        restart_positions = None
+
+        try:
+            dtype = {position: str for position in text_positions} or None
+            with pd.read_csv(path, chunksize=chunk_rows, dtype=dtype) as reader:
+                for chunk in timed_iter(reader, "parse"):
+                    if chunk.empty:
+                        continue
+                    with stage("ddl"):
+                        chunk_kinds = infer_column_kinds(chunk)
+                        for position in text_positions:
+                            chunk_kinds[position] = "text"
+                        if table_columns is None:
+                            table_columns, rename_map = rename_reserved_columns(list(chunk.columns))
+                            if rename_map:
+                                print(f"[DEBUG] Renamed conflicting columns: {rename_map}")
+                            kinds = chunk_kinds
+                            column_types = create_dataset_table(engine, table_name, table_columns, kinds)
+                        else:
+                            restart_positions = lossy_text_widenings(kinds, chunk_kinds)
+                            if restart_positions:
+                                break
+                            if widen_columns(engine, table_name, table_columns, kinds, chunk, chunk_kinds):
+                                column_types = column_types_for(engine, table_columns, kinds)
+                    with stage("parse"):
+                        coerce_frame(chunk, kinds)
+                    with stage("profile"):
+                        stats_builder.update(chunk, table_columns, kinds)
+                    if snapshot is not None:
+                        with stage("snapshot"):
+                            snapshot.write(chunk, table_columns, kinds)
+
+                    with stage("insert"):
+                        stats = bulk_insert_dataframe(engine, chunk, table_name, table_columns, user_id)
+                    method = stats["method"]
+                    with stage("profile"):
+                        chunk_context = build_schema_context(chunk, table_name, column_types)
+                        schema_context = merge_schema_contexts(schema_context, chunk_context)
+                    row_count += len(chunk)
+                    if on_progress:
+                        on_progress(row_count)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            if snapshot is not None:
+                snapshot.abort()
+            raise InvalidCSVError(str(e)) from e
+        except Exception:
+            if snapshot is not None:
+                snapshot.abort()
+            raise
+
+        if not restart_positions:
+            break
+        # Load again from the start with these columns kept as the CSV text
+        names = [table_columns[position] for position in restart_positions]
+        print(f"[INFO] Columns {names} of {table_name} hold text after {row_count} rows; reloading them as text")
+        if snapshot is not None:
+            snapshot.abort()
+        with stage("ddl"):
+            drop_dataset_table(engine, table_name)
+        text_positions.update(restart_positions)
+
+    if row_count == 0:
+        raise InvalidCSVError("CSV file is empty")
+    if snapshot is not None:
+        snapshot.close()
+
+    column_stats = stats_builder.to_dict()
+    seconds = time.perf_counter() - started
+    return {
+        "columns": table_columns,
+        "column_types": column_types,
+        "schema_context": attach_column_stats(schema_context, column_stats),
+        "column_stats": column_stats,
+        "row_count": row_count,
+        "snapshot_path": snapshot_path if snapshot is not None else None,
+        "stats": {
+            "method": method,
+            "rows": row_count,
+            "chunk_rows": chunk_rows,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": int(row_count / seconds) if seconds > 0 else row_count,
+        },
+    }
+
+
+def load_parquet_file(
+    engine: Engine,
+    path: str,
+    table_name: str,
+    user_id: str,
+    on_progress: Optional[Callable[[int], None]] = None
+) -> dict:
+    """
+    Recreate a dataset table from its Parquet snapshot
+
+    Column names and kinds come from the snapshot, so nothing is re-parsed or
+    re-inferred; rows are loaded in row-group sized batches with the same
+    COPY path as CSV ingest. If anything fails the caller is responsible for
+    dropping the table.
+
+    Args:
+        engine: SQLAlchemy engine owning the table
+        path: Parquet snapshot on local disk (see parquet_snapshot.py)
+        table_name: Table to create and fill (must not exist)
+        user_id: Owner written into every row's user_id column
+        on_progress: Called with the total number of rows loaded after each batch
+
+    Returns:
+        columns, column_types, row_count and load stats
+    """
+    started = time.perf_counter()
+    table_columns, kinds = snapshot_columns(path)
+    with stage("ddl"):
+        column_types = create_dataset_table(engine, table_name, table_columns, kinds)
+    row_count = 0
+    method = None
+    for batch in timed_iter(read_snapshot_batches(path), "parse"):
+        with stage("parse"):
+            coerce_frame(batch, kinds)  # nullable integer columns come back as float64
+        with stage("insert"):
+            method = bulk_insert_dataframe(engine, batch, table_name, table_columns, user_id)["method"]
+        row_count += len(batch)
+        if on_progress:
+            on_progress(row_count)
+
+    seconds = time.perf_counter() - started
+    return {
+        "columns": table_columns,
+        "column_types": column_types,
+        "row_count": row_count,
+        "stats": {
+            "method": method,
+            "rows": row_count,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": int(row_count / seconds) if seconds > 0 else row_count,
+        },
+    }
@@ -0,0 +1,164 @@
+"""
+Background Ingestion Jobs
+Runs upload pipelines on a local worker pool and tracks their progress so
+/upload can return immediately and clients poll /jobs/{id} instead of holding
+an HTTP request open for the whole ingest.
+
+Job state is kept in memory for the worker that runs the job and persisted
+(throttled) through a caller-supplied function, so any worker can answer a
+status poll. Jobs still queued or running when their worker stopped are
+marked failed when the app starts again (see interrupted_job_fields).
+"""
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from cache import LRUCache
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+class IngestJob(BaseModel):
+    """State of one background upload"""
+    id: str
+    user_id: str
+    dataset_id: str
+    original_filename: str
+    file_size_bytes: int = 0
+    status: str = "queued"
+    phase: str = "queued"
+    rows_ingested: int = 0
+    rows_per_sec: int = 0
+    error_message: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: str
+    updated_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def interrupted_job_fields() -> dict:
+    """Columns set on a persisted job whose worker stopped before it finished"""
+    now = _now()
+    return {
+        "status": "failed",
+        "phase": "failed",
+        "error_message": "The server restarted before this upload finished. Please upload the file again.",
+        "finished_at": now,
+        "updated_at": now,
+    }
+
+
+class JobManager:
+    """
+    Bounded pool of ingestion workers with progress tracking
+
+    Args:
+        max_workers: Jobs that may run concurrently (others wait in the queue)
+        persist: Called with a job row dict whenever state should be saved
+        load: Called with (job_id, user_id) to fetch a job run by another worker
+        persist_interval: Minimum seconds between progress-only persists
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        persist: Callable[[dict], None],
+        load: Callable[[str, str], Optional[dict]],
+        persist_interval: float = 1.0
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._persist = persist
+        self._load = load
+        self._persist_interval = persist_interval
+        self._jobs = LRUCache(maxsize=1000)
+        self._last_persist = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        user_id: str,
+        dataset_id: str,
+        filename: str,
+        file_size: int,
+        work: Callable[[IngestJob], dict]
+    ) -> IngestJob:
+        """
+        Queue work(job) for background execution
+
+        work returns the final result dict; raising HTTPException (or any
+        exception) marks the job failed with the error detail.
+        """
+        now = _now()
+        job = IngestJob(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            dataset_id=dataset_id,
+            original_filename=filename,
+            file_size_bytes=file_size,
+            created_at=now,
+            updated_at=now,
+        )
+        self._jobs.set(job.id, job)
+        self._save(job, force=True)
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def update(self, job: IngestJob, **fields) -> None:
+        """Record progress (phase, rows_ingested, ...) for a running job"""
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = _now()
+        self._save(job, force="phase" in fields or "status" in fields)
+
+    def get(self, job_id: str, user_id: str) -> Optional[IngestJob]:
+        """Return a job owned by user_id, from memory or the persisted store"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job if job.user_id == user_id else None
+        row = self._load(job_id, user_id)
+        return IngestJob(**row) if row else None
+
+    def _run(self, job: IngestJob, work: Callable[[IngestJob], dict]) -> None:
+        started = time.perf_counter()
+        self.update(job, status="running", phase="starting", started_at=_now())
+        try:
+            result = work(job)
+            self.update(job, status="succeeded", phase="done", result=result, finished_at=_now())
+            print(f"[INFO] Ingest job {job.id} finished in {time.perf_counter() - started:.2f}s")
+        except HTTPException as e:
+            self.update(job, status="failed", phase="failed", error_message=str(e.detail), finished_at=_now())
+            print(f"[ERROR] Ingest job {job.id} failed: {e.detail}")
+        except Exception as e:
+            traceback.print_exc()
+            self.update(job, status="failed", phase="failed", error_message=str(e), finished_at=_now())
+            print(f"[ERROR] Ingest job {job.id} failed: {type(e).__name__}: {str(e)}")
+
+    def _save(self, job: IngestJob, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_persist.get(job.id, 0) < self._persist_interval:
+                return
+            if job.status in ("succeeded", "failed"):
+                self._last_persist.pop(job.id, None)
+            else:
+                self._last_persist[job.id] = now
+            row = job.model_dump()
+        try:
+            self._persist(row)
+        except Exception as e:
+            # Progress tracking must never break the ingest itself
+            print(f"[WARNING] Failed to persist ingest job {job.id}: {str(e)}")
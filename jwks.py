@@ -0,0 +1,148 @@
+"""
+JWKS Key Store
+Public keys for asymmetric JWT verification (RS256 / ES256), held in memory
+by key id so verifying a token never waits on the network.
+
+Keys are loaded from a local JSON file at startup (which is also how a test
+or air-gapped deployment supplies a fixture), refreshed from the JWKS URL on
+a background thread and written back to the file, so a restart has keys even
+if the auth server is unreachable. A token signed with an unknown kid wakes
+the refresher early (rate limited) instead of blocking the request.
+Reference: https://supabase.com/docs/guides/auth/signing-keys
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+import jwt
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class JWKSKeyStore:
+    """
+    In-memory JWKS keyed by kid, with file backing and background refresh
+
+    Args:
+        url: JWKS endpoint (None = only use cache_file)
+        cache_file: JSON file keys are loaded from and saved to (None = memory only)
+        refresh_seconds: Interval between background refreshes
+        min_refresh_seconds: Shortest interval between refreshes triggered by unknown kids
+        timeout_seconds: Network timeout of one fetch
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        cache_file: Optional[str] = None,
+        refresh_seconds: float = 600,
+        min_refresh_seconds: float = 30,
+        timeout_seconds: float = 5
+    ):
+        self.url = url
+        self.cache_file = cache_file
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.timeout_seconds = timeout_seconds
+        self._keys = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_refresh = 0.0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.unknown_kids = 0
+
+    @staticmethod
+    def parse(document: dict) -> dict:
+        """{kid: PyJWK} for the RS256/ES256 keys of a JWKS document (others are skipped)"""
+        keys = {}
+        for data in document.get("keys", []):
+            if data.get("use", "sig") != "sig" or "kid" not in data:
+                continue
+            try:
+                key = jwt.PyJWK(data, algorithm=data.get("alg"))
+            except (jwt.PyJWKError, jwt.InvalidKeyError) as e:
+                print(f"[WARNING] Skipping JWKS key {data.get('kid')}: {str(e)}")
+                continue
+            if key.algorithm_name in ASYMMETRIC_ALGORITHMS:
+                keys[data["kid"]] = key
+        return keys
+
+    def load_file(self) -> int:
+        """Load keys from cache_file if it exists, returning the number of keys"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return 0
+        with open(self.cache_file) as f:
+            self._keys = self.parse(json.load(f))
+        return len(self._keys)
+
+    def refresh(self) -> bool:
+        """Fetch the JWKS from url, swap in its keys and save it to cache_file"""
+        if not self.url:
+            return False
+        self._last_refresh = time.monotonic()
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout_seconds) as response:
+                document = json.load(response)
+            keys = self.parse(document)
+        except Exception as e:
+            self.refresh_failures += 1
+            print(f"[WARNING] JWKS refresh from {self.url} failed: {str(e)}")
+            return False
+
+        self._keys = keys  # replaced whole, so readers never see a partial set
+        self.refreshes += 1
+        if self.cache_file:
+            try:
+                partial = self.cache_file + ".tmp"
+                with open(partial, "w") as f:
+                    json.dump(document, f)
+                os.replace(partial, self.cache_file)
+            except OSError as e:
+                print(f"[WARNING] Could not save JWKS to {self.cache_file}: {str(e)}")
+        return True
+
+    def get_key(self, kid: Optional[str]) -> Optional["jwt.PyJWK"]:
+        """Key for kid from memory; an unknown kid schedules an early refresh"""
+        key = self._keys.get(kid)
+        if key is None:
+            self.unknown_kids += 1
+            self._wake.set()
+        return key
+
+    def start(self, fetch_in_background: bool = False) -> None:
+        """
+        Load the file, fetch once if it had no keys, then refresh in the background
+
+        With fetch_in_background the first fetch is left to the refresher
+        thread too, so starting never waits on the network.
+        """
+        self.load_file()
+        if not self._keys:
+            if fetch_in_background:
+                self._wake.set()
+            else:
+                self.refresh()
+        if self.url and self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="jwks-refresh", daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            self._wake.wait(self.refresh_seconds)
+            self._wake.clear()
+            wait = self.min_refresh_seconds - (time.monotonic() - self._last_refresh)
+            if wait > 0:
+                time.sleep(wait)
+            self.refresh()
+
+    def stats(self) -> dict:
+        return {
+            "keys": sorted(self._keys),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "unknown_kids": self.unknown_kids,
+        }
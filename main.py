@@ -1,11 +1,19 @@
 import os
 import re
+import asyncio
+import contextvars
+import threading
+import functools
 import uuid
 import hashlib
-import pandas as pd
+import importlib.util
 import time
-from io import BytesIO
-from urllib.parse import quote_plus
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+from urllib.parse import quote_plus, urlparse
 from dotenv import load_dotenv
 
 # CRITICAL: Load .env BEFORE any other imports that use environment variables
@@ -13,16 +21,36 @@ load_dotenv()
 
 from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from langchain_groq import ChatGroq
-from langchain_community.utilities import SQLDatabase
-from langchain.chains import create_sql_query_chain
-from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, Float, inspect
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import text, MetaData, Table, Column, Integer, String, Float, inspect
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 
 # Import Supabase authentication and configuration
-from backend_auth import get_current_user, AuthUser
+from backend_auth import get_current_user, start_jwks_refresh, token_cache_stats, AuthUser
 from supabase_config import supabase, STORAGE_BUCKET_NAME, SUPABASE_URL
+from cache import LRUCache
+from db_pool import DatabasePool
+from answer_cache import AnswerCache
+from history_writer import HistoryWriter
+from timing import ServerTimingMiddleware, collect_stages, render_metrics, stage
+from dataset_cache import DatasetMetadataCache
+from jobs import UNFINISHED_STATUSES, JobManager, IngestJob, interrupted_job_fields
+from index_advisor import advise_indexes, existing_advisor_indexes
+from semantic_cache import SemanticQuestionIndex
+from query_results import (
+    DEFAULT_PAGE_SIZE, EXPORT_FORMATS, QueryTimeoutError,
+    decode_cursor, execute_guarded, fetch_page, stream_export
+)
+from sql_rewrite import SQLRewriteCache, UnsafeSQLError, SQLGLOT_DIALECTS, USER_ID_PARAM
+
+# The LLM (langchain) and dataframe (pandas, via ingest/type_inference/
+# column_stats/dataset_context) stacks take over a second to import, so they
+# are imported where first used - or ahead of time by prewarm() - instead of
+# at worker start
+if TYPE_CHECKING:
+    import pandas as pd
+    from langchain_groq import ChatGroq
 
 # 1. Verify Environment Variables Loaded
 api_key = os.getenv("GROQ_API_KEY")
@@ -46,33 +74,104 @@ if not DATABASE_URL:
 
 print("[INFO] Using DATABASE_URL from environment variable")
 # okay to use as is
-# Create database engine
-db_engine = create_engine(
+# Create the shared database engine - every query, ingest and advisor run
+# uses it (see db_pool.py). Per worker at most DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections are open; DB_POOL_SIZE=0 keeps none and leaves pooling to
+# Supavisor. DB_POOLER_MODE=auto treats port 6543 as the transaction pooler.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE")) if os.getenv("DB_POOL_RECYCLE") else None
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOLER_MODE = os.getenv("DB_POOLER_MODE", "auto").lower()
+
+db_pool = DatabasePool(
     DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={"connect_timeout": 10}
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pooler_mode=DB_POOLER_MODE,
+    pre_ping=DB_POOL_PRE_PING
+)
+db_engine = db_pool.engine
+print(
+    f"[INFO] Database pool: "
+    + (f"{db_pool.pool_size} connections + {db_pool.max_overflow} overflow" if db_pool.pool_size else "none (NullPool)")
+    + (", transaction pooler mode" if db_pool.transaction_pooler else "")
 )
 
-# Test connection - fail fast if it doesn't work
-try:
+def ping_database() -> None:
     with db_engine.connect() as conn:
         conn.execute(text("SELECT 1"))
-    
-    # Parse and log connection info
-    from urllib.parse import urlparse
+
+# Startup checks run in the app lifespan (after import, so a worker imports
+# quickly), not at import time:
+#   STARTUP_DB_CHECK=wait        test the connection before serving; fail fast if it doesn't work
+#   STARTUP_DB_CHECK=background  serve immediately; /readyz reports 503 until the database answers
+#   STARTUP_DB_CHECK=off         only /readyz and /health test the connection
+# STARTUP_PREWARM imports the LLM and dataframe stacks on a background thread
+# so the first /ask or /upload doesn't pay for them.
+STARTUP_DB_CHECK = os.getenv("STARTUP_DB_CHECK", "wait").lower()
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "true").lower() == "true"
+database_ready = threading.Event()
+
+def check_database() -> None:
+    """Test the database connection, raising RuntimeError with a readable message if it fails"""
+    try:
+        ping_database()
+    except Exception as e:
+        print(f"[CRITICAL] Database connection failed: {type(e).__name__}")
+        print(f"[DETAIL] {str(e)}")
+        raise RuntimeError(
+            f"Cannot connect to database. Check your DATABASE_URL in .env file.\n"
+            f"Error: {str(e)}"
+        )
     parsed = urlparse(DATABASE_URL)
     print(f"[SUCCESS] Connected to: {parsed.hostname}:{parsed.port}")
-except Exception as e:
-    print(f"[CRITICAL] Database connection failed: {type(e).__name__}")
-    print(f"[DETAIL] {str(e)}")
-    raise RuntimeError(
-        f"Cannot connect to database. Check your DATABASE_URL in .env file.\n"
-        f"Error: {str(e)}"
-    )
+    database_ready.set()
+
+def _check_database_in_background() -> None:
+    try:
+        check_database()
+    except RuntimeError:
+        pass  # already logged; /readyz keeps retrying
+
+def prewarm() -> None:
+    """Import the lazily loaded stacks and create the clients before the first request needs them"""
+    started = time.perf_counter()
+    try:
+        import ingest, column_stats, dataset_context  # noqa: F401 - pandas, numpy, pyarrow
+        build_sql_query_chain(get_llm(), "")
+        supabase.get_client()
+        format_rows([])
+    except Exception as e:
+        print(f"[WARNING] Prewarm failed (imports will happen on first use): {type(e).__name__}: {str(e)}")
+        return
+    print(f"[INFO] Prewarmed LLM and dataframe stacks in {time.perf_counter() - started:.2f}s")
 
 # 2. Setup the App
-app = FastAPI(title="Chat with Database API - Supabase Edition")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    start_jwks_refresh()
+    if STARTUP_DB_CHECK == "wait":
+        await loop.run_in_executor(None, check_database)
+    elif STARTUP_DB_CHECK == "background":
+        threading.Thread(target=_check_database_in_background, name="db-check", daemon=True).start()
+    if STARTUP_PREWARM:
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    # Fail jobs a stopped worker left unfinished so /jobs/{id} polls end
+    updated_before = (datetime.now(timezone.utc) - timedelta(seconds=INGEST_JOB_STALE_SECONDS)).isoformat()
+    threading.Thread(
+        target=_fail_interrupted_ingest_jobs_in_background, args=(updated_before,),
+        name="job-sweep", daemon=True
+    ).start()
+    yield
+    # Write query_history rows still queued before the worker exits
+    await loop.run_in_executor(None, history_writer.close)
+
+app = FastAPI(title="Chat with Database API - Supabase Edition", lifespan=lifespan)
 
 # CORS Configuration - Allow frontend from localhost for local development and production
 app.add_middleware(
@@ -87,6 +186,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage timings (auth, metadata, llm, sql, parse, insert, ...) in a
+# Server-Timing header on every response and as histograms on /metrics
+app.add_middleware(ServerTimingMiddleware)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -98,9 +201,17 @@ async def root():
         "storage": "Supabase Storage",
         "endpoints": {
             "upload": "POST /upload - Upload a CSV file (requires authentication)",
+            "jobs": "GET /jobs/{job_id} - Progress of a background upload (requires authentication)",
             "ask": "POST /ask - Ask questions about your data (requires authentication)",
+            "query_rows": "GET /queries/{query_id}/rows - Next pages of an /ask result (requires authentication)",
+            "query_export": "GET /queries/{query_id}/export - Stream a full /ask result as NDJSON or CSV (requires authentication)",
             "datasets": "GET /datasets - List your uploaded datasets (requires authentication)",
-            "health": "GET /health - Health check"
+            "dataset_reload": "POST /datasets/{dataset_id}/reload - Rebuild a dataset table from its stored Parquet file (requires authentication)",
+            "dataset_profile": "GET /datasets/{dataset_id}/profile - Per-column statistics computed at upload (requires authentication)",
+            "dataset_indexes": "GET /datasets/{dataset_id}/indexes - Advisor-managed indexes and last report (requires authentication)",
+            "health": "GET /health - Health check",
+            "readiness": "GET /readyz - 503 until the database answers",
+            "metrics": "GET /metrics - Request, stage and connection pool metrics (Prometheus format)"
         },
         "docs": "/docs"
     }
@@ -109,13 +220,27 @@ async def root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: 200 once the database has answered, 503 until then"""
+    if not database_ready.is_set():
+        try:
+            await run_blocking(check_database)
+        except RuntimeError:
+            raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request and stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(render_metrics() + db_pool.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check_detailed():
     """Health check endpoint for monitoring"""
     try:
         # Test database connection
-        with db_engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        await run_blocking(ping_database)
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)[:100]}"
@@ -124,9 +249,39 @@ async def health_check_detailed():
         "status": "healthy" if "connected" in db_status else "degraded",
         "database": db_status,
         "storage": "configured",
-        "server": "running"
+        "server": "running",
+        "auth_cache": token_cache_stats(),
+        "dataset_cache": dataset_cache.stats(),
+        "query_history": history_writer.stats(),
+        "db_pool": db_pool.stats()
     }
 
+# ============ BLOCKING WORK ============
+# supabase-py, SQLAlchemy/psycopg2 and pandas are all synchronous. Async
+# endpoints hand that work to a bounded thread pool so a slow Groq call or
+# bulk load never stalls the event loop (and every other request on it).
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "2"))
+
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+# Side steps of an upload (storage upload, naming) that run next to the table
+# load. Kept separate from blocking_executor, whose threads wait on them.
+UPLOAD_STEP_POOL_SIZE = int(os.getenv("UPLOAD_STEP_POOL_SIZE", "8"))
+upload_step_executor = ThreadPoolExecutor(max_workers=UPLOAD_STEP_POOL_SIZE, thread_name_prefix="upload")
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+ingest_slots = threading.BoundedSemaphore(INGEST_MAX_CONCURRENCY)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the shared thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(blocking_executor, call)
+
+def submit_upload_step(func, *args, **kwargs) -> Future:
+    """Start a blocking upload step on the upload step pool"""
+    return upload_step_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
 # ============ AUTHENTICATION IS NOW HANDLED BY FRONTEND ============
 # All auth endpoints removed - Supabase Auth handles:
 # - Email/password signup & login
@@ -139,6 +294,16 @@ async def health_check_detailed():
 
 # ============ HELPER FUNCTIONS ============
 
+# Uploads are spooled to local disk in chunks of this size (never fully in memory)
+UPLOAD_READ_CHUNK_BYTES = int(os.getenv("UPLOAD_READ_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None  # None = system temp dir
+
+# Every upload is also stored as a typed, compressed Parquet file (see
+# parquet_snapshot.py) that tables are reloaded from; the raw CSV is optional.
+# Without pyarrow only the CSV is stored.
+PARQUET_ARTIFACTS_ENABLED = os.getenv("PARQUET_ARTIFACTS_ENABLED", "true").lower() == "true" and importlib.util.find_spec("pyarrow") is not None
+STORE_RAW_CSV = os.getenv("STORE_RAW_CSV", "true").lower() == "true" or not PARQUET_ARTIFACTS_ENABLED
+
 def generate_table_name(user_id: str, filename: str) -> str:
     """Generate a unique table name for user's dataset"""
     # Remove file extension and special characters
@@ -207,92 +372,674 @@ def generate_unique_dataset_name(base_name: str, user_id: str) -> str:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"{base_name}_{timestamp}"
 
-def create_dynamic_table_from_dataframe(df: pd.DataFrame, table_name: str, user_id: str):
+def create_dynamic_table_from_dataframe(df: "pd.DataFrame", table_name: str, user_id: str):
     """
     Create a PostgreSQL table dynamically from DataFrame with user_id column
     Reference: https://docs.sqlalchemy.org/en/20/core/metadata.html
+    
+    Uploads stream CSV files through ingest_csv_file() instead; this is for
+    data that is already in memory as a DataFrame.
     """
+    from ingest import bulk_insert_dataframe, create_dataset_table, rename_reserved_columns
+    from type_inference import infer_column_kinds, coerce_frame
     try:
         print(f"[DEBUG] Creating table {table_name} for user {user_id}")
-        metadata = MetaData()
-        
-        # Rename conflicting columns (id, user_id) to avoid conflicts with system columns
-        df_renamed = df.copy()
-        rename_map = {}
-        for col in df_renamed.columns:
-            col_lower = col.lower()
-            if col_lower == 'id':
-                rename_map[col] = 'original_id'
-            elif col_lower == 'user_id':
-                rename_map[col] = 'original_user_id'
+        
+        # Rename conflicting columns (id, user_id) to avoid conflicts with system columns.
+        # Only the column names are renamed - the data is loaded positionally,
+        # so the DataFrame itself is never copied.
+        table_columns, rename_map = rename_reserved_columns(list(df.columns))
         if rename_map:
-            df_renamed = df_renamed.rename(columns=rename_map)
             print(f"[DEBUG] Renamed conflicting columns: {rename_map}")
         
-        # Define columns based on DataFrame dtypes
-        columns = [
-            Column('id', Integer, primary_key=True, autoincrement=True),
-            Column('user_id', String, nullable=False, index=True)  # Add user_id for RLS
-        ]
-        
-        for col_name in df_renamed.columns:
-            dtype = df_renamed[col_name].dtype
-            if dtype == 'int64':
-                sql_type = Integer
-            elif dtype == 'float64':
-                sql_type = Float
-            else:
-                sql_type = String
-            columns.append(Column(col_name, sql_type))
-        
-        # Create table
+        # Create table with the narrowest column types that fit the data
         print(f"[DEBUG] Creating table structure...")
-        table = Table(table_name, metadata, *columns)
-        metadata.create_all(db_engine)
+        kinds = infer_column_kinds(df)
+        coerce_frame(df, kinds)
+        column_types = create_dataset_table(db_engine, table_name, table_columns, kinds)
         print(f"[DEBUG] Table created successfully")
         
-        # Insert data with user_id
-        df_with_user = df_renamed.copy()
-        df_with_user.insert(0, 'user_id', user_id)
-        
-        print(f"[DEBUG] Inserting {len(df_with_user)} rows...")
-        with db_engine.connect() as conn:
-            df_with_user.to_sql(
-                table_name,
-                conn,
-                if_exists='append',
-                index=False,
-                method='multi'
-            )
-            conn.commit()
+        # Stream rows in with COPY (INSERT fallback on non-PostgreSQL engines)
+        print(f"[DEBUG] Inserting {len(df)} rows...")
+        ingest_stats = bulk_insert_dataframe(db_engine, df, table_name, table_columns, user_id)
         print(f"[DEBUG] Data inserted successfully")
         
-        return table_name, list(df_renamed.columns)
+        return table_name, table_columns, column_types, ingest_stats
     except Exception as e:
         print(f"[ERROR] Failed to create table: {type(e).__name__}: {str(e)}")
         import traceback
         traceback.print_exc()
         raise
 
-# 3. HELPER: Function to get the user's database connection
-def get_user_db_chain(user_id: str, table_name: str):
+def drop_dataset_table(table_name: str) -> None:
+    """Drop a dataset table (used to roll back failed uploads)"""
+    with db_engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        conn.commit()
+    invalidate_db_chain(table_name)
+
+def remove_upload_artifacts(storage_path: str, table_name: str = None) -> None:
+    """Best-effort rollback of a failed upload: storage objects and (optionally) table"""
+    try:
+        supabase.storage.from_(STORAGE_BUCKET_NAME).remove([storage_path, snapshot_storage_path(storage_path)])
+    except Exception as e:
+        print(f"[WARNING] Upload rollback could not remove {storage_path}: {str(e)}")
+    if table_name:
+        if snapshot_cache is not None:
+            snapshot_cache.discard(table_name)
+        try:
+            drop_dataset_table(table_name)
+        except Exception as e:
+            print(f"[WARNING] Upload rollback could not drop {table_name}: {str(e)}")
+
+def write_spool_chunk(spool, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    spool.write(chunk)
+
+async def spool_upload(file: UploadFile) -> tuple:
+    """
+    Copy an upload to a local temporary file, hashing it on the way
+    
+    The file is read in UPLOAD_READ_CHUNK_BYTES pieces, so neither the raw
+    bytes nor the SHA-256 computation need the whole file in memory.
+    
+    Returns:
+        (temporary file path, size in bytes, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    # File creation, writes and hashing are blocking; only the reads from the
+    # client stay on the event loop
+    spool = await run_blocking(
+        tempfile.NamedTemporaryFile, prefix="upload_", suffix=".csv", dir=UPLOAD_SPOOL_DIR, delete=False
+    )
+    try:
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                await run_blocking(write_spool_chunk, spool, digest, chunk)
+                size += len(chunk)
+        finally:
+            await run_blocking(spool.close)
+    except Exception:
+        await run_blocking(os.unlink, spool.name)
+        raise
+    return spool.name, size, digest.hexdigest()
+
+# 3. HELPER: Function to get the user's SQL generation chain
+# Chains are cached per table so repeated questions reuse the same prompt and
+# LLM client instead of rebuilding them. The prompt's table info comes from the
+# schema_context stored at upload time, so building a chain needs no database
+# round trip; datasets uploaded before schema_context existed fall back to a
+# one-off reflection on the shared db_engine pool.
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "64"))
+chain_cache = LRUCache(maxsize=CHAIN_CACHE_SIZE)
+_llm = None
+
+def get_llm() -> "ChatGroq":
+    """Return the shared Groq chat model (created on first use)"""
+    global _llm
+    if _llm is None:
+        from langchain_groq import ChatGroq
+        _llm = ChatGroq(model="llama-3.3-70b-versatile", groq_api_key=api_key)
+    return _llm
+
+def build_sql_query_chain(llm, table_info: str, top_k: int = 5):
+    """
+    Equivalent of langchain's create_sql_query_chain with a fixed table_info
+    
+    create_sql_query_chain calls db.get_table_info() on every invoke (schema
+    reflection + sample query); here the table info is bound into the prompt once.
+    """
+    from langchain.chains.sql_database.prompt import SQL_PROMPTS, PROMPT
+    from langchain.chains.sql_database.query import _strip
+    from langchain_core.output_parsers import StrOutputParser
+    
+    dialect = db_engine.dialect.name
+    prompt = SQL_PROMPTS.get(dialect, PROMPT)
+    if "dialect" in prompt.input_variables:
+        prompt = prompt.partial(dialect=dialect)
+    prompt = prompt.partial(top_k=str(top_k), table_info=table_info)
+    return (
+        {"input": lambda x: x["question"] + "\nSQLQuery: "}
+        | prompt
+        | llm.bind(stop=["\nSQLResult:"])
+        | StrOutputParser()
+        | _strip
+    )
+
+def get_user_db_chain(user_id: str, table_name: str, schema_context: dict = None):
     """
     Create LangChain SQL chain for user's specific table
     Only allows access to user's own data through table name restriction
+    
+    Chains are cached by table name (LRU, CHAIN_CACHE_SIZE entries) and must be
+    invalidated with invalidate_db_chain() when the table is dropped.
     """
     if not table_name:
         raise HTTPException(status_code=400, detail="No dataset specified")
     
-    # Create database URI with schema public
-    db = SQLDatabase.from_uri(
-        DATABASE_URL,
-        include_tables=[table_name],  # Restrict to user's table only
-        sample_rows_in_table_info=3
+    cached = chain_cache.get(table_name)
+    if cached is not None:
+        return cached
+    
+    if schema_context:
+        from dataset_context import render_table_info
+        table_info = render_table_info(schema_context)
+    else:
+        # Legacy dataset without stored context: reflect once on the shared engine
+        from langchain_community.utilities import SQLDatabase
+        db = SQLDatabase(
+            db_engine,
+            include_tables=[table_name],  # Restrict to user's table only
+            sample_rows_in_table_info=3
+        )
+        table_info = db.get_table_info()
+    
+    chain = build_sql_query_chain(get_llm(), table_info)
+    chain_cache.set(table_name, chain)
+    return chain
+
+def invalidate_db_chain(table_name: str) -> None:
+    """Drop the cached chain for a table (call after the table is dropped)"""
+    chain_cache.pop(table_name)
+
+# Answers are cached per (dataset_id, normalized question); dataset ids are
+# immutable per upload, so entries only need invalidating when a dataset is
+# deleted (a re-upload always gets a new dataset_id)
+answer_cache = AnswerCache(
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+)
+
+def load_user_datasets(user_id: str) -> list:
+    return supabase.table("user_datasets")\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .order("created_at", desc=True)\
+        .execute().data
+
+# A user's user_datasets rows, so /ask and the dataset endpoints skip the
+# metadata round trip to Supabase; uploads write through and deletes evict.
+# With DATASET_CACHE_REDIS_URL all workers share one cache.
+dataset_cache = DatasetMetadataCache(
+    load_user_datasets,
+    maxsize=int(os.getenv("DATASET_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("DATASET_CACHE_TTL_SECONDS", "60")),
+    redis_url=os.getenv("DATASET_CACHE_REDIS_URL") or None
+)
+
+async def get_user_dataset(dataset_id: str, user_id: str) -> dict:
+    """The user's dataset row from the metadata cache (None if they have no such dataset)"""
+    return await run_blocking(dataset_cache.get, user_id, dataset_id)
+
+# Paraphrased questions reuse SQL generated for an earlier, similar question
+# (the SQL is still executed, so answers stay fresh)
+semantic_index = SemanticQuestionIndex(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    max_questions=int(os.getenv("SEMANTIC_CACHE_QUESTIONS_PER_DATASET", "256"))
+)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+
+# Optional local execution: /ask queries run in DuckDB over a Parquet snapshot
+# of the dataset written at upload (see columnar_engine.py). Snapshots are
+# cached on local disk and fetched from storage on a miss; PostgreSQL stays
+# the fallback for datasets without a snapshot and SQL DuckDB can't run.
+LOCAL_ENGINE_ENABLED = os.getenv("LOCAL_ENGINE_ENABLED", "false").lower() == "true"
+LOCAL_ENGINE_CACHE_DIR = os.getenv("LOCAL_ENGINE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "dataset_snapshots")
+LOCAL_ENGINE_CACHE_MB = int(os.getenv("LOCAL_ENGINE_CACHE_MB", "2048"))
+LOCAL_ENGINE_THREADS = int(os.getenv("LOCAL_ENGINE_THREADS", "0"))
+LOCAL_ENGINE_MEMORY_LIMIT = os.getenv("LOCAL_ENGINE_MEMORY_LIMIT") or None
+
+if LOCAL_ENGINE_ENABLED:
+    from columnar_engine import LocalEngineError, LocalQueryEngine, SnapshotCache, local_engine_available
+else:
+    LocalEngineError = None
+
+if LOCAL_ENGINE_ENABLED and not local_engine_available():
+    print("[WARNING] LOCAL_ENGINE_ENABLED is set but duckdb/pyarrow are not installed; using PostgreSQL only")
+    LOCAL_ENGINE_ENABLED = False
+
+def snapshot_storage_path(storage_path: str) -> str:
+    """Storage object of a dataset's Parquet file (in the upload's folder)"""
+    return f"{storage_path.rsplit('/', 1)[0]}/snapshot.parquet"
+
+def download_snapshot(storage_object: str, destination: str) -> None:
+    data = supabase.storage.from_(STORAGE_BUCKET_NAME).download(storage_object)
+    with open(destination, "wb") as f:
+        f.write(data)
+
+if LOCAL_ENGINE_ENABLED:
+    snapshot_cache = SnapshotCache(
+        LOCAL_ENGINE_CACHE_DIR, LOCAL_ENGINE_CACHE_MB * 1024 * 1024, fetch=download_snapshot
+    )
+    local_engine = LocalQueryEngine(
+        snapshot_cache, threads=LOCAL_ENGINE_THREADS, memory_limit=LOCAL_ENGINE_MEMORY_LIMIT
+    )
+else:
+    snapshot_cache = local_engine = None
+
+def run_sql(sql: str, params: dict = None, dataset: dict = None) -> dict:
+    """
+    Execute generated SQL under the query guards (statement timeout, LIMIT
+    clamp, row/byte budget - see execute_guarded), on the local engine when
+    it has the dataset's snapshot and on the shared engine otherwise
+    
+    Returns:
+        execute_guarded() result plus "engine" ("local" or "postgres") and
+        "text", formatted like SQLDatabase.run(): str() of a list of row
+        tuples with long values truncated, or "" when no rows are returned
+    """
+    result = None
+    if local_engine is not None and dataset is not None:
+        try:
+            result = local_engine.execute_guarded(
+                dataset["table_name"], snapshot_storage_path(dataset["storage_path"]), sql, params
+            )
+            result["engine"] = "local"
+        except LocalEngineError as e:
+            print(f"[DEBUG] Local engine fallback for {dataset['table_name']}: {str(e)[:200]}")
+    if result is None:
+        result = execute_guarded(db_engine, sql, params)
+        result["engine"] = "postgres"
+    result["text"] = format_rows(result["rows"])
+    return result
+
+def fetch_result_page(sql: str, params: dict = None, limit: int = DEFAULT_PAGE_SIZE, dataset: dict = None) -> dict:
+    """First page of a "table" mode result (local engine first, like run_sql)"""
+    if local_engine is not None and dataset is not None:
+        try:
+            return local_engine.fetch_page(
+                dataset["table_name"], snapshot_storage_path(dataset["storage_path"]), sql, params, limit
+            )
+        except LocalEngineError as e:
+            print(f"[DEBUG] Local engine fallback for {dataset['table_name']}: {str(e)[:200]}")
+    return fetch_page(db_engine, sql, params, limit)
+
+def format_rows(rows) -> str:
+    """str() of row tuples with long values truncated, as SQLDatabase.run() does"""
+    from langchain_community.utilities.sql_database import truncate_word
+    rows = [tuple(truncate_word(value, length=300) for value in row) for row in rows]
+    return str(rows) if rows else ""
+
+# Parsed and tenant-scoped SQL, memoized by normalized text (user-independent:
+# the user id is bound as :user_id at execution time)
+SQL_REWRITE_CACHE_SIZE = int(os.getenv("SQL_REWRITE_CACHE_SIZE", "2048"))
+sql_rewriter = SQLRewriteCache(
+    maxsize=SQL_REWRITE_CACHE_SIZE,
+    dialect=SQLGLOT_DIALECTS.get(db_engine.dialect.name, "postgres")
+)
+
+def scope_sql_to_user(sql: str, allowed_tables: set = None) -> str:
+    """
+    Execution SQL for generated SQL: every table it reads is filtered on
+    user_id (bind USER_ID_PARAM). The version shown to users has no filter.
+    
+    Raises:
+        UnsafeSQLError: If the SQL is not a single SELECT over allowed_tables
+    """
+    return sql_rewriter.rewrite(sql, allowed_tables).sql
+
+# query_history rows are queued and inserted in batches by a background
+# thread (see history_writer.py), so logging adds no latency to /ask
+def insert_history_rows(rows: list) -> None:
+    with stage("history_write"):
+        supabase.table("query_history").insert(rows).execute()
+
+history_writer = HistoryWriter(
+    insert_history_rows,
+    max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_SECONDS", "1"))
+)
+
+# Executed /ask queries by query_id, so result pages and exports can re-run
+# them without trusting SQL sent by the client. Entries that expired (or were
+# run on another worker) are recovered from query_history, which can lag a
+# query by up to HISTORY_FLUSH_SECONDS.
+QUERY_REGISTRY_SIZE = int(os.getenv("QUERY_REGISTRY_SIZE", "4096"))
+QUERY_REGISTRY_TTL_SECONDS = float(os.getenv("QUERY_REGISTRY_TTL_SECONDS", "3600"))
+query_registry = LRUCache(maxsize=QUERY_REGISTRY_SIZE, ttl=QUERY_REGISTRY_TTL_SECONDS)
+
+def resolve_query(query_id: str, user_id: str):
+    """
+    Execution SQL of an earlier /ask query owned by user_id, or None
+    
+    Users can write their own query_history rows, so SQL read back from it is
+    re-validated against the table of the dataset it was asked about, exactly
+    as /ask validates generated SQL.
+    """
+    entry = query_registry.get(query_id)
+    if entry is not None:
+        return entry["sql"] if entry["user_id"] == user_id else None
+    response = supabase.table("query_history")\
+        .select("generated_sql, dataset_id")\
+        .eq("id", query_id)\
+        .eq("user_id", user_id)\
+        .eq("success", True)\
+        .execute()
+    if not response.data:
+        return None
+    row = response.data[0]
+    dataset = dataset_cache.get(user_id, row["dataset_id"]) if row.get("dataset_id") else None
+    if dataset is None:
+        return None  # the dataset was deleted
+    try:
+        execution_sql = scope_sql_to_user(row["generated_sql"], {dataset["table_name"]})
+    except UnsafeSQLError:
+        return None
+    query_registry.set(query_id, {"user_id": user_id, "sql": execution_sql})
+    return execution_sql
+
+# ============ INDEX ADVISOR ============
+# Every Nth successful query on a dataset re-runs the advisor in the
+# background; it indexes the columns query_history shows are filtered,
+# joined, grouped or sorted on most (see index_advisor.py)
+INDEX_ADVISOR_ENABLED = os.getenv("INDEX_ADVISOR_ENABLED", "true").lower() == "true"
+INDEX_ADVISOR_EVERY_N_QUERIES = int(os.getenv("INDEX_ADVISOR_EVERY_N_QUERIES", "50"))
+INDEX_ADVISOR_MAX_INDEXES = int(os.getenv("INDEX_ADVISOR_MAX_INDEXES", "3"))
+INDEX_ADVISOR_MIN_USES = int(os.getenv("INDEX_ADVISOR_MIN_USES", "3"))
+INDEX_ADVISOR_MIN_ROWS = int(os.getenv("INDEX_ADVISOR_MIN_ROWS", "10000"))
+INDEX_ADVISOR_HISTORY_LIMIT = int(os.getenv("INDEX_ADVISOR_HISTORY_LIMIT", "500"))
+
+# One advisor run at a time per worker: index builds compete with queries for I/O
+index_advisor_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+index_advisor_counts = LRUCache(maxsize=4096)
+index_advisor_lock = threading.Lock()
+
+def run_index_advisor(dataset: dict) -> dict:
+    """
+    Re-plan a dataset table's advisor indexes from its query history (blocking)
+    
+    The report is stored in user_datasets.index_report and returned.
+    """
+    table_name = dataset["table_name"]
+    history = supabase.table("query_history")\
+        .select("generated_sql")\
+        .eq("dataset_id", dataset["id"])\
+        .eq("success", True)\
+        .order("created_at", desc=True)\
+        .limit(INDEX_ADVISOR_HISTORY_LIMIT)\
+        .execute()
+    report = advise_indexes(
+        db_engine,
+        table_name,
+        dataset["column_names"],
+        [row["generated_sql"] for row in history.data],
+        max_indexes=INDEX_ADVISOR_MAX_INDEXES,
+        min_uses=INDEX_ADVISOR_MIN_USES,
+        prepare=lambda sql: scope_sql_to_user(sql, {table_name}),
+        params={USER_ID_PARAM: dataset["user_id"]},
+        dialect=sql_rewriter.dialect
     )
+    try:
+        supabase.table("user_datasets")\
+            .update({"index_report": report})\
+            .eq("id", dataset["id"])\
+            .execute()
+        dataset_cache.update(dataset["user_id"], dataset["id"], {"index_report": report})
+    except Exception as e:
+        print(f"[WARNING] Failed to save index advisor report: {str(e)}")
+    return report
+
+def _run_index_advisor_in_background(dataset: dict) -> None:
+    try:
+        run_index_advisor(dataset)
+    except Exception as e:
+        print(f"[ERROR] Index advisor failed for {dataset['table_name']}: {type(e).__name__}: {str(e)}")
+
+def note_query_for_index_advisor(dataset: dict) -> None:
+    """Count a successful query on a dataset, scheduling the advisor every Nth time"""
+    if not INDEX_ADVISOR_ENABLED or (dataset.get("row_count") or 0) < INDEX_ADVISOR_MIN_ROWS:
+        return
+    with index_advisor_lock:
+        count = index_advisor_counts.get(dataset["id"], 0) + 1
+        index_advisor_counts.set(dataset["id"], count)
+    if count % INDEX_ADVISOR_EVERY_N_QUERIES == 0:
+        index_advisor_executor.submit(_run_index_advisor_in_background, dataset)
+
+# ============ UPLOAD PIPELINE ============
+
+def store_parquet(snapshot_path: str, storage_object: str) -> None:
+    """Upload a dataset's Parquet file to Supabase Storage"""
+    with stage("storage"):
+        supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
+            path=storage_object,
+            file=snapshot_path,
+            file_options={"content-type": "application/vnd.apache.parquet", "x-upsert": "true"}
+        )
+
+def run_upload_pipeline(upload: dict, job: IngestJob = None) -> dict:
+    """
+    Store, ingest and register a validated upload (blocking)
+    
+    Runs either on the request's thread pool (inline uploads) or on the
+    ingest worker pool (background uploads, with progress reported on job).
+    Dataset naming and the CSV storage upload run concurrently with the table
+    load, so the pipeline takes about as long as its slowest step. The
+    Parquet file written during the load is uploaded once it is complete.
+    Every failure rolls back whatever was already created and raises
+    HTTPException. The spooled file is always deleted at the end.
+    
+    Args:
+        upload: user_id, dataset_id, filename, table_name, storage_path,
+                spool_path, file_size and file_hash of the upload
+        job: Background job to report progress on (None for inline uploads)
+        
+    Returns:
+        The /upload success response
+    """
+    from ingest import ingest_csv_file, InvalidCSVError
+    
+    user_id = upload["user_id"]
+    table_name = upload["table_name"]
+    storage_path = upload["storage_path"]
+    spool_path = upload["spool_path"]
+    parquet_object = snapshot_storage_path(storage_path)
+    if snapshot_cache is not None:
+        parquet_file = snapshot_cache.staging_path(table_name)
+    elif PARQUET_ARTIFACTS_ENABLED:
+        parquet_file = spool_path + ".parquet"
+    else:
+        parquet_file = None
+    
+    def report(**fields):
+        if job is not None:
+            ingest_jobs.update(job, **fields)
+    
+    def store_upload():
+        # Upload to Supabase Storage
+        # Reference: https://supabase.com/docs/reference/python/storage-upload
+        with stage("storage"):
+            supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
+                path=storage_path,
+                file=spool_path,
+                file_options={
+                    "content-type": "text/csv",
+                    "x-upsert": "false"  # Prevent overwriting
+                }
+            )
     
-    llm = ChatGroq(model="llama-3.3-70b-versatile", groq_api_key=api_key)
-    chain = create_sql_query_chain(llm, db)
-    return chain, db
+    try:
+        # Naming, the storage upload and the table load are independent, so the
+        # first two run on the upload step pool while this thread ingests.
+        # Every branch is waited for before anything is rolled back or returned.
+        base_name = upload["filename"].rsplit('.', 1)[0]
+        naming = submit_upload_step(generate_unique_dataset_name, base_name, user_id)
+        if STORE_RAW_CSV:
+            storing = submit_upload_step(store_upload)
+        else:
+            storing = Future()
+            storing.set_result(None)
+        
+        # Create PostgreSQL table and stream the data in, one bounded chunk at a time.
+        # The LLM prompt context is accumulated from the chunks as they pass through.
+        ingest_error = None
+        try:
+            report(phase="waiting_for_ingest_slot")
+            with ingest_slots:
+                report(phase="ingest")
+                ingest_started = time.perf_counter()
+                
+                def on_progress(rows: int):
+                    # Stop loading early if the storage upload has already failed
+                    if storing.done() and storing.exception() is not None:
+                        raise storing.exception()
+                    elapsed = time.perf_counter() - ingest_started
+                    report(rows_ingested=rows, rows_per_sec=int(rows / elapsed) if elapsed > 0 else rows)
+                
+                print(f"[DEBUG] Creating table {table_name} for user {user_id}")
+                ingest_result = ingest_csv_file(
+                    db_engine, spool_path, table_name, user_id, on_progress=on_progress,
+                    snapshot_path=parquet_file
+                )
+        except Exception as e:
+            ingest_error = e
+        
+        if not storing.done():
+            report(phase="storage")
+        wait([naming, storing])
+        dataset_name = naming.result()  # never raises: falls back to a timestamped name
+        storage_error = storing.exception()
+        
+        if storage_error is not None or ingest_error is not None:
+            # Rollback: delete from storage and drop the (partially) loaded table
+            remove_upload_artifacts(storage_path, table_name)
+            if storage_error is not None:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to upload to storage: {str(storage_error)}"
+                )
+            if isinstance(ingest_error, InvalidCSVError):
+                raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(ingest_error)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to create database table: {str(ingest_error)}"
+            )
+        
+        renamed_columns = ingest_result["columns"]
+        row_count = ingest_result["row_count"]
+        ingest_stats = ingest_result["stats"]
+        print(f"[INFO] Ingested {row_count} rows into {table_name} "
+              f"({ingest_stats['rows_per_sec']} rows/sec, {ingest_stats['chunk_rows']} rows per chunk)")
+        
+        parquet_bytes = None
+        if ingest_result["snapshot_path"]:
+            report(phase="storage")
+            try:
+                parquet_bytes = os.path.getsize(ingest_result["snapshot_path"])
+                store_parquet(ingest_result["snapshot_path"], parquet_object)
+            except Exception as e:
+                if not STORE_RAW_CSV:
+                    # The Parquet file is the only stored copy of the upload
+                    remove_upload_artifacts(storage_path, table_name)
+                    raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+                print(f"[WARNING] Failed to store Parquet file {parquet_object}: {str(e)}")
+                parquet_bytes = None
+        if parquet_bytes is None:
+            parquet_object = None
+        
+        # Store metadata in user_datasets table WITH file_hash
+        # Dataset name already generated with unique versioning above
+        report(phase="metadata", rows_ingested=row_count, rows_per_sec=ingest_stats["rows_per_sec"])
+        try:
+            with stage("metadata"):
+                inserted = supabase.table("user_datasets").insert({
+                    "id": upload["dataset_id"],
+                    "user_id": user_id,
+                    "dataset_name": dataset_name,
+                    "original_filename": upload["filename"],
+                    "storage_path": storage_path if STORE_RAW_CSV else parquet_object,
+                    "parquet_path": parquet_object,
+                    "table_name": table_name,
+                    "column_names": renamed_columns,
+                    "row_count": row_count,
+                    "file_size_bytes": upload["file_size"],
+                    "file_hash": upload["file_hash"],  # Include file hash for duplicate detection
+                    "schema_context": ingest_result["schema_context"],
+                    "column_stats": ingest_result["column_stats"]
+                }).execute()
+        except Exception as e:
+            # Rollback: delete storage and table if metadata insert fails
+            remove_upload_artifacts(storage_path, table_name)
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to save dataset metadata: {str(e)}"
+            )
+        if inserted.data:
+            dataset_cache.add(user_id, inserted.data[0])
+        else:
+            dataset_cache.invalidate(user_id)
+
+        if snapshot_cache is not None and ingest_result["snapshot_path"]:
+            # Local queries can start right away (other workers fetch it from storage)
+            snapshot_cache.put(table_name, ingest_result["snapshot_path"])
+        
+        return {
+            "success": True,
+            "message": "Dataset uploaded successfully!",
+            "dataset_id": upload["dataset_id"],
+            "dataset_name": dataset_name,
+            "table_name": table_name,
+            "columns": renamed_columns,
+            "row_count": row_count,
+            "file_size_bytes": upload["file_size"],
+            "ingest": ingest_stats,
+            "storage": {
+                "csv_bytes": upload["file_size"] if STORE_RAW_CSV else None,
+                "parquet_bytes": parquet_bytes
+            }
+        }
+    finally:
+        os.unlink(spool_path)
+        if parquet_file is not None and snapshot_cache is None and os.path.exists(parquet_file):
+            os.unlink(parquet_file)
+
+def persist_ingest_job(row: dict) -> None:
+    supabase.table("ingest_jobs").upsert(row).execute()
+
+def load_ingest_job(job_id: str, user_id: str):
+    response = supabase.table("ingest_jobs")\
+        .select("*")\
+        .eq("id", job_id)\
+        .eq("user_id", user_id)\
+        .execute()
+    return response.data[0] if response.data else None
+
+# Jobs still queued/running at startup whose last update is older than this are
+# marked failed (their worker stopped). 0 fails all of them, which is right when
+# every worker restarts together; raise it above the longest gap between
+# progress updates if workers restart one at a time.
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "0"))
+
+def fail_interrupted_ingest_jobs(updated_before: str) -> int:
+    """Mark jobs left queued/running by a stopped worker as failed, returning how many"""
+    response = supabase.table("ingest_jobs")\
+        .update(interrupted_job_fields())\
+        .in_("status", list(UNFINISHED_STATUSES))\
+        .lt("updated_at", updated_before)\
+        .execute()
+    return len(response.data or [])
+
+def _fail_interrupted_ingest_jobs_in_background(updated_before: str) -> None:
+    try:
+        count = fail_interrupted_ingest_jobs(updated_before)
+    except Exception as e:
+        print(f"[WARNING] Could not mark interrupted ingest jobs as failed: {str(e)}")
+        return
+    if count:
+        print(f"[INFO] Marked {count} interrupted ingest job(s) as failed")
+
+# Background uploads share the ingest concurrency cap with inline uploads
+ingest_jobs = JobManager(
+    max_workers=INGEST_MAX_CONCURRENCY,
+    persist=persist_ingest_job,
+    load=load_ingest_job,
+    persist_interval=float(os.getenv("JOB_PROGRESS_PERSIST_SECONDS", "1"))
+)
+UPLOAD_BACKGROUND_DEFAULT = os.getenv("UPLOAD_BACKGROUND", "false").lower() == "true"
 
 # ============ DATA UPLOAD ENDPOINT ============
 
@@ -301,6 +1048,7 @@ async def upload_file(
     file: UploadFile = File(...),
     reuse: bool = False,
     force_upload: bool = False,
+    background: bool = UPLOAD_BACKGROUND_DEFAULT,
     current_user: AuthUser = Depends(get_current_user)
 ):
     """
@@ -308,34 +1056,35 @@ async def upload_file(
     
     Flow with Duplicate Detection:
     1. Verify user authentication (Supabase JWT)
-    2. Read file content and compute SHA-256 hash
+    2. Spool file to local disk in chunks, computing the SHA-256 hash incrementally
     3. Check for duplicate (user_id + file_hash)
     4. If duplicate found:
        - If reuse=True: Return existing dataset metadata (skip upload)
        - If force_upload=True: Proceed with versioned upload
        - Else: Return duplicate=True with existing metadata (user must decide)
     5. If not duplicate or force_upload=True:
-       - Upload CSV to Supabase Storage with user_id prefix
-       - Parse CSV and create dynamic PostgreSQL table
+       - Upload CSV to Supabase Storage with user_id prefix (streamed from disk)
+       - At the same time, parse CSV in bounded chunks, loading each chunk into a dynamic PostgreSQL table
        - Store metadata in user_datasets table (including file_hash)
     6. Return success with dataset information
     
+    With background=True, steps 5-6 run on the ingest worker pool: the response
+    carries a job_id right away and progress is polled via GET /jobs/{job_id}.
+    
     Reference:
     - Storage: https://supabase.com/docs/guides/storage/uploads
     - Database: https://supabase.com/docs/guides/database/connecting-to-postgres
     """
+    spool_path = None
     try:
         # Validate file type
         if not file.filename or not file.filename.endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are supported")
         
-        # Read file content
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # Compute SHA-256 hash of file content
+        # Spool file content to disk and compute SHA-256 hash in one pass
         try:
-            file_hash = hashlib.sha256(file_content).hexdigest()
+            with stage("hash"):
+                spool_path, file_size, file_hash = await spool_upload(file)
             print(f"[INFO] File hash computed: {file_hash[:16]}...")
         except Exception as e:
             raise HTTPException(
@@ -345,11 +1094,14 @@ async def upload_file(
         
         # Check for duplicate (user_id + file_hash) BEFORE any upload
         try:
-            duplicate_check = supabase.table("user_datasets")\
-                .select("id, dataset_name, original_filename, table_name, column_names, row_count, file_size_bytes, created_at")\
-                .eq("user_id", current_user.id)\
-                .eq("file_hash", file_hash)\
-                .execute()
+            with stage("metadata"):
+                duplicate_check = await run_blocking(
+                    supabase.table("user_datasets")
+                    .select("id, dataset_name, original_filename, table_name, column_names, row_count, file_size_bytes, created_at")
+                    .eq("user_id", current_user.id)
+                    .eq("file_hash", file_hash)
+                    .execute
+                )
             
             if duplicate_check.data and len(duplicate_check.data) > 0:
                 existing_dataset = duplicate_check.data[0]
@@ -395,102 +1147,93 @@ async def upload_file(
                 detail=f"Failed to check for duplicates: {str(e)}"
             )
         
-        # Parse CSV
+        # Validate the CSV header and first rows before storing anything
         try:
-            df = pd.read_csv(BytesIO(file_content))
+            import pandas as pd
+            preview = await run_blocking(pd.read_csv, spool_path, nrows=5)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
         
-        if df.empty:
+        if preview.empty:
             raise HTTPException(status_code=400, detail="CSV file is empty")
         
         # Generate unique identifiers
         dataset_id = str(uuid.uuid4())
-        table_name = generate_table_name(current_user.id, file.filename)
-        storage_path = f"{current_user.id}/{dataset_id}/{file.filename}"
-        
-        # Generate unique dataset name with automatic versioning
-        base_name = file.filename.rsplit('.', 1)[0]
-        dataset_name = generate_unique_dataset_name(base_name, current_user.id)
-        
-        # Upload to Supabase Storage
-        # Reference: https://supabase.com/docs/reference/python/storage-upload
-        try:
-            supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
-                path=storage_path,
-                file=file_content,
-                file_options={
-                    "content-type": "text/csv",
-                    "x-upsert": "false"  # Prevent overwriting
-                }
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to upload to storage: {str(e)}"
-            )
-        
-        # Create PostgreSQL table with data
-        try:
-            table_name, renamed_columns = create_dynamic_table_from_dataframe(df, table_name, current_user.id)
-        except Exception as e:
-            # Rollback: delete from storage if table creation fails
-            try:
-                supabase.storage.from_(STORAGE_BUCKET_NAME).remove([storage_path])
-            except:
-                pass
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to create database table: {str(e)}"
-            )
+        upload = {
+            "user_id": current_user.id,
+            "dataset_id": dataset_id,
+            "filename": file.filename,
+            "table_name": generate_table_name(current_user.id, file.filename),
+            "storage_path": f"{current_user.id}/{dataset_id}/{file.filename}",
+            "spool_path": spool_path,
+            "file_size": file_size,
+            "file_hash": file_hash,
+        }
         
-        # Store metadata in user_datasets table WITH file_hash
-        # Dataset name already generated with unique versioning above
-        try:
-            supabase.table("user_datasets").insert({
-                "id": dataset_id,
-                "user_id": current_user.id,
-                "dataset_name": dataset_name,
-                "original_filename": file.filename,
-                "storage_path": storage_path,
-                "table_name": table_name,
-                "column_names": renamed_columns,
-                "row_count": len(df),
-                "file_size_bytes": file_size,
-                "file_hash": file_hash  # Include file hash for duplicate detection
-            }).execute()
-        except Exception as e:
-            # Rollback: delete storage and table if metadata insert fails
-            try:
-                supabase.storage.from_(STORAGE_BUCKET_NAME).remove([storage_path])
-                with db_engine.connect() as conn:
-                    conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
-                    conn.commit()
-            except:
-                pass
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to save dataset metadata: {str(e)}"
+        # The pipeline owns (and deletes) the spooled file from here on
+        if background:
+            def run_background_upload(job: IngestJob) -> dict:
+                # No request around a background job: time its stages as one unit
+                with collect_stages():
+                    return run_upload_pipeline(upload, job)
+            
+            job = await run_blocking(
+                ingest_jobs.submit,
+                current_user.id, dataset_id, file.filename, file_size, run_background_upload
             )
+            spool_path = None
+            return {
+                "success": True,
+                "background": True,
+                "message": "Upload accepted, ingesting in the background",
+                "job_id": job.id,
+                "dataset_id": dataset_id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}"
+            }
         
-        return {
-            "success": True,
-            "message": "Dataset uploaded successfully!",
-            "dataset_id": dataset_id,
-            "dataset_name": dataset_name,
-            "table_name": table_name,
-            "columns": renamed_columns,
-            "row_count": len(df),
-            "file_size_bytes": file_size
-        }
+        spool_path = None
+        return await run_blocking(run_upload_pipeline, upload)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        if spool_path:
+            os.unlink(spool_path)
+
+@app.get("/jobs/{job_id}")
+async def get_ingest_job(
+    job_id: str,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """
+    Status of a background upload
+    
+    Reports the current phase (naming, storage, ingest, metadata, done/failed),
+    rows ingested so far and throughput. Once succeeded, result holds the
+    same payload a synchronous /upload would have returned.
+    """
+    try:
+        job = await run_blocking(ingest_jobs.get, job_id, current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch job: {str(e)}")
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {"success": True, "job": job.model_dump()}
 
 # ============ DATASET MANAGEMENT ENDPOINTS ============
 
+# schema_context is only needed by /ask, so keep it out of listing payloads
+DATASET_LIST_COLUMNS = (
+    "id, user_id, dataset_name, original_filename, storage_path, table_name, "
+    "column_names, row_count, file_size_bytes, file_hash, parquet_path, created_at, updated_at"
+)
+DATASET_LIST_FIELDS = [column.strip() for column in DATASET_LIST_COLUMNS.split(",")]
+
 @app.get("/datasets")
 async def list_datasets(current_user: AuthUser = Depends(get_current_user)):
     """
@@ -498,19 +1241,22 @@ async def list_datasets(current_user: AuthUser = Depends(get_current_user)):
     Uses Supabase RLS - user can only see their own datasets
     """
     try:
-        response = supabase.table("user_datasets")\
-            .select("*")\
-            .eq("user_id", current_user.id)\
-            .order("created_at", desc=True)\
-            .execute()
+        datasets = await run_blocking(dataset_cache.datasets, current_user.id)
         
         return {
             "success": True,
-            "datasets": response.data
+            "datasets": [{column: row.get(column) for column in DATASET_LIST_FIELDS} for row in datasets]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch datasets: {str(e)}")
 
+def drop_table_cascade(table_name: str) -> None:
+    with db_engine.connect() as conn:
+        # Use parameterized query to prevent SQL injection
+        cascade = " CASCADE" if db_engine.dialect.name == "postgresql" else ""
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}{cascade}"))
+        conn.commit()
+
 @app.delete("/datasets/{dataset_id}")
 async def delete_dataset(
     dataset_id: str,
@@ -528,19 +1274,14 @@ async def delete_dataset(
     """
     try:
         # Step 1: Get dataset metadata and verify ownership
-        dataset_response = supabase.table("user_datasets")\
-            .select("*")\
-            .eq("id", dataset_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+        dataset = await get_user_dataset(dataset_id, current_user.id)
         
-        if not dataset_response.data or len(dataset_response.data) == 0:
+        if dataset is None:
             raise HTTPException(
                 status_code=404,
                 detail="Dataset not found or you don't have permission to delete it"
             )
         
-        dataset = dataset_response.data[0]
         table_name = dataset["table_name"]
         storage_path = dataset["storage_path"]
         
@@ -548,18 +1289,24 @@ async def delete_dataset(
         
         # Step 2: Drop the PostgreSQL table
         try:
-            with db_engine.connect() as conn:
-                # Use parameterized query to prevent SQL injection
-                conn.execute(text(f"DROP TABLE IF EXISTS {table_name} CASCADE"))
-                conn.commit()
+            await run_blocking(drop_table_cascade, table_name)
             print(f"[INFO] Dropped table: {table_name}")
         except Exception as e:
             print(f"[WARNING] Failed to drop table {table_name}: {str(e)}")
             # Continue with deletion even if table drop fails
+        finally:
+            invalidate_db_chain(table_name)
+            answer_cache.invalidate_dataset(dataset_id)
+            semantic_index.invalidate_dataset(dataset_id)
+            if snapshot_cache is not None:
+                snapshot_cache.discard(table_name)
         
-        # Step 3: Delete file from Supabase Storage
+        # Step 3: Delete file (and Parquet snapshot) from Supabase Storage
         try:
-            supabase.storage.from_(STORAGE_BUCKET_NAME).remove([storage_path])
+            await run_blocking(
+                supabase.storage.from_(STORAGE_BUCKET_NAME).remove,
+                [storage_path, snapshot_storage_path(storage_path)]
+            )
             print(f"[INFO] Deleted storage file: {storage_path}")
         except Exception as e:
             print(f"[WARNING] Failed to delete storage file {storage_path}: {str(e)}")
@@ -567,24 +1314,32 @@ async def delete_dataset(
         
         # Step 4: Delete related query history (CASCADE handles this, but explicit is better)
         try:
-            supabase.table("query_history")\
-                .delete()\
-                .eq("dataset_id", dataset_id)\
-                .eq("user_id", current_user.id)\
-                .execute()
+            # Rows still queued for this dataset would otherwise land after the delete
+            await run_blocking(history_writer.flush, 5)
+            await run_blocking(
+                supabase.table("query_history")
+                .delete()
+                .eq("dataset_id", dataset_id)
+                .eq("user_id", current_user.id)
+                .execute
+            )
             print(f"[INFO] Deleted query history for dataset {dataset_id}")
         except Exception as e:
             print(f"[WARNING] Failed to delete query history: {str(e)}")
         
         # Step 5: Delete metadata from user_datasets table
         try:
-            supabase.table("user_datasets")\
-                .delete()\
-                .eq("id", dataset_id)\
-                .eq("user_id", current_user.id)\
-                .execute()
+            await run_blocking(
+                supabase.table("user_datasets")
+                .delete()
+                .eq("id", dataset_id)
+                .eq("user_id", current_user.id)
+                .execute
+            )
+            dataset_cache.remove(current_user.id, dataset_id)
             print(f"[INFO] Deleted metadata for dataset {dataset_id}")
         except Exception as e:
+            dataset_cache.invalidate(current_user.id)
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to delete dataset metadata: {str(e)}"
@@ -605,11 +1360,140 @@ async def delete_dataset(
             detail=f"Failed to delete dataset: {str(e)}"
         )
 
+def reload_dataset_table(dataset: dict) -> dict:
+    """
+    Load a dataset's table again from its Parquet file (blocking)
+    
+    Rows are loaded into a staging table that replaces the live one only once
+    it is complete, so a failed reload leaves the dataset as it was. Advisor
+    indexes are recreated by the next advisor run.
+    """
+    from ingest import load_parquet_file, replace_dataset_table
+    
+    table_name = dataset["table_name"]
+    parquet_object = dataset["parquet_path"]
+    local_path = snapshot_cache.get(table_name, parquet_object) if snapshot_cache is not None else None
+    download_path = None
+    if local_path is None:
+        download_path = os.path.join(UPLOAD_SPOOL_DIR or tempfile.gettempdir(), f"reload_{table_name}.parquet")
+        download_snapshot(parquet_object, download_path)
+        local_path = download_path
+    try:
+        with ingest_slots:
+            staging_name = f"reload_{uuid.uuid4().hex[:12]}"
+            try:
+                result = load_parquet_file(db_engine, local_path, staging_name, dataset["user_id"])
+                replace_dataset_table(db_engine, staging_name, table_name)
+            except Exception:
+                drop_dataset_table(staging_name)
+                raise
+            invalidate_db_chain(table_name)
+    finally:
+        if download_path is not None and os.path.exists(download_path):
+            os.unlink(download_path)
+    print(f"[INFO] Reloaded {result['row_count']} rows into {table_name} from {parquet_object} "
+          f"in {result['stats']['seconds']}s")
+    return result
+
+@app.post("/datasets/{dataset_id}/reload")
+async def reload_dataset(
+    dataset_id: str,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Rebuild a dataset's table from the Parquet file stored at upload (no CSV re-parsing)"""
+    dataset = await get_user_dataset(dataset_id, current_user.id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    if not dataset.get("parquet_path"):
+        raise HTTPException(
+            status_code=409,
+            detail="This dataset has no stored Parquet file. Re-upload it to enable reloading."
+        )
+    try:
+        result = await run_blocking(reload_dataset_table, dataset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reload dataset: {str(e)}")
+    
+    return {
+        "success": True,
+        "dataset_id": dataset_id,
+        "table_name": dataset["table_name"],
+        "row_count": result["row_count"],
+        "reload": result["stats"]
+    }
+
+@app.get("/datasets/{dataset_id}/profile")
+async def get_dataset_profile(
+    dataset_id: str,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Per-column statistics (nulls, distinct counts, ranges, top values, histograms) of a dataset"""
+    dataset = await get_user_dataset(dataset_id, current_user.id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    if not dataset.get("column_stats"):
+        return {
+            "success": True,
+            "dataset_id": dataset_id,
+            "profile": None,
+            "message": "No profile for this dataset. Re-upload it to compute column statistics."
+        }
+    return {
+        "success": True,
+        "dataset_id": dataset_id,
+        "dataset_name": dataset["dataset_name"],
+        "row_count": dataset["row_count"],
+        "profile": dataset["column_stats"]
+    }
+
+@app.get("/datasets/{dataset_id}/indexes")
+async def get_dataset_indexes(
+    dataset_id: str,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Advisor-managed indexes on a dataset table and the report of the last advisor run"""
+    dataset = await get_user_dataset(dataset_id, current_user.id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    try:
+        indexes = await run_blocking(
+            existing_advisor_indexes, db_engine, dataset["table_name"], dataset["column_names"]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read indexes: {str(e)}")
+    
+    return {
+        "success": True,
+        "indexes": [{"column": column, "index": name} for column, name in indexes.items()],
+        "report": dataset.get("index_report")
+    }
+
+@app.post("/datasets/{dataset_id}/indexes/advise")
+async def advise_dataset_indexes(
+    dataset_id: str,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """Run the index advisor for a dataset now and return its report"""
+    dataset = await get_user_dataset(dataset_id, current_user.id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    try:
+        report = await run_blocking(run_index_advisor, dataset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Index advisor failed: {str(e)}")
+    return {"success": True, "report": report}
+
 # ============ QUERY ENDPOINT ============
 
 class QueryRequest(BaseModel):
     question: str
     dataset_id: str  # User must specify which dataset to query
+    result_format: str = "text"  # "text" (stringified rows) or "table" (typed, paginated rows)
+    page_size: int = DEFAULT_PAGE_SIZE  # Rows in the first page when result_format="table"
 
 # Helper: Calculate query relevance/confidence
 def calculate_confidence(question: str, available_columns: list, result: str) -> dict:
@@ -665,74 +1549,130 @@ async def ask_database(
     start_time = time.time()
     
     try:
+        if request.result_format not in ("text", "table"):
+            raise HTTPException(status_code=400, detail="result_format must be 'text' or 'table'")
+        
         # Verify dataset belongs to user (RLS enforces this, but explicit check for better error messages)
-        dataset_response = supabase.table("user_datasets")\
-            .select("*")\
-            .eq("id", request.dataset_id)\
-            .eq("user_id", current_user.id)\
-            .execute()
+        with stage("metadata"):
+            dataset = await get_user_dataset(request.dataset_id, current_user.id)
         
-        if not dataset_response.data or len(dataset_response.data) == 0:
+        if dataset is None:
             raise HTTPException(
                 status_code=404,
                 detail="Dataset not found or you don't have permission to access it"
             )
         
-        dataset = dataset_response.data[0]
         table_name = dataset["table_name"]
         available_columns = dataset["column_names"]
         
-        # Create SQL chain restricted to user's table
-        chain, db = get_user_db_chain(current_user.id, table_name)
+        # Repeated question: return the stored SQL and answer without calling the LLM
+        cache_variant = request.result_format if request.result_format == "text" else f"table:{request.page_size}"
+        cached_response = answer_cache.get(request.dataset_id, request.question, cache_variant)
+        if cached_response is not None:
+            cached_response["question"] = request.question
+            cached_response["cached"] = True
+            return cached_response
         
-        # Generate SQL with context (WITHOUT user_id mention for clean display)
-        query_input = {
-            "question": f"Table name is {table_name}. Available columns: {', '.join(available_columns)}. "
-                       f"Question: {request.question}"
-        }
-        generated_sql = chain.invoke(query_input)
+        # Simple aggregate ("max price", "how many rows"): answer from the
+        # column statistics computed at upload, without the LLM or the table
+        from column_stats import answer_from_stats
+        profile_answer = answer_from_stats(request.question, dataset.get("column_stats"), table_name) \
+            if request.result_format == "text" else None
         
-        # Extract only the SQL query from the response
-        sql_pattern = r'(SELECT.*?(?:;|$))'
-        match = re.search(sql_pattern, generated_sql, re.IGNORECASE | re.DOTALL)
+        # Paraphrase of an earlier question: reuse its SQL instead of calling the LLM
+        semantic_match = semantic_index.find(request.dataset_id, request.question) \
+            if SEMANTIC_CACHE_ENABLED and profile_answer is None else None
         
-        if match:
-            display_sql = match.group(1).strip()
-            if display_sql.endswith(';'):
-                display_sql = display_sql[:-1]
+        if profile_answer is not None:
+            display_sql = profile_answer["sql"]
+            sql_source = "profile"
+        elif semantic_match is not None:
+            display_sql = semantic_match.sql
+            sql_source = "semantic_cache"
+            print(f"[INFO] Reusing SQL from similar question (score={semantic_match.score})")
         else:
-            display_sql = generated_sql.strip()
-        
-        # Create execution SQL with user_id filter for security (not shown to user)
-        execution_sql = display_sql
-        if f"user_id = '{current_user.id}'" not in execution_sql.lower():
-            # Add WHERE clause or append to existing one
-            if "WHERE" in execution_sql.upper():
-                execution_sql = execution_sql.replace("WHERE", f"WHERE user_id = '{current_user.id}' AND", 1)
+            # Create SQL chain restricted to user's table (prompt built from stored context)
+            with stage("chain"):
+                chain = await run_blocking(
+                    get_user_db_chain, current_user.id, table_name, dataset.get("schema_context")
+                )
+            
+            # Generate SQL with context (WITHOUT user_id mention for clean display)
+            query_input = {
+                "question": f"Table name is {table_name}. Available columns: {', '.join(available_columns)}. "
+                           f"Question: {request.question}"
+            }
+            # Native async Groq client - waiting on the LLM holds no thread
+            async with llm_semaphore:
+                with stage("llm"):
+                    generated_sql = await chain.ainvoke(query_input)
+            
+            # Extract only the SQL query from the response (a leading CTE is kept)
+            sql_pattern = r'((?:WITH\s+(?:RECURSIVE\s+)?\w+\s+AS\s*\(|SELECT\b).*?(?:;|$))'
+            match = re.search(sql_pattern, generated_sql, re.IGNORECASE | re.DOTALL)
+            
+            if match:
+                display_sql = match.group(1).strip()
+                if display_sql.endswith(';'):
+                    display_sql = display_sql[:-1]
             else:
-                # Add WHERE before ORDER BY, GROUP BY, or at the end
-                for keyword in ["ORDER BY", "GROUP BY", "LIMIT"]:
-                    if keyword in execution_sql.upper():
-                        execution_sql = execution_sql.replace(keyword, f"WHERE user_id = '{current_user.id}' {keyword}", 1)
-                        break
-                else:
-                    execution_sql += f" WHERE user_id = '{current_user.id}'"
+                display_sql = generated_sql.strip()
+            sql_source = "llm"
+        
+        query_id = str(uuid.uuid4())
+        sql_params = {USER_ID_PARAM: current_user.id}
         
         # Execute SQL with user_id filter
+        # "table" mode only fetches the first page; further pages and full
+        # exports re-run the query by query_id (see /queries endpoints)
+        page = None
+        truncated_reason = None
         try:
-            result = db.run(execution_sql)
+            # Create execution SQL with user_id filter for security (not shown to user).
+            # Anything but a SELECT over this dataset's table is rejected here.
+            execution_sql = scope_sql_to_user(display_sql, {table_name})
+            
+            if profile_answer is not None:
+                result = profile_answer["answer"]
+            elif request.result_format == "table":
+                with stage("sql"):
+                    page = await run_blocking(fetch_result_page, execution_sql, sql_params, request.page_size, dataset)
+                result = format_rows(page["rows"])
+            else:
+                with stage("sql"):
+                    executed = await run_blocking(run_sql, execution_sql, sql_params, dataset)
+                result = executed["text"]
+                truncated_reason = executed["truncated_reason"]
+                if truncated_reason:
+                    print(f"[WARNING] Result truncated ({truncated_reason}) at {executed['row_count']} rows")
+        except PoolTimeoutError:
+            # Every pooled connection is busy - nothing wrong with the SQL
+            raise HTTPException(
+                status_code=503,
+                detail="Database is busy, please retry",
+                headers={"Retry-After": "1"}
+            )
         except Exception as sql_error:
+            if semantic_match is not None:
+                semantic_index.discard(request.dataset_id, display_sql)
+            
             # Log query to history with error (log the display version)
-            supabase.table("query_history").insert({
-                "user_id": current_user.id,
-                "dataset_id": request.dataset_id,
-                "question": request.question,
-                "generated_sql": display_sql,
-                "success": False,
-                "error_message": str(sql_error),
-                "execution_time_ms": int((time.time() - start_time) * 1000)
-            }).execute()
+            with stage("history"):
+                history_writer.submit({
+                    "id": query_id,
+                    "user_id": current_user.id,
+                    "dataset_id": request.dataset_id,
+                    "question": request.question,
+                    "generated_sql": display_sql,
+                    "success": False,
+                    "error_message": str(sql_error),
+                    "execution_time_ms": int((time.time() - start_time) * 1000)
+                })
             
+            if isinstance(sql_error, QueryTimeoutError):
+                raise HTTPException(status_code=408, detail=str(sql_error))
+            if isinstance(sql_error, UnsafeSQLError):
+                raise HTTPException(status_code=400, detail=f"Generated SQL was rejected: {str(sql_error)}")
             raise HTTPException(
                 status_code=400,
                 detail=f"SQL execution error: {str(sql_error)}"
@@ -744,25 +1684,32 @@ async def ask_database(
         # Determine success status
         success = result and result.strip() and result != "[]"
         
-        # Store query in history (store display version without user_id)
-        try:
-            supabase.table("query_history").insert({
+        if success:
+            query_registry.set(query_id, {"user_id": current_user.id, "sql": execution_sql})
+            result_data = {"raw": result, "truncated": truncated_reason is not None} if page is None else {
+                "columns": page["columns"], "rows": page["rows"], "has_more": page["has_more"]
+            }
+        else:
+            result_data = None
+        
+        # Store query in history (store display version without user_id);
+        # written in the background, failures never reach the request
+        with stage("history"):
+            history_writer.submit({
+                "id": query_id,
                 "user_id": current_user.id,
                 "dataset_id": request.dataset_id,
                 "question": request.question,
                 "generated_sql": display_sql,
-                "result_data": {"raw": result} if success else None,
+                "result_data": result_data,
                 "success": success,
                 "confidence_score": confidence_data["score"],
                 "execution_time_ms": int((time.time() - start_time) * 1000)
-            }).execute()
-        except Exception as history_error:
-            # Don't fail the request if history logging fails
-            print(f"Warning: Failed to log query history: {history_error}")
+            })
         
         # Check if result is empty
         if not success:
-            return {
+            response = {
                 "status": "no_data",
                 "message": "No matching records found for your query.",
                 "question": request.question,
@@ -771,24 +1718,40 @@ async def ask_database(
                 "data_found": False,
                 "confidence": 0.0
             }
-        
         # Check confidence threshold
-        if not confidence_data["is_reliable"]:
-            return {
+        elif not confidence_data["is_reliable"]:
+            response = {
                 "question": request.question,
                 "generated_sql": display_sql,
                 "answer": f"Low confidence result: {result}\n\nNote: This response may not be accurate. Please rephrase your question using these columns: {', '.join(available_columns)}",
                 "data_found": True,
                 "confidence": confidence_data["score"]
             }
+        else:
+            response = {
+                "question": request.question,
+                "generated_sql": display_sql,
+                "answer": result,
+                "data_found": True,
+                "confidence": confidence_data["score"]
+            }
         
-        return {
-            "question": request.question,
-            "generated_sql": display_sql,
-            "answer": result,
-            "data_found": True,
-            "confidence": confidence_data["score"]
-        }
+        response["sql_source"] = sql_source
+        response["query_id"] = query_id
+        if truncated_reason:
+            # Only part of the result fits the row/byte budget; the full result
+            # is available through /queries/{query_id}/export
+            response["truncated"] = True
+            response["truncated_reason"] = truncated_reason
+        if page is not None:
+            response["result"] = page
+        answer_cache.set(request.dataset_id, request.question, response, cache_variant)
+        if success and sql_source == "llm":
+            semantic_index.add(request.dataset_id, request.question, display_sql)
+        if success:
+            note_query_for_index_advisor(dataset)
+        response["cached"] = False
+        return response
         
     except HTTPException:
         raise
@@ -798,6 +1761,64 @@ async def ask_database(
             detail=f"Query failed: {str(e)}"
         )
 
+@app.get("/queries/{query_id}/rows")
+async def get_query_rows(
+    query_id: str,
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """
+    Page through the result of an earlier /ask query
+    
+    The query is looked up by query_id and re-run with the user_id filter;
+    pass next_cursor from the previous page to continue.
+    """
+    try:
+        offset = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    execution_sql = await run_blocking(resolve_query, query_id, current_user.id)
+    if execution_sql is None:
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    try:
+        page = await run_blocking(
+            fetch_page, db_engine, execution_sql, {USER_ID_PARAM: current_user.id}, limit, offset
+        )
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=408, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"SQL execution error: {str(e)}")
+    
+    return {"success": True, "query_id": query_id, **page}
+
+@app.get("/queries/{query_id}/export")
+async def export_query_result(
+    query_id: str,
+    format: str = "ndjson",
+    current_user: AuthUser = Depends(get_current_user)
+):
+    """
+    Stream the full result of an earlier /ask query as NDJSON or CSV
+    
+    Rows are read through a server-side cursor and sent as they arrive, so
+    large results are never buffered in the worker.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    
+    execution_sql = await run_blocking(resolve_query, query_id, current_user.id)
+    if execution_sql is None:
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    return StreamingResponse(
+        stream_export(db_engine, execution_sql, {USER_ID_PARAM: current_user.id}, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="query_{query_id}.{format}"'}
+    )
+
 # Run the server
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,130 @@
+"""
+Parquet Dataset Snapshots
+Writes the rows of a dataset table to a typed, compressed Parquet file while
+the CSV is ingested, so the data can be queried (see columnar_engine.py)
+without going back to PostgreSQL.
+
+The file mirrors the table: the system id/user_id columns followed by the
+dataset columns, with Arrow types matching each column kind. Chunks are
+appended as row groups; if a later chunk widens a column kind the rows
+already written are re-cast batch by batch, so memory stays bounded by one
+chunk. Column kinds are stored in the file's schema metadata.
+Reference: https://arrow.apache.org/docs/python/parquet.html
+"""
+import json
+import os
+from typing import Iterator, List, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency: snapshots are skipped without pyarrow
+    pa = pq = None
+
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+KINDS_METADATA_KEY = b"dataset_column_kinds"
+
+
+def snapshots_available() -> bool:
+    return pa is not None
+
+
+def arrow_type(kind: str):
+    """Arrow type a column kind is stored as ("numeric" is kept as exact text)"""
+    return {
+        "boolean": pa.bool_(),
+        "smallint": pa.int16(),
+        "integer": pa.int32(),
+        "bigint": pa.int64(),
+        "float": pa.float64(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+    }.get(kind, pa.string())
+
+
+def snapshot_schema(table_columns: List[str], kinds: List[str]):
+    fields = [pa.field("id", pa.int64()), pa.field("user_id", pa.string())]
+    fields += [pa.field(name, arrow_type(kind)) for name, kind in zip(table_columns, kinds)]
+    return pa.schema(fields, metadata={KINDS_METADATA_KEY: json.dumps(kinds).encode()})
+
+
+def snapshot_columns(path: str) -> Tuple[List[str], List[str]]:
+    """(dataset column names, column kinds) recorded in a snapshot file"""
+    schema = pq.read_schema(path)
+    return schema.names[2:], json.loads(schema.metadata[KINDS_METADATA_KEY])
+
+
+def read_snapshot_batches(path: str, batch_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+    """Dataset columns of a snapshot (without id/user_id) as DataFrames of up to batch_rows rows"""
+    table_columns, _ = snapshot_columns(path)
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=table_columns):
+        yield batch.to_pandas()
+
+
+def _arrow_column(series: pd.Series, kind: str):
+    if kind in ("null", "text", "numeric"):
+        # Same text PostgreSQL holds for values parsed as numbers in a text column
+        series = series.astype(object).where(series.isna(), series.astype(str))
+    return pa.array(series, from_pandas=True).cast(arrow_type(kind))
+
+
+class ParquetSnapshotWriter:
+    """
+    Appends coerced ingest chunks to a Parquet snapshot file
+
+    Args:
+        path: File to write (created or replaced when the writer is closed)
+        user_id: Owner written into every row's user_id column
+    """
+
+    def __init__(self, path: str, user_id: str):
+        self.path = path
+        self.user_id = user_id
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+        self._writing_path = path + ".part"
+
+    def write(self, chunk: pd.DataFrame, table_columns: List[str], kinds: List[str]) -> None:
+        """Append a chunk that has been coerced to the table's current column kinds"""
+        schema = snapshot_schema(table_columns, kinds)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._writing_path, schema, compression=PARQUET_COMPRESSION)
+        elif not schema.equals(self._schema, check_metadata=True):
+            self._widen(schema)
+        self._schema = schema
+
+        ids = pa.array(range(self.rows + 1, self.rows + len(chunk) + 1), type=pa.int64())
+        owner = pa.array([self.user_id] * len(chunk), type=pa.string())
+        columns = [_arrow_column(chunk.iloc[:, position], kind) for position, kind in enumerate(kinds)]
+        self._writer.write_table(pa.Table.from_arrays([ids, owner] + columns, schema=schema))
+        self.rows += len(chunk)
+
+    def _widen(self, schema) -> None:
+        # Copy the row groups written so far into a new file with the widened schema
+        self._writer.close()
+        previous = self._writing_path
+        self._writing_path = previous + ".w" if not previous.endswith(".w") else previous[:-2]
+        self._writer = pq.ParquetWriter(self._writing_path, schema, compression=PARQUET_COMPRESSION)
+        for batch in pq.ParquetFile(previous).iter_batches():
+            self._writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+        os.unlink(previous)
+
+    def close(self) -> str:
+        """Finish the file and return its path"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(self._writing_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Stop writing and delete the partial file"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._writing_path):
+            os.unlink(self._writing_path)
@@ -0,0 +1,315 @@
+"""
+Structured Query Results
+Typed, paginated and streamed results for generated SQL, as an alternative
+to the stringified row dump returned by SQLDatabase.run().
+
+Pages are fetched by wrapping the query in LIMIT/OFFSET, so only one page is
+ever held in memory. Exports read through a server-side cursor and are
+written out in batches as NDJSON or CSV.
+
+All execution is guarded: a per-statement timeout on PostgreSQL, a LIMIT
+clamp on the generated SQL and a row/byte budget on what is fetched.
+Reference: https://www.postgresql.org/docs/current/runtime-config-client.html#GUC-STATEMENT-TIMEOUT
+"""
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import uuid
+from typing import Iterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched per round trip from the server-side cursor during exports
+EXPORT_BATCH_ROWS = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Limits for generated SQL (0 disables the statement timeout)
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS", "15000"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "10000"))
+QUERY_MAX_RESULT_BYTES = int(os.getenv("QUERY_MAX_RESULT_BYTES", str(5 * 1024 * 1024)))
+
+# Rows fetched per round trip from the server-side cursor for /ask results
+FETCH_BATCH_ROWS = 500
+
+
+class QueryTimeoutError(Exception):
+    """Raised when a query is cancelled by the statement timeout"""
+
+
+def set_statement_timeout(conn: Connection, timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS) -> None:
+    """
+    Limit statement run time for the current transaction (PostgreSQL only)
+
+    SET LOCAL ends with the transaction, so the setting never leaks to other
+    users of a pooled connection (safe with the transaction pooler).
+    """
+    if timeout_ms > 0 and conn.dialect.name == "postgresql":
+        conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+
+
+def _is_timeout(error: OperationalError) -> bool:
+    # psycopg2 raises QueryCanceled (SQLSTATE 57014) when statement_timeout fires
+    return getattr(error.orig, "pgcode", None) == "57014"
+
+
+def _strip_sql(sql: str) -> str:
+    return sql.strip().rstrip(";")
+
+
+def _row_bytes(row) -> int:
+    return sum(len(str(value)) for value in row) + len(row)
+
+
+def limited_sql(sql: str, max_rows: int) -> str:
+    """Wrap a SELECT so at most max_rows + 1 rows come back (the extra one detects truncation)"""
+    return f"SELECT * FROM ({_strip_sql(sql)}) AS limited_result LIMIT {int(max_rows) + 1}"
+
+
+def collect_rows(names: List[str], rows, max_rows: int, max_bytes: int) -> dict:
+    """
+    Read rows until either fetch budget is reached
+
+    Returns:
+        The execute_guarded() result for the rows read
+    """
+    collected, size, reason = [], 0, None
+    for row in rows:
+        if len(collected) >= max_rows:
+            reason = "row_limit"
+            break
+        size += _row_bytes(row)
+        if size > max_bytes and collected:
+            reason = "byte_limit"
+            break
+        collected.append(tuple(row))
+    return {
+        "columns": names,
+        "rows": collected,
+        "row_count": len(collected),
+        "truncated": reason is not None,
+        "truncated_reason": reason,
+    }
+
+
+def execute_guarded(
+    engine: Engine,
+    sql: str,
+    params: Optional[dict] = None,
+    max_rows: int = QUERY_MAX_ROWS,
+    max_bytes: int = QUERY_MAX_RESULT_BYTES,
+    timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+) -> dict:
+    """
+    Run a SELECT under a statement timeout, LIMIT clamp and fetch budget
+
+    The query is wrapped as SELECT * FROM (sql) LIMIT max_rows + 1, which
+    clamps any LIMIT the SQL already has and lets the planner stop early.
+    Rows are read through a server-side cursor until either budget is
+    reached, so worker memory stays bounded by max_bytes.
+
+    Returns:
+        columns (names), rows (tuples), row_count, truncated and
+        truncated_reason ("row_limit", "byte_limit" or None)
+
+    Raises:
+        QueryTimeoutError: If the statement timeout cancelled the query
+    """
+    try:
+        with engine.connect() as conn:
+            set_statement_timeout(conn, timeout_ms)
+            result = conn.execution_options(yield_per=FETCH_BATCH_ROWS).execute(
+                text(limited_sql(sql, max_rows)), params or {}
+            )
+            collected = collect_rows(list(result.keys()), result, max_rows, max_bytes)
+            result.close()
+    except OperationalError as e:
+        if _is_timeout(e):
+            raise QueryTimeoutError(f"Query exceeded the {timeout_ms / 1000:g}s time limit") from e
+        raise
+    return collected
+
+
+def encode_cursor(offset: int) -> str:
+    """Opaque pagination cursor for the row at offset"""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """
+    Offset encoded in a pagination cursor (0 for no cursor)
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor()
+    """
+    if not cursor:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def jsonable(value):
+    """Convert a database value to a plain JSON type"""
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def _value_type(value) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, (float, decimal.Decimal)):
+        return "number"
+    if isinstance(value, datetime.datetime):
+        return "timestamp"
+    if isinstance(value, datetime.date):
+        return "date"
+    return "string"
+
+
+def describe_columns(names: List[str], rows: List[tuple]) -> List[dict]:
+    """Column names with a JSON-level type taken from the first non-null value"""
+    columns = []
+    for position, name in enumerate(names):
+        sample = next((row[position] for row in rows if row[position] is not None), None)
+        columns.append({"name": name, "type": _value_type(sample) if sample is not None else None})
+    return columns
+
+
+def paged_sql(sql: str, placeholder: str = ":") -> str:
+    """Wrap a SELECT in LIMIT/OFFSET bind parameters (limit, offset)"""
+    return (f"SELECT * FROM ({_strip_sql(sql)}) AS paged_result "
+            f"LIMIT {placeholder}limit OFFSET {placeholder}offset")
+
+
+def build_page(names: List[str], rows: List[tuple], limit: int, offset: int) -> dict:
+    """fetch_page() result from up to limit + 1 rows read at offset"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "columns": describe_columns(names, rows),
+        "rows": [[jsonable(value) for value in row] for row in rows],
+        "offset": offset,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(offset + limit) if has_more else None,
+    }
+
+
+def fetch_page(
+    engine: Engine,
+    sql: str,
+    params: Optional[dict] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    offset: int = 0,
+    timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+) -> dict:
+    """
+    Run a SELECT and return one page of typed rows
+
+    Pages are only stable across requests if the query has an ORDER BY.
+
+    Args:
+        engine: SQLAlchemy engine to run on
+        sql: SELECT statement (already restricted to the caller's rows)
+        params: Bind parameters for sql
+        limit: Rows per page (capped at MAX_PAGE_SIZE)
+        offset: Index of the first row to return
+        timeout_ms: Statement timeout (PostgreSQL)
+
+    Returns:
+        columns ({name, type}), rows (lists of JSON values), offset,
+        has_more and next_cursor (None on the last page)
+
+    Raises:
+        QueryTimeoutError: If the statement timeout cancelled the query
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        with engine.connect() as conn:
+            set_statement_timeout(conn, timeout_ms)
+            result = conn.execute(text(paged_sql(sql)), {**(params or {}), "limit": limit + 1, "offset": offset})
+            names = list(result.keys())
+            rows = [tuple(row) for row in result]
+    except OperationalError as e:
+        if _is_timeout(e):
+            raise QueryTimeoutError(f"Query exceeded the {timeout_ms / 1000:g}s time limit") from e
+        raise
+    return build_page(names, rows, limit, offset)
+
+
+def _ndjson_lines(names: List[str], rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(names, (jsonable(value) for value in row))), default=str) + "\n"
+        for row in rows
+    )
+
+
+def _csv_lines(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([jsonable(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_export(
+    engine: Engine,
+    sql: str,
+    params: Optional[dict] = None,
+    fmt: str = "ndjson",
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    timeout_ms: int = QUERY_STATEMENT_TIMEOUT_MS
+) -> Iterator[str]:
+    """
+    Stream the full result of a SELECT as NDJSON or CSV text
+
+    Rows come from a server-side cursor (yield_per), so memory use is bounded
+    by batch_rows no matter how many rows the query returns. The connection
+    stays checked out until the generator is exhausted or closed. Exports
+    are not row-capped, but the statement timeout still applies.
+
+    Args:
+        engine: SQLAlchemy engine to run on
+        sql: SELECT statement (already restricted to the caller's rows)
+        params: Bind parameters for sql
+        fmt: "ndjson" (one JSON object per row) or "csv" (with header row)
+        batch_rows: Rows fetched and serialized per chunk
+        timeout_ms: Statement timeout (PostgreSQL)
+
+    Yields:
+        Chunks of serialized rows
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    with engine.connect() as conn:
+        set_statement_timeout(conn, timeout_ms)
+        result = conn.execution_options(yield_per=batch_rows).execute(text(_strip_sql(sql)), params or {})
+        names = list(result.keys())
+        if fmt == "csv":
+            yield _csv_lines([names])
+        for batch in result.partitions():
+            yield _ndjson_lines(names, batch) if fmt == "ndjson" else _csv_lines(batch)
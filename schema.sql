@@ -13,6 +13,7 @@
 -- CLEANUP: Drop existing tables (fresh start)
 -- =====================================================
 DROP TABLE IF EXISTS query_history CASCADE;
+DROP TABLE IF EXISTS ingest_jobs CASCADE;
 DROP TABLE IF EXISTS user_datasets CASCADE;
 DROP TABLE IF EXISTS contact_messages CASCADE;
 
@@ -48,6 +49,22 @@ CREATE TABLE user_datasets (
     -- Duplicate detection (SHA-256 hash of file content)
     file_hash TEXT NOT NULL DEFAULT '',
     
+    -- Typed Parquet copy of the data in storage (NULL for uploads stored as CSV only)
+    -- Existing deployments: ALTER TABLE user_datasets ADD COLUMN IF NOT EXISTS parquet_path TEXT;
+    parquet_path TEXT,
+    
+    -- LLM prompt context computed at upload (column types, sample rows, stats)
+    -- Existing deployments: ALTER TABLE user_datasets ADD COLUMN IF NOT EXISTS schema_context JSONB;
+    schema_context JSONB,
+    
+    -- Per-column statistics computed at upload (served by /datasets/{id}/profile)
+    -- Existing deployments: ALTER TABLE user_datasets ADD COLUMN IF NOT EXISTS column_stats JSONB;
+    column_stats JSONB,
+    
+    -- Last index advisor run (indexes created/dropped, before/after query times)
+    -- Existing deployments: ALTER TABLE user_datasets ADD COLUMN IF NOT EXISTS index_report JSONB;
+    index_report JSONB,
+    
     -- Timestamps
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
@@ -138,6 +155,43 @@ CREATE POLICY "users_insert_own_queries"
     ON query_history FOR INSERT 
     WITH CHECK (auth.uid() = user_id);
 
+-- =====================================================
+-- TABLE 2b: ingest_jobs
+-- =====================================================
+-- Progress of background uploads (POST /upload?background=true)
+-- Written by the backend with the service role key, polled via GET /jobs/{id}
+
+CREATE TABLE ingest_jobs (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    dataset_id UUID NOT NULL,  -- No FK: the dataset row only exists once the job succeeds
+    original_filename TEXT NOT NULL,
+    file_size_bytes BIGINT NOT NULL DEFAULT 0,
+    
+    -- Progress
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    phase TEXT NOT NULL DEFAULT 'queued',
+    rows_ingested BIGINT NOT NULL DEFAULT 0,
+    rows_per_sec INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT,
+    result JSONB,
+    
+    -- Timestamps
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX idx_ingest_jobs_user_id ON ingest_jobs(user_id);
+CREATE INDEX idx_ingest_jobs_created_at ON ingest_jobs(created_at DESC);
+
+ALTER TABLE ingest_jobs ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "users_select_own_ingest_jobs" 
+    ON ingest_jobs FOR SELECT 
+    USING (auth.uid() = user_id);
+
 -- =====================================================
 -- TABLE 3: contact_messages
 -- =====================================================
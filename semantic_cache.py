@@ -0,0 +1,184 @@
+"""
+Semantic Question Cache
+Per-dataset similarity index over previously answered questions so
+paraphrases ("total sales by region" / "sum of sales per region") can reuse
+the SQL generated for an earlier question instead of calling the LLM.
+
+Vectors are built locally on the CPU from hashed word and character n-grams;
+no external embedding service is involved. Only the SQL is reused - it is
+still executed against the data, so answers stay fresh.
+
+Similar vectors are not enough: "customers who are active" and "... who are
+inactive" score above 0.9. A match also needs the same meaningful tokens in
+the same order (after synonym mapping) and the same literals; negation and
+comparison words always count as meaningful, and order keeps "sales by
+region" apart from "region by sales".
+"""
+import re
+import threading
+import zlib
+from collections import deque
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+from answer_cache import normalize_question
+from cache import LRUCache
+
+# numpy is imported where vectors are built, not when the app starts
+if TYPE_CHECKING:
+    import numpy as np
+
+# Words that carry no meaning for SQL generation
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "to", "is", "are", "was", "were",
+    "what", "which", "show", "me", "give", "list", "find", "get", "tell", "please",
+    "do", "does", "i", "we", "my", "our", "all", "and", "with", "from", "there",
+    "how",
+}
+
+# Words that flip or bound a question's meaning; never treated as stopwords.
+# Prefixed forms ("inactive", "unpaid") stay distinct tokens from their stems.
+MEANING_WORDS = {
+    "not", "no", "non", "never", "without", "except", "excluding", "nor", "none",
+    "before", "after", "since", "until", "between", "during",
+    "more", "less", "fewer", "greater", "than", "above", "below", "over", "under",
+    "at", "least", "most", "older", "newer", "earlier", "later", "higher", "lower",
+    "first", "last", "latest", "oldest", "newest", "ascending", "descending",
+}
+
+# Common paraphrases mapped onto one canonical token
+SYNONYMS = {
+    "sum": "total", "totals": "total", "overall": "total",
+    "per": "by", "each": "by", "across": "by", "grouped": "by",
+    "avg": "average", "mean": "average",
+    "number": "count", "many": "count",
+    "biggest": "max", "largest": "max", "highest": "max", "maximum": "max", "top": "max",
+    "smallest": "min", "lowest": "min", "minimum": "min",
+    "distinct": "unique", "different": "unique",
+}
+
+_WORD = re.compile(r"[a-z0-9_]+")
+# Literals that change the meaning of otherwise identical questions
+_LITERAL = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+
+def _tokens(question: str) -> list:
+    words = _WORD.findall(normalize_question(question).lower())
+    return [
+        SYNONYMS.get(word, word) for word in words
+        if word in MEANING_WORDS or word not in STOPWORDS
+    ]
+
+
+def _token_sequence(question: str) -> tuple:
+    return tuple(_tokens(question))
+
+
+def _literals(question: str) -> frozenset:
+    return frozenset(_LITERAL.findall(normalize_question(question)))
+
+
+def _feature_index(feature: str, dim: int) -> tuple:
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest % dim, 1.0 if (digest >> 31) & 1 else -1.0
+
+
+def embed_question(question: str, dim: int = 1024) -> "np.ndarray":
+    """
+    Hashed n-gram embedding of a question (L2-normalized)
+
+    Features are word unigrams, word bigrams and character trigrams of each
+    word, hashed into a fixed-size signed vector (the "hashing trick").
+    """
+    import numpy as np
+
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = _tokens(question)
+    features = list(tokens)
+    features += [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"#{token}#"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    for feature in features:
+        # Word-level features weigh more than character fragments
+        weight = 0.5 if feature.startswith("c:") else 1.0
+        index, sign = _feature_index(feature, dim)
+        vector[index] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticMatch(NamedTuple):
+    question: str
+    sql: str
+    score: float
+
+
+class SemanticQuestionIndex:
+    """
+    Per-dataset index of (question vector, SQL) pairs
+
+    Args:
+        threshold: Minimum cosine similarity for SQL reuse
+        max_questions: Questions remembered per dataset (oldest dropped first)
+        max_datasets: Datasets indexed per worker (LRU)
+        dim: Embedding dimension
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_questions: int = 256,
+        max_datasets: int = 512,
+        dim: int = 1024
+    ):
+        self.threshold = threshold
+        self.max_questions = max_questions
+        self.dim = dim
+        self._datasets = LRUCache(maxsize=max_datasets)
+        self._lock = threading.Lock()
+
+    def add(self, dataset_id: str, question: str, sql: str) -> None:
+        """Remember the SQL that successfully answered a question"""
+        entry = (embed_question(question, self.dim), (_literals(question), _token_sequence(question)), question, sql)
+        with self._lock:
+            entries = self._datasets.get(dataset_id)
+            if entries is None:
+                entries = deque(maxlen=self.max_questions)
+                self._datasets.set(dataset_id, entries)
+            entries.append(entry)
+
+    def find(self, dataset_id: str, question: str) -> Optional[SemanticMatch]:
+        """Return the most similar earlier question above threshold, if any"""
+        with self._lock:
+            entries = self._datasets.get(dataset_id)
+            if not entries:
+                return None
+            entries = list(entries)
+
+        # Only questions with the same literals and meaningful words, in order, can match
+        key = (_literals(question), _token_sequence(question))
+        candidates = [entry for entry in entries if entry[1] == key]
+        if not candidates:
+            return None
+
+        import numpy as np
+
+        query = embed_question(question, self.dim)
+        scores = np.stack([entry[0] for entry in candidates]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        _, _, matched_question, sql = candidates[best]
+        return SemanticMatch(matched_question, sql, round(float(scores[best]), 4))
+
+    def discard(self, dataset_id: str, sql: str) -> None:
+        """Forget every entry that produced the given SQL (e.g. after it failed)"""
+        with self._lock:
+            entries = self._datasets.get(dataset_id)
+            if entries:
+                kept = [entry for entry in entries if entry[3] != sql]
+                entries.clear()
+                entries.extend(kept)
+
+    def invalidate_dataset(self, dataset_id: str) -> None:
+        self._datasets.pop(dataset_id)
@@ -0,0 +1,213 @@
+"""
+Tenant SQL Rewriting
+Parses generated SQL, rejects anything that is not a single read-only query
+and scopes every table reference to the requesting user.
+
+Each table reference `t [AS a]` becomes
+`(SELECT * FROM t WHERE user_id = :user_id) AS a`, which PostgreSQL inlines,
+so the predicate reaches the user_id index even inside subqueries, CTEs,
+joins and UNIONs. The user id is a bind parameter, which keeps the rewritten
+SQL the same for every user and lets rewrites be memoized by normalized text.
+
+Only plain tables (and whitelisted generators such as generate_series) may
+appear as sources: table functions like read_csv() or dblink() would read
+data that is neither tenant-scoped nor checked against allowed_tables.
+Functions with side effects (set_config, pg_sleep, nextval, ...) are
+rejected anywhere in the query.
+Reference: https://sqlglot.com/sqlglot.html
+"""
+import re
+from typing import NamedTuple, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from cache import LRUCache
+
+USER_ID_PARAM = "user_id"
+
+# Statements and clauses that write data, change schema or take locks
+_FORBIDDEN_NODES = tuple(
+    node for node in (
+        getattr(exp, name, None) for name in (
+            "Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "AlterTable",
+            "TruncateTable", "Command", "Into", "Lock", "Copy", "Set", "Transaction",
+            "Commit", "Rollback", "Grant",
+        )
+    )
+    if node is not None
+)
+
+# Table functions allowed in FROM/JOIN; they generate rows without reading data
+_TABLE_FUNCTIONS = {"generate_series", "exploding_generate_series", "unnest"}
+
+# Functions that change state, sleep, or read files, other databases or
+# arbitrary SQL text; matched by name or name prefix (lowercased)
+_FORBIDDEN_FUNCTIONS = {
+    "set_config", "nextval", "setval", "currval", "lastval", "txid_current",
+    "query_to_xml", "query_to_xml_and_xmlschema", "query_to_xmlschema",
+    "cursor_to_xml", "cursor_to_xmlschema", "table_to_xml", "table_to_xml_and_xmlschema",
+    "schema_to_xml", "database_to_xml", "load_extension", "readfile", "writefile",
+    "glob", "getenv",
+}
+_FORBIDDEN_FUNCTION_PREFIXES = ("pg_", "lo_", "dblink", "read_", "copy_", "sqlite_")
+
+# Dialect names used by SQLAlchemy mapped onto sqlglot dialects
+SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite"}
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class UnsafeSQLError(ValueError):
+    """Raised for SQL that must not be executed for a user"""
+
+
+class RewrittenSQL(NamedTuple):
+    sql: str  # Rewritten SQL with a :user_id bind parameter
+    tables: frozenset  # Lowercased names of the tables it reads
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside string literals and drop a trailing semicolon"""
+    parts = _QUOTED.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if index % 2 else _WHITESPACE.sub(" ", part)
+        for index, part in enumerate(parts)
+    )
+
+
+def _scoped_table(table: exp.Table) -> exp.Expression:
+    source = exp.Table(this=table.this.copy(), db=table.args.get("db"), catalog=table.args.get("catalog"))
+    predicate = exp.EQ(this=exp.column(USER_ID_PARAM), expression=exp.Placeholder(this=USER_ID_PARAM))
+    return exp.select("*").from_(source).where(predicate).subquery(table.alias_or_name)
+
+
+def _function_name(node: exp.Func) -> str:
+    return (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+
+
+def _is_forbidden_function(name: str) -> bool:
+    return name in _FORBIDDEN_FUNCTIONS or name.startswith(_FORBIDDEN_FUNCTION_PREFIXES)
+
+
+def _cte_names(with_: exp.With, before: Optional[exp.CTE] = None) -> set:
+    names = set()
+    for cte in with_.expressions:
+        if cte is before and not with_.args.get("recursive"):
+            break  # a non-recursive CTE sees only the CTEs declared before it
+        names.add(cte.alias_or_name.lower())
+        if cte is before:
+            break
+    return names
+
+
+def _is_cte_reference(table: exp.Table) -> bool:
+    """Whether table names a CTE visible where it appears (walking outward through enclosing queries)"""
+    if table.db:
+        return False
+    name = table.name.lower()
+    child, node = table, table.parent
+    while node is not None:
+        if isinstance(node, exp.With):
+            # child is one of its CTEs: only earlier CTEs are in scope; skip the
+            # query that owns this WITH so its full CTE list is not consulted
+            if isinstance(child, exp.CTE) and name in _cte_names(node, child):
+                return True
+            child = node.parent
+            node = child.parent
+            continue
+        with_ = node.args.get("with")
+        if isinstance(with_, exp.With) and with_ is not child and name in _cte_names(with_):
+            return True
+        child, node = node, node.parent
+    return False
+
+
+def rewrite_tenant_sql(sql: str, dialect: str = "postgres") -> RewrittenSQL:
+    """
+    Validate generated SQL and add the user_id predicate to every table it reads
+
+    Args:
+        sql: SQL produced by the LLM (or reused from an earlier question)
+        dialect: sqlglot dialect used to parse and print the SQL
+
+    Returns:
+        RewrittenSQL with the scoped SQL and the tables it references
+
+    Raises:
+        UnsafeSQLError: If the SQL cannot be parsed, contains more than one
+                        statement, is not a read-only query, reads from a
+                        table function or calls a forbidden function
+    """
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read=dialect) if statement is not None]
+    except SqlglotError as e:
+        raise UnsafeSQLError(f"Could not parse SQL: {str(e).splitlines()[0]}") from e
+
+    if len(statements) != 1:
+        raise UnsafeSQLError("Exactly one SQL statement is allowed")
+    tree = statements[0]
+    if not isinstance(tree, exp.Query) or tree.find(*_FORBIDDEN_NODES):
+        raise UnsafeSQLError("Only SELECT queries are allowed")
+    for function in tree.find_all(exp.Func):
+        name = _function_name(function)
+        if _is_forbidden_function(name):
+            raise UnsafeSQLError(f"Function {name}() is not allowed")
+
+    tables = set()
+    for table in list(tree.find_all(exp.Table)):
+        if not isinstance(table.this, exp.Identifier):
+            if isinstance(table.this, exp.Func) and _function_name(table.this) in _TABLE_FUNCTIONS:
+                continue  # row generators such as generate_series()
+            raise UnsafeSQLError("Only tables can be queried, not table functions")
+        if _is_cte_reference(table):
+            continue  # already scoped where the CTE reads its tables
+        tables.add(table.name.lower())
+        table.replace(_scoped_table(table))
+
+    return RewrittenSQL(tree.sql(dialect=dialect), frozenset(tables))
+
+
+class SQLRewriteCache:
+    """
+    Memoizes rewrite_tenant_sql() by normalized SQL text
+
+    Rejections are cached too, so repeated unsafe SQL is not re-parsed.
+
+    Args:
+        maxsize: Number of distinct SQL texts remembered
+        dialect: sqlglot dialect used to parse and print the SQL
+    """
+
+    def __init__(self, maxsize: int = 2048, dialect: str = "postgres"):
+        self.dialect = dialect
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def rewrite(self, sql: str, allowed_tables: Optional[set] = None) -> RewrittenSQL:
+        """
+        Rewritten SQL for any user (bind USER_ID_PARAM when executing)
+
+        Raises:
+            UnsafeSQLError: If the SQL is rejected or reads a table outside allowed_tables
+        """
+        key = normalize_sql(sql)
+        outcome = self._cache.get(key)
+        if outcome is None:
+            try:
+                outcome = rewrite_tenant_sql(key, self.dialect)
+            except UnsafeSQLError as e:
+                outcome = str(e)
+            self._cache.set(key, outcome)
+        if isinstance(outcome, str):
+            raise UnsafeSQLError(outcome)
+
+        if allowed_tables is not None:
+            unknown = outcome.tables - {name.lower() for name in allowed_tables}
+            if unknown:
+                raise UnsafeSQLError(f"Query references tables outside this dataset: {', '.join(sorted(unknown))}")
+        return outcome
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -1,9 +1,12 @@
 """
 Supabase Backend Configuration
 Initializes Supabase client for backend operations with service role key
+
+The client is created on first use: importing the supabase package takes
+about half a second, which would otherwise be paid by every worker start.
 """
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,17 +15,51 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+# RS256/ES256 projects verify tokens with the JWKS instead of the shared
+# secret (see backend_auth.py); the URL defaults to the project's endpoint
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else ""
+)
+SUPABASE_JWKS_FILE = os.getenv("SUPABASE_JWKS_FILE") or None
 
 # Validate environment variables
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY or not SUPABASE_JWT_SECRET:
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise ValueError(
         "Missing required Supabase environment variables. "
-        "Please set SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, and SUPABASE_JWT_SECRET in your .env file"
+        "Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in your .env file"
+    )
+if not SUPABASE_JWT_SECRET and not (SUPABASE_JWKS_URL or SUPABASE_JWKS_FILE):
+    raise ValueError(
+        "Missing JWT verification settings. Please set SUPABASE_JWT_SECRET (HS256) "
+        "and/or SUPABASE_JWKS_URL / SUPABASE_JWKS_FILE (RS256/ES256) in your .env file"
     )
 
+
+class LazySupabaseClient:
+    """Stands in for the supabase Client, creating it on first attribute access"""
+
+    def __init__(self, url: str, key: str):
+        self._url = url
+        self._key = key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(self._url, self._key)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get_client(), name)
+
+
 # Initialize Supabase client with service role key for backend operations
 # Reference: https://supabase.com/docs/reference/python/initializing
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase = LazySupabaseClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # Storage bucket name for user CSV files
 STORAGE_BUCKET_NAME = "user-datasets"
@@ -0,0 +1,15 @@
+from answer_cache import AnswerCache, normalize_question
+
+
+def test_normalization_folds_case_outside_quotes_only():
+    assert normalize_question("  Total   Sales? ") == "total sales"
+    assert normalize_question("What's the MAX price?") == "what's the max price"
+    assert normalize_question("Orders for 'Bob'?") == "orders for 'Bob'"
+    assert normalize_question('Sales in "New  York"') == 'sales in "New  York"'
+
+
+def test_quoted_literals_differing_in_case_do_not_share_an_answer():
+    cache = AnswerCache()
+    cache.set("d", "orders for 'Bob'", {"answer": "3"})
+    assert cache.get("d", "Orders for 'Bob'?") == {"answer": "3"}
+    assert cache.get("d", "orders for 'bob'") is None
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("duckdb")
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+from columnar_engine import LocalEngineError, LocalQueryEngine, SnapshotCache
+
+
+@pytest.fixture
+def engine(tmp_path):
+    cache = SnapshotCache(str(tmp_path / "snapshots"), 1024 * 1024 * 1024)
+    for key, owner in (("t_alice", "alice"), ("t_bob", "bob")):
+        staging = cache.staging_path(key)
+        pq.write_table(pa.table({"id": [1, 2], "user_id": [owner, owner], "price": [7, 2]}), staging)
+        cache.put(key, staging)
+    return LocalQueryEngine(cache, threads=1)
+
+
+def test_queries_run_on_the_registered_snapshot(engine):
+    result = engine.execute_guarded(
+        "t_alice", None, "SELECT SUM(price) / 2 FROM t_alice WHERE user_id = $user_id", {"user_id": "alice"}
+    )
+    assert result["rows"] == [(4,)]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_parquet('{directory}/*.parquet')",
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM glob('{directory}/*')",
+    "SELECT * FROM '{directory}/t_bob.parquet'",
+])
+def test_table_functions_cannot_read_files(engine, sql):
+    with pytest.raises(LocalEngineError):
+        engine.execute_guarded("t_alice", None, sql.format(directory=engine.snapshots.directory))
+
+
+def test_configuration_is_locked(engine):
+    import duckdb
+
+    with pytest.raises(duckdb.Error):
+        engine._db.cursor().execute("SET enable_external_access = true")
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, text
+
+from ingest import MIN_CHUNK_ROWS, ingest_csv_file, replace_dataset_table
+
+
+def test_widening_to_text_keeps_the_original_values(tmp_path):
+    # The first chunk looks boolean/date/integer; the second needs text
+    rows = ["flag,day,code"]
+    rows += [f"{'t' if i % 2 else 'f'},2024-01-0{i % 9 + 1},00{i % 7}" for i in range(MIN_CHUNK_ROWS)]
+    rows += ["maybe,soon,abc"] * 10
+    path = tmp_path / "data.csv"
+    path.write_text("\n".join(rows) + "\n")
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    result = ingest_csv_file(engine, str(path), "t_data", "user-1", memory_budget_bytes=1)
+
+    assert result["row_count"] == MIN_CHUNK_ROWS + 10
+    with engine.connect() as conn:
+        first = conn.execute(text("SELECT flag, day, code FROM t_data ORDER BY id LIMIT 2")).all()
+        count = conn.execute(text("SELECT COUNT(*) FROM t_data")).scalar()
+    assert [tuple(row) for row in first] == [("f", "2024-01-01", "000"), ("t", "2024-01-02", "001")]
+    assert count == MIN_CHUNK_ROWS + 10
+
+
+def test_replacing_a_table_swaps_in_the_staging_rows(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a\n1\n2\n")
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    ingest_csv_file(engine, str(path), "t_data", "user-1")
+
+    for staging_name in ("reload_1", "reload_2"):  # a second swap must not collide with the first
+        path.write_text("a\n1\n2\n3\n")
+        ingest_csv_file(engine, str(path), staging_name, "user-1")
+        replace_dataset_table(engine, staging_name, "t_data")
+
+    with engine.connect() as conn:
+        tables = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars().all()
+        indexes = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+        count = conn.execute(text("SELECT COUNT(*) FROM t_data")).scalar()
+    assert tables == ["t_data"]
+    assert indexes == ["ix_t_data_user_id"]
+    assert count == 3
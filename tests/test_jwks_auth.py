@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-key")
+os.environ.setdefault("SUPABASE_JWKS_URL", "")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret")
+
+import backend_auth
+from jwks import JWKSKeyStore
+
+CLAIMS = {"sub": "user-1", "email": "user@example.com", "aud": "authenticated"}
+
+
+def make_rsa_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private_key, jwk
+
+
+def sign(private_key, kid, **claims):
+    payload = {**CLAIMS, "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def write_jwks(path, *jwks):
+    path.write_text(json.dumps({"keys": list(jwks)}))
+
+
+@pytest.fixture
+def keys(tmp_path, monkeypatch):
+    """A JWKS-only deployment: key-1 in the local cache file, key-2 only at the JWKS URL"""
+    key_1, jwk_1 = make_rsa_key("key-1")
+    key_2, jwk_2 = make_rsa_key("key-2")
+    cache_file = tmp_path / "jwks_cache.json"
+    remote = tmp_path / "remote_jwks.json"
+    write_jwks(cache_file, jwk_1)
+    write_jwks(remote, jwk_1, jwk_2)
+
+    store = JWKSKeyStore(
+        url=remote.as_uri(), cache_file=str(cache_file), refresh_seconds=3600, min_refresh_seconds=0
+    )
+    store.start(fetch_in_background=True)
+    monkeypatch.setattr(backend_auth, "jwks_store", store)
+    monkeypatch.setattr(backend_auth, "SUPABASE_JWT_SECRET", None)
+    return {"key-1": key_1, "key-2": key_2, "store": store, "cache_file": cache_file}
+
+
+def test_token_signed_with_cached_key_is_accepted(keys):
+    payload = backend_auth.verify_supabase_jwt(sign(keys["key-1"], "key-1"))
+    assert payload["sub"] == "user-1"
+
+
+def test_unknown_kid_triggers_a_refresh(keys):
+    token = sign(keys["key-2"], "key-2")
+    with pytest.raises(HTTPException):
+        backend_auth.verify_supabase_jwt(token)  # not cached yet; wakes the refresher
+
+    deadline = time.monotonic() + 5
+    while keys["store"].get_key("key-2") is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert backend_auth.verify_supabase_jwt(token)["sub"] == "user-1"
+    # The refreshed JWKS is saved for the next start
+    assert [key["kid"] for key in json.loads(keys["cache_file"].read_text())["keys"]] == ["key-1", "key-2"]
+
+
+def test_hs256_token_with_rs_kid_is_rejected(keys):
+    # Without a shared secret, HS256 is never accepted
+    token = jwt.encode({**CLAIMS, "exp": int(time.time()) + 300}, "guess", algorithm="HS256",
+                       headers={"kid": "key-1"})
+    with pytest.raises(HTTPException) as error:
+        backend_auth.verify_supabase_jwt(token)
+    assert error.value.status_code == 401
+
+
+def test_hs256_token_keyed_with_the_public_key_is_rejected(keys, monkeypatch):
+    # Algorithm confusion: HMAC over the RSA public key, presenting the RS kid
+    monkeypatch.setattr(backend_auth, "SUPABASE_JWT_SECRET", "test-secret")
+    public_pem = keys["key-1"].public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    header = {"alg": "HS256", "kid": "key-1", "typ": "JWT"}
+    signing_input = jwt.utils.base64url_encode(json.dumps(header).encode()) + b"." + \
+        jwt.utils.base64url_encode(json.dumps({**CLAIMS, "exp": int(time.time()) + 300}).encode())
+    signature = jwt.algorithms.HMACAlgorithm(jwt.algorithms.HMACAlgorithm.SHA256).sign(signing_input, public_pem)
+    token = (signing_input + b"." + jwt.utils.base64url_encode(signature)).decode()
+    with pytest.raises(HTTPException):
+        backend_auth.verify_supabase_jwt(token)
@@ -0,0 +1,46 @@
+import pytest
+
+from semantic_cache import SemanticQuestionIndex
+
+SQL = "SELECT 1"
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("show me customers who are active", "show me customers who are inactive"),
+    ("list employees hired after january", "list employees hired before january"),
+    ("products with more than 10 orders", "products with less than 10 orders"),
+    ("orders that are paid", "orders that are unpaid"),
+    ("customers with email", "customers without email"),
+    ("customers who are active", "customers who are not active"),
+    ("sales by region", "region by sales"),
+    ("customers per product", "products per customer"),
+    ("count of orders by customer", "count of customers by order"),
+])
+def test_opposite_questions_do_not_match(cached, asked):
+    index = SemanticQuestionIndex()
+    index.add("d", cached, SQL)
+    assert index.find("d", asked) is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("total sales by region", "sum of sales per region"),
+    ("What is the average price?", "mean price"),
+])
+def test_paraphrases_match(cached, asked):
+    index = SemanticQuestionIndex()
+    index.add("d", cached, SQL)
+    match = index.find("d", asked)
+    assert match is not None and match.sql == SQL
+
+
+def test_different_literals_do_not_match():
+    index = SemanticQuestionIndex()
+    index.add("d", "orders above 100", SQL)
+    assert index.find("d", "orders above 200") is None
+
+
+def test_literals_differing_in_case_do_not_match():
+    index = SemanticQuestionIndex()
+    index.add("d", "orders for customer 'Bob'", SQL)
+    assert index.find("d", "orders for customer 'bob'") is None
+    assert index.find("d", "Orders for customer 'Bob'?") is not None
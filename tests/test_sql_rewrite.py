@@ -0,0 +1,53 @@
+import pytest
+
+from sql_rewrite import SQLRewriteCache, UnsafeSQLError, rewrite_tenant_sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_parquet('/tmp/snapshots/*.parquet')",
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM t JOIN dblink('host=x', 'SELECT 1') AS d(a int) ON true",
+    "SELECT * FROM json_each('{}')",
+    "SELECT * FROM (SELECT * FROM read_csv_auto('x')) s",
+    "SELECT set_config('statement_timeout', '0', false)",
+    "SELECT pg_sleep(10) FROM t",
+    "SELECT nextval('seq') FROM t",
+    "SELECT query_to_xml('SELECT * FROM other', true, true, '')",
+])
+def test_table_and_side_effect_functions_are_rejected(sql):
+    with pytest.raises(UnsafeSQLError):
+        rewrite_tenant_sql(sql)
+
+
+def test_allowed_generators_and_tables_are_scoped():
+    rewritten = rewrite_tenant_sql("SELECT t.a, g FROM t, generate_series(1, 3) AS g")
+    assert rewritten.tables == frozenset({"t"})
+    assert "user_id = :user_id" in rewritten.sql
+
+
+def test_tables_outside_the_allow_list_are_rejected():
+    rewriter = SQLRewriteCache()
+    rewriter.rewrite("SELECT COUNT(*) FROM t_alice", {"t_alice"})
+    with pytest.raises(UnsafeSQLError):
+        rewriter.rewrite("SELECT COUNT(*) FROM t_bob", {"t_alice"})
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM (WITH user_datasets AS (SELECT 1) SELECT 1) s, user_datasets", {"user_datasets"}),
+    ("SELECT a FROM t_alice UNION SELECT a FROM (WITH t_bob AS (SELECT 1 AS a) SELECT a FROM t_bob) x "
+     "UNION SELECT a FROM t_bob", {"t_alice", "t_bob"}),
+    ("WITH t_bob AS (SELECT * FROM t_bob) SELECT * FROM t_bob", {"t_bob"}),
+])
+def test_cte_names_only_shadow_tables_in_their_own_scope(sql, tables):
+    rewritten = rewrite_tenant_sql(sql)
+    assert rewritten.tables == frozenset(tables)
+    with pytest.raises(UnsafeSQLError):
+        SQLRewriteCache().rewrite(sql, {"t_alice"})
+
+
+def test_cte_references_are_not_scoped_again():
+    rewritten = rewrite_tenant_sql(
+        "WITH a AS (SELECT * FROM t), b AS (SELECT * FROM a) SELECT * FROM b UNION SELECT * FROM (SELECT * FROM a) s"
+    )
+    assert rewritten.tables == frozenset({"t"})
+    assert rewritten.sql.count("user_id = :user_id") == 1
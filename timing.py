@@ -0,0 +1,184 @@
+"""
+Request Stage Timing
+Measures where request time goes (auth, metadata lookup, LLM call, SQL,
+upload parsing/loading, ...) and exposes it two ways: a Server-Timing header
+on every response and Prometheus histograms for /metrics.
+
+Code marks a stage with `with stage("llm"): ...`. Within a request the time
+of each stage is summed (a stage may run per chunk, or on a worker thread -
+run_blocking copies the request context) and observed once per request when
+the response is sent. Work outside a request (e.g. a background upload) can
+group its stages the same way with collect_stages().
+Reference: https://www.w3.org/TR/server-timing/
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Stage -> seconds for the request (or collect_stages() block) being handled
+_stage_totals: contextvars.ContextVar = contextvars.ContextVar("stage_totals", default=None)
+_totals_lock = threading.Lock()
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with a fixed label set
+
+    Args:
+        name: Metric name
+        description: HELP text
+        label_names: Names of the labels every observation carries
+        buckets: Upper bounds of the buckets in seconds (+Inf is implied)
+    """
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                bucket_labels = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "request_stage_seconds", "Time spent in each stage of a request or background job", ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response starts, by endpoint",
+    ("handler", "method", "status")
+)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add time spent in a stage to the current request (or observe it directly outside one)"""
+    totals = _stage_totals.get()
+    if totals is None:
+        STAGE_SECONDS.observe((name,), seconds)
+        return
+    with _totals_lock:
+        totals[name] = totals.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def timed_iter(iterable: Iterable, name: str) -> Iterator:
+    """Yield from iterable, timing the work of producing each item (e.g. parsing) as stage name"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record_stage(name, time.perf_counter() - started)
+            return
+        record_stage(name, time.perf_counter() - started)
+        yield item
+
+
+def _observe_totals(totals: Dict[str, float]) -> None:
+    for name, seconds in totals.items():
+        STAGE_SECONDS.observe((name,), seconds)
+
+
+@contextmanager
+def collect_stages():
+    """Sum the stages of the enclosed work and observe each total once at the end"""
+    totals = {}
+    token = _stage_totals.set(totals)
+    try:
+        yield totals
+    finally:
+        _stage_totals.reset(token)
+        _observe_totals(totals)
+
+
+def server_timing_header(totals: Dict[str, float], total_seconds: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects the stages of each HTTP request, adds a
+    Server-Timing header to its response and observes the histograms
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        totals = {}
+        token = _stage_totals.set(totals)
+        status = 500
+        elapsed = None
+
+        async def send_with_timing(message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                with _totals_lock:
+                    header = server_timing_header(totals, elapsed)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stage_totals.reset(token)
+            _observe_totals(totals)
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.observe(
+                (handler, scope["method"], str(status)),
+                elapsed if elapsed is not None else time.perf_counter() - started
+            )
+
+
+def render_metrics() -> str:
+    """All timing histograms in the Prometheus text exposition format"""
+    return STAGE_SECONDS.render() + REQUEST_SECONDS.render()
@@ -0,0 +1,147 @@
+"""
+Column Type Inference
+Picks the narrowest correct PostgreSQL type for each CSV column: smallint /
+integer / bigint / numeric, double precision, boolean, date, timestamp or
+text. Inference is vectorized over the parsed DataFrame; text columns are
+only fully parsed as dates after a small sample looks like dates.
+
+Types are inferred per chunk and only ever widen (see widen_kind), so a
+streamed upload ends with types that fit every chunk.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    BigInteger, Boolean, Date, DateTime, Float, Integer, Numeric, SmallInteger, String
+)
+
+# Kind -> SQLAlchemy type. "null" is a placeholder for columns that have had
+# no values yet; it is created as text and replaced by the first real kind.
+SQL_TYPES = {
+    "null": String,
+    "boolean": Boolean,
+    "smallint": SmallInteger,
+    "integer": Integer,
+    "bigint": BigInteger,
+    "numeric": Numeric,
+    "float": Float,
+    "date": Date,
+    "timestamp": DateTime,
+    "text": String,
+}
+
+# Integer kinds in widening order, with the value range each can hold
+INTEGER_KINDS = ["smallint", "integer", "bigint", "numeric"]
+INTEGER_RANGES = {
+    "smallint": (-2 ** 15, 2 ** 15 - 1),
+    "integer": (-2 ** 31, 2 ** 31 - 1),
+    "bigint": (-2 ** 63, 2 ** 63 - 1),
+}
+NUMERIC_KINDS = INTEGER_KINDS + ["float"]
+
+BOOLEAN_STRINGS = {"true": True, "false": False, "t": True, "f": False, "yes": True, "no": False}
+
+# Values checked before a whole text column is parsed as dates
+DATE_SAMPLE_ROWS = 100
+
+# Floats above this can't be checked for being whole numbers exactly
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def _integer_kind(low, high) -> str:
+    for kind in ("smallint", "integer", "bigint"):
+        lower, upper = INTEGER_RANGES[kind]
+        if lower <= low and high <= upper:
+            return kind
+    return "numeric"
+
+
+def _parse_datetimes(values: pd.Series) -> pd.Series:
+    """ISO 8601 strings -> naive UTC timestamps (NaT where a value doesn't parse)"""
+    parsed = pd.to_datetime(values, format="ISO8601", errors="coerce", utc=True)
+    return parsed.dt.tz_localize(None)
+
+
+def _text_kind(values: pd.Series) -> str:
+    text = values.astype(str).str.strip()
+    if text.str.lower().isin(BOOLEAN_STRINGS).all():
+        return "boolean"
+    if text.str.fullmatch(r"[+-]?\d+").all():
+        return "numeric"  # whole numbers beyond the int64 range pandas can parse
+
+    if _parse_datetimes(text.head(DATE_SAMPLE_ROWS)).isna().any():
+        return "text"
+    parsed = _parse_datetimes(text)
+    if parsed.isna().any():
+        return "text"
+    if text.str.len().max() <= 10 and (parsed == parsed.dt.normalize()).all():
+        return "date"
+    return "timestamp"
+
+
+def infer_column_kind(series: pd.Series) -> str:
+    """
+    Narrowest kind that holds every non-null value of a column
+
+    Floats that are all whole numbers (integer columns with missing values
+    are parsed as float64) are treated as integers.
+    """
+    values = series.dropna()
+    if values.empty:
+        return "null"
+
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return _integer_kind(values.min(), values.max())
+    if pd.api.types.is_float_dtype(dtype):
+        if np.isfinite(values).all() and values.abs().max() < _MAX_EXACT_FLOAT \
+                and (values == np.floor(values)).all():
+            return _integer_kind(values.min(), values.max())
+        return "float"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "timestamp"
+    return _text_kind(values)
+
+
+def infer_column_kinds(df: pd.DataFrame) -> List[str]:
+    """infer_column_kind() for every column, in column order"""
+    return [infer_column_kind(df.iloc[:, position]) for position in range(df.shape[1])]
+
+
+def widen_kind(current: str, new: str) -> str:
+    """Smallest kind that holds values of both kinds"""
+    if current == new or new == "null":
+        return current
+    if current == "null":
+        return new
+    if current in INTEGER_KINDS and new in INTEGER_KINDS:
+        return max(current, new, key=INTEGER_KINDS.index)
+    if current in NUMERIC_KINDS and new in NUMERIC_KINDS:
+        return "numeric" if "numeric" in (current, new) else "float"
+    if {current, new} == {"date", "timestamp"}:
+        return "timestamp"
+    return "text"
+
+
+def coerce_frame(df: pd.DataFrame, kinds: List[str]) -> pd.DataFrame:
+    """
+    Convert parsed values to the representation their column kind is loaded as
+
+    Whole-number floats become nullable integers, boolean strings become
+    booleans and ISO 8601 strings become timestamps. Columns are replaced in
+    place; others are left untouched.
+    """
+    for position, kind in enumerate(kinds):
+        series = df.iloc[:, position]
+        dtype = series.dtype
+        if kind in INTEGER_RANGES and pd.api.types.is_float_dtype(dtype):
+            df.isetitem(position, series.astype("Int64"))
+        elif kind == "boolean" and dtype == object:
+            lowered = series.astype(str).str.strip().str.lower()
+            df.isetitem(position, lowered.map(BOOLEAN_STRINGS).where(series.notna()).astype("boolean"))
+        elif kind in ("date", "timestamp") and dtype == object:
+            df.isetitem(position, _parse_datetimes(series))
+    return df